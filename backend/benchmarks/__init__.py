@@ -0,0 +1,9 @@
+"""
+Offline microbenchmarks of the code on every request's path.
+
+    python -m benchmarks                 # run and print
+    python -m benchmarks save            # run and store benchmarks/baseline.json
+    python -m benchmarks compare         # run and flag regressions vs the baseline
+
+Run from `backend/`. No database or network is needed.
+"""
@@ -0,0 +1,77 @@
+import argparse
+import os
+from pathlib import Path
+import sys
+
+BENCHMARKS_DIR = Path(__file__).parent
+DEFAULT_BASELINE = BENCHMARKS_DIR / "baseline.json"
+
+# `src.core.env` requires these; fixed values keep runs comparable and offline
+os.environ.setdefault("DB_USERNAME", "bench")
+os.environ.setdefault("DB_PASSWORD", "bench")
+os.environ.setdefault("DB_DATABASE", "bench")
+os.environ.setdefault("BACKEND_SECRET_KEY", "bench-secret")
+os.environ.setdefault("GLOBAL_LOG_LEVEL", "WARNING")
+sys.path.insert(0, str(BENCHMARKS_DIR.parent))
+
+from .harness import (  # noqa: E402
+    CASES,
+    compare,
+    environment,
+    has_regressions,
+    load_baseline,
+    print_comparisons,
+    run,
+    save_baseline,
+)
+from . import cases  # noqa: E402, F401
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "save", "compare"])
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("-k", "--filter", default=None, help="only run cases containing this")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.15,
+        help="slowdown ratio flagged as a regression (0.15 = 15%% slower)",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(CASES, args.repeat, args.filter)
+    medians = {name: result.median_us for name, result in results.items()}
+
+    if args.command == "save":
+        save_baseline(
+            args.baseline,
+            {name: result._asdict() for name, result in results.items()},
+            meta={"repeat": args.repeat, "bcrypt_rounds": cases.bcrypt_rounds()},
+        )
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if args.command == "compare":
+        baseline = load_baseline(args.baseline)
+        if baseline["environment"] != environment():
+            print(
+                f"Baseline recorded on {baseline['environment']}: times from "
+                "another machine or Python are only a rough guide, save your own",
+                file=sys.stderr,
+            )
+        before = {name: r["median_us"] for name, r in baseline["results"].items()}
+        if args.filter:
+            before = {name: v for name, v in before.items() if args.filter in name}
+        comparisons = compare(before, medians, args.threshold)
+        print_comparisons(comparisons, "us per call, median")
+        return 1 if has_regressions(comparisons) else 0
+
+    for name, result in results.items():
+        print(f"{name:<40} {result.median_us:12.2f} us  (min {result.min_us:.2f}, {result.loops} loops)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
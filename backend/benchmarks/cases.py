@@ -0,0 +1,125 @@
+from datetime import timedelta
+import time
+
+from .harness import benchmark
+
+NOW = int(time.time())
+
+USER = {
+    "id": "0b6c8f43-4a9c-4d3e-9f3a-0d4d5c1b2a77",
+    "name": "Bench User",
+    "email": "bench@example.com",
+    "role": "user",
+    "profile_image_url": "/user.png",
+    "last_active_at": NOW,
+    "updated_at": NOW,
+    "created_at": NOW,
+    "api_key": None,
+    "settings": {"ui": {"theme": "dark"}},
+    "info": None,
+}
+
+
+def bcrypt_rounds() -> int:
+    from src.common.hashing import pwd_context
+
+    return pwd_context.handler("bcrypt").default_rounds
+
+
+####################################
+# Auth
+####################################
+
+
+@benchmark("auth.create_access_token")
+def create_access_token():
+    from src.domain.auth.utils import create_access_token
+
+    data = {"id": USER["id"]}
+    expires = timedelta(hours=1)
+    return lambda: create_access_token(data, expires)
+
+
+@benchmark("auth.decode_token")
+def decode_token():
+    from src.domain.auth.utils import create_access_token, decode_token
+
+    token = create_access_token({"id": USER["id"]}, timedelta(hours=1))
+    return lambda: decode_token(token)
+
+
+@benchmark("auth.verify_password")
+def verify_password():
+    # at the configured bcrypt cost, the dominant cost of every signin
+    from src.domain.auth.utils import get_password_hash, verify_password
+
+    hashed = get_password_hash("bench-password")
+    return lambda: verify_password("bench-password", hashed)
+
+
+####################################
+# Common
+####################################
+
+
+@benchmark("misc.parse_duration")
+def parse_duration():
+    from src.common.misc import parse_duration
+
+    return lambda: parse_duration("1w2d3h4m5s")
+
+
+@benchmark("misc.validate_email_format")
+def validate_email_format():
+    from src.common.misc import validate_email_format
+
+    return lambda: validate_email_format("bench.user+tag@mail.example.com")
+
+
+####################################
+# Models
+####################################
+
+
+@benchmark("models.UserModel.model_validate")
+def user_model_validate():
+    from src.domain.user.models import UserModel
+
+    return lambda: UserModel.model_validate(USER)
+
+
+@benchmark("models.TodoModel.model_validate")
+def todo_model_validate():
+    from src.domain.todos.models import TodoModel
+
+    todo = {"id": 42, "item": "Element 1"}
+    return lambda: TodoModel.model_validate(todo)
+
+
+@benchmark("models.TodoModel.model_dump_json")
+def todo_model_dump_json():
+    from src.domain.todos.models import TodoModel
+
+    todo = TodoModel(id=42, item="Element 1")
+    return lambda: todo.model_dump_json()
+
+
+####################################
+# Config
+####################################
+
+
+@benchmark("config.AppConfig.__getattr__")
+def app_config_getattr():
+    from src.core.config import AppConfig, ENABLE_API_KEY, JWT_EXPIRES_IN
+
+    config = AppConfig()
+    config.ENABLE_API_KEY = ENABLE_API_KEY
+    config.JWT_EXPIRES_IN = JWT_EXPIRES_IN
+
+    def lookups():
+        # the lookups done by an authenticated request
+        config.ENABLE_API_KEY
+        config.JWT_EXPIRES_IN
+
+    return lookups
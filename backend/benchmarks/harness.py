@@ -0,0 +1,139 @@
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Optional
+
+
+class Case(NamedTuple):
+    name: str
+    # does the setup and returns the zero-argument callable to time
+    setup: Callable[[], Callable[[], Any]]
+
+
+CASES: list[Case] = []
+
+
+def benchmark(name: str):
+    def decorator(setup: Callable[[], Callable[[], Any]]):
+        CASES.append(Case(name, setup))
+        return setup
+
+    return decorator
+
+
+class Result(NamedTuple):
+    median_us: float
+    min_us: float
+    stdev_us: float
+    loops: int
+    repeat: int
+
+
+def measure(case: Case, repeat: int = 7) -> Result:
+    """
+    Time `case` like `timeit`: as many loops as fit in ~0.2s, `repeat` times,
+    with the garbage collector off. The median per-call time is what is compared.
+    """
+    timer = timeit.Timer(case.setup())
+    loops, _ = timer.autorange()
+    times = [t / loops * 1e6 for t in timer.repeat(repeat=repeat, number=loops)]
+    return Result(
+        median_us=statistics.median(times),
+        min_us=min(times),
+        stdev_us=statistics.stdev(times) if len(times) > 1 else 0.0,
+        loops=loops,
+        repeat=repeat,
+    )
+
+
+def run(
+    cases: list[Case], repeat: int = 7, pattern: Optional[str] = None
+) -> dict[str, Result]:
+    results = {}
+    for case in cases:
+        if pattern and pattern not in case.name:
+            continue
+        results[case.name] = measure(case, repeat)
+        print(f"  {case.name:<40} {results[case.name].median_us:12.2f} us", file=sys.stderr)
+    return results
+
+
+####################################
+# Baselines
+####################################
+
+
+def environment() -> dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "processor": platform.processor(),
+    }
+
+
+def save_baseline(path: Path, results: dict[str, dict], meta: Optional[dict] = None) -> None:
+    data = {
+        "created_at": int(time.time()),
+        "environment": environment(),
+        "meta": meta or {},
+        "results": results,
+    }
+    path.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+
+
+def load_baseline(path: Path) -> dict:
+    if not path.exists():
+        raise SystemExit(f"No baseline at {path}, create one with the 'save' command")
+    return json.loads(path.read_text())
+
+
+class Comparison(NamedTuple):
+    name: str
+    baseline: Optional[float]
+    current: Optional[float]
+    # current / baseline, > 1 is slower for times and faster for throughputs
+    ratio: Optional[float]
+    status: str  # "ok", "regression", "improvement", "new", "missing"
+
+
+def compare(
+    baseline: dict[str, float],
+    current: dict[str, float],
+    threshold: float,
+    higher_is_better: bool = False,
+) -> list[Comparison]:
+    """Flag every value that got worse than the baseline by more than `threshold`."""
+    comparisons = []
+    for name in sorted(baseline.keys() | current.keys()):
+        before, after = baseline.get(name), current.get(name)
+        if before is None or after is None:
+            status = "new" if before is None else "missing"
+            comparisons.append(Comparison(name, before, after, None, status))
+            continue
+
+        ratio = after / before if before else float("inf")
+        worse = ratio < 1 - threshold if higher_is_better else ratio > 1 + threshold
+        better = ratio > 1 + threshold if higher_is_better else ratio < 1 - threshold
+        status = "regression" if worse else "improvement" if better else "ok"
+        comparisons.append(Comparison(name, before, after, ratio, status))
+    return comparisons
+
+
+def print_comparisons(comparisons: list[Comparison], unit: str) -> None:
+    print(f"{'name':<40} {'baseline':>12} {'current':>12} {'ratio':>7}  status")
+    for c in comparisons:
+        before = f"{c.baseline:.2f}" if c.baseline is not None else "-"
+        after = f"{c.current:.2f}" if c.current is not None else "-"
+        ratio = f"{c.ratio:.2f}x" if c.ratio is not None else "-"
+        print(f"{c.name:<40} {before:>12} {after:>12} {ratio:>7}  {c.status}")
+    print(f"(values in {unit})")
+
+
+def has_regressions(comparisons: list[Comparison]) -> bool:
+    return any(c.status == "regression" for c in comparisons)
@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+import os
+from pathlib import Path
+import sys
+from typing import AsyncIterator, Optional
+
+LOADTEST_DIR = Path(__file__).parent
+BACKEND_DIR = LOADTEST_DIR.parent
+DEFAULT_BASELINE = LOADTEST_DIR / "baseline.json"
+
+# API key traffic is part of the mixed workload
+os.environ.setdefault("ENABLE_API_KEY", "True")
+os.environ.setdefault("GLOBAL_LOG_LEVEL", "WARNING")
+sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx  # noqa: E402
+
+from benchmarks.harness import (  # noqa: E402
+    compare,
+    environment,
+    has_regressions,
+    load_baseline,
+    print_comparisons,
+    save_baseline,
+)
+from .runner import WORKLOADS, Context, drive, print_results, sign_in_sessions  # noqa: E402
+from .seed import cleanup, seed  # noqa: E402
+
+
+@asynccontextmanager
+async def open_client(url: Optional[str], concurrency: int) -> AsyncIterator[httpx.AsyncClient]:
+    """Client for a running server at `url`, or for the app in this process."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    if url:
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+            yield client
+        return
+
+    from src.main import app
+
+    # ASGITransport does not send lifespan events
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://loadtest", limits=limits, timeout=30
+        ) as client:
+            yield client
+
+
+async def run(args) -> int:
+    from src.core.env import API_URI
+
+    async with open_client(args.url, args.concurrency) as client:
+        print(f"Seeding {args.users} users and {args.todos} todos", file=sys.stderr)
+        seeded = await asyncio.to_thread(seed, args.users, args.todos)
+        try:
+            ctx = Context(client, API_URI, seeded, [])
+            tokens = await sign_in_sessions(ctx, min(args.sessions, args.users))
+            ctx = ctx._replace(tokens=tokens)
+
+            print(
+                f"Running '{args.workload}' with {args.concurrency} clients "
+                f"for {args.duration}s",
+                file=sys.stderr,
+            )
+            results = await drive(
+                ctx,
+                WORKLOADS[args.workload],
+                args.concurrency,
+                args.duration,
+                args.warmup,
+                args.seed,
+            )
+        finally:
+            if not args.keep:
+                await asyncio.to_thread(cleanup, seeded)
+
+    print_results(results)
+    failed = {name: r for name, r in results.items() if r.errors}
+    for name, r in failed.items():
+        print(f"Error: {r.errors} of {r.count} '{name}' requests failed", file=sys.stderr)
+    if failed and not args.allow_errors:
+        # the latencies of error responses say nothing about the endpoint
+        print("Not comparing or saving results with errors", file=sys.stderr)
+        return 1
+
+    meta = {
+        "workload": args.workload,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "users": args.users,
+        "todos": args.todos,
+        "target": args.url or "in-process",
+    }
+
+    if args.command == "save":
+        save_baseline(args.baseline, {n: r._asdict() for n, r in results.items()}, meta)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if args.command == "compare":
+        baseline = load_baseline(args.baseline)
+        if baseline["meta"] != meta:
+            print(f"Warning: baseline was recorded with {baseline['meta']}", file=sys.stderr)
+        if baseline["environment"] != environment():
+            print(
+                f"Warning: baseline was recorded on {baseline['environment']}",
+                file=sys.stderr,
+            )
+        before = baseline["results"]
+
+        latency = compare(
+            {n: r["p95_ms"] for n, r in before.items()},
+            {n: r.p95_ms for n, r in results.items()},
+            args.threshold,
+        )
+        throughput = compare(
+            {n: r["rps"] for n, r in before.items()},
+            {n: r.rps for n, r in results.items()},
+            args.threshold,
+            higher_is_better=True,
+        )
+        print("\np95 latency")
+        print_comparisons(latency, "ms")
+        print("\nthroughput")
+        print_comparisons(throughput, "req/s")
+        return 1 if has_regressions(latency) or has_regressions(throughput) else 0
+
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m loadtest",
+        description=(
+            "In process, the app runs on STORAGE_BACKEND=memory unless the "
+            "environment sets it. With --url, users and todos are seeded into "
+            "the database of the environment (DATABASE_URL or DB_USERNAME and "
+            "DB_PASSWORD), which must be the server's."
+        ),
+    )
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "save", "compare"])
+    parser.add_argument("--url", default=None, help="target a running server instead of the app in process")
+    parser.add_argument("--workload", default="mixed", choices=sorted(WORKLOADS))
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--todos", type=int, default=1000)
+    parser.add_argument("--sessions", type=int, default=20, help="users signed in before the run")
+    parser.add_argument("-c", "--concurrency", type=int, default=20)
+    parser.add_argument("-d", "--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    parser.add_argument(
+        "--allow-errors", action="store_true", help="go on when some requests failed"
+    )
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="p95 increase or throughput drop flagged as a regression (0.2 = 20%%)",
+    )
+    args = parser.parse_args(argv)
+    if not args.url:
+        os.environ.setdefault("STORAGE_BACKEND", "memory")
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
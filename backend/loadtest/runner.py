@@ -0,0 +1,182 @@
+import asyncio
+import random
+import statistics
+import time
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+import httpx
+
+from .seed import PASSWORD, Seed
+
+
+class Context(NamedTuple):
+    client: httpx.AsyncClient
+    api_uri: str
+    seeded: Seed
+    # access tokens of the users signed in during setup
+    tokens: list[str]
+
+
+type Request = Callable[[Context, random.Random], Awaitable[httpx.Response]]
+
+
+class Scenario(NamedTuple):
+    name: str
+    request: Request
+
+
+def _bearer(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def signin(ctx: Context, rng: random.Random) -> httpx.Response:
+    user = rng.choice(ctx.seeded.users)
+    return await ctx.client.post(
+        f"{ctx.api_uri}/auth/signin", json={"email": user.email, "password": PASSWORD}
+    )
+
+
+async def list_todos(ctx: Context, rng: random.Random) -> httpx.Response:
+    return await ctx.client.get(
+        f"{ctx.api_uri}/todo/", params={"limit": 50}, headers=_bearer(rng.choice(ctx.tokens))
+    )
+
+
+async def list_todos_api_key(ctx: Context, rng: random.Random) -> httpx.Response:
+    user = rng.choice(ctx.seeded.users)
+    return await ctx.client.get(
+        f"{ctx.api_uri}/todo/", params={"limit": 50}, headers=_bearer(user.api_key)
+    )
+
+
+async def patch_todo(ctx: Context, rng: random.Random) -> httpx.Response:
+    todo_id = rng.choice(ctx.seeded.todo_ids)
+    return await ctx.client.patch(
+        f"{ctx.api_uri}/todo/{todo_id}",
+        json={"item": f"patched {rng.randrange(1_000_000)}"},
+        headers=_bearer(rng.choice(ctx.tokens)),
+    )
+
+
+SIGNIN = Scenario("POST /auth/signin", signin)
+LIST_TODOS = Scenario("GET /todo/", list_todos)
+LIST_TODOS_API_KEY = Scenario("GET /todo/ (api key)", list_todos_api_key)
+PATCH_TODO = Scenario("PATCH /todo/{id}", patch_todo)
+
+# scenario -> weight
+WORKLOADS: dict[str, dict[Scenario, int]] = {
+    "mixed": {SIGNIN: 1, LIST_TODOS: 6, LIST_TODOS_API_KEY: 3, PATCH_TODO: 2},
+    "signin": {SIGNIN: 1},
+    "read": {LIST_TODOS: 1},
+    "write": {PATCH_TODO: 1},
+    "api_key": {LIST_TODOS_API_KEY: 1},
+}
+
+
+async def sign_in_sessions(ctx: Context, count: int) -> list[str]:
+    tokens = []
+    for user in ctx.seeded.users[:count]:
+        response = await ctx.client.post(
+            f"{ctx.api_uri}/auth/signin",
+            json={"email": user.email, "password": PASSWORD},
+        )
+        response.raise_for_status()
+        tokens.append(response.json()["token"])
+    return tokens
+
+
+####################################
+# Driver
+####################################
+
+
+class EndpointResult(NamedTuple):
+    count: int
+    errors: int
+    rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    def record(self, name: str, elapsed_ms: float, ok: bool) -> None:
+        self.latencies.setdefault(name, []).append(elapsed_ms)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def results(self, elapsed: float) -> dict[str, EndpointResult]:
+        results = {}
+        for name, latencies in sorted(self.latencies.items()):
+            if len(latencies) > 1:
+                cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+                p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+            else:
+                p50 = p95 = p99 = latencies[0]
+            results[name] = EndpointResult(
+                count=len(latencies),
+                errors=self.errors.get(name, 0),
+                rps=len(latencies) / elapsed,
+                p50_ms=p50,
+                p95_ms=p95,
+                p99_ms=p99,
+            )
+        return results
+
+
+async def _worker(
+    ctx: Context,
+    workload: dict[Scenario, int],
+    deadline: float,
+    rng: random.Random,
+    recorder: Optional[Recorder],
+) -> None:
+    scenarios, weights = list(workload), list(workload.values())
+    while time.perf_counter() < deadline:
+        (scenario,) = rng.choices(scenarios, weights)
+        start = time.perf_counter()
+        try:
+            response = await scenario.request(ctx, rng)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        if recorder is not None:
+            recorder.record(scenario.name, (time.perf_counter() - start) * 1000, ok)
+
+
+async def drive(
+    ctx: Context,
+    workload: dict[Scenario, int],
+    concurrency: int,
+    duration: float,
+    warmup: float = 0,
+    seed: int = 0,
+) -> dict[str, EndpointResult]:
+    """Run `concurrency` clients for `duration` seconds after `warmup` seconds."""
+    rngs = [random.Random(seed + i) for i in range(concurrency)]
+
+    if warmup > 0:
+        deadline = time.perf_counter() + warmup
+        await asyncio.gather(*(_worker(ctx, workload, deadline, rng, None) for rng in rngs))
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(_worker(ctx, workload, deadline, rng, recorder) for rng in rngs))
+    return recorder.results(time.perf_counter() - start)
+
+
+def print_results(results: dict[str, EndpointResult]) -> None:
+    print(
+        f"{'endpoint':<24} {'count':>8} {'errors':>7} {'req/s':>9} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    for name, r in results.items():
+        print(
+            f"{name:<24} {r.count:>8} {r.errors:>7} {r.rps:>9.1f} "
+            f"{r.p50_ms:>9.2f} {r.p95_ms:>9.2f} {r.p99_ms:>9.2f}"
+        )
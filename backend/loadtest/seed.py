@@ -0,0 +1,61 @@
+from typing import NamedTuple
+import uuid
+
+# `src` is imported by the functions below: importing it reads the storage
+# settings, which `python -m loadtest` picks after parsing its arguments
+
+PASSWORD = "loadtest-password"
+
+
+class SeededUser(NamedTuple):
+    id: str
+    email: str
+    api_key: str
+
+
+class Seed(NamedTuple):
+    users: list[SeededUser]
+    todo_ids: list[int]
+
+
+def seed(num_users: int, num_todos: int, batch_size: int = 500) -> Seed:
+    """`num_users` users, each with an API key, and `num_todos` todos."""
+    from src.domain.auth.services import Auths
+    from src.domain.auth.utils import create_api_key, get_password_hash
+    from src.domain.todos import Todos, TodoForm
+    from src.domain.user import Users
+
+    run = uuid.uuid4().hex[:8]
+    # bcrypt is slow by design, every user shares the same hash
+    hashed = get_password_hash(PASSWORD)
+
+    users = []
+    for i in range(num_users):
+        email = f"load-{run}-{i}@example.com"
+        # `get_verified_principal` only lets "users" and "admin" through
+        user = Auths.insert_new_auth(email, hashed, f"Load {i}", role="users")
+        if user is None:
+            raise RuntimeError(f"Could not seed user {email}")
+        api_key = create_api_key()
+        Users.update_user_api_key_by_id(user.id, api_key)
+        users.append(SeededUser(user.id, email, api_key))
+
+    todo_ids = []
+    for start in range(0, num_todos, batch_size):
+        forms = [
+            TodoForm(item=f"load {run} {i}")
+            for i in range(start, min(start + batch_size, num_todos))
+        ]
+        todo_ids.extend(result.id for result in Todos.insert_new_todos(forms))
+
+    return Seed(users, todo_ids)
+
+
+def cleanup(seeded: Seed, batch_size: int = 500) -> None:
+    from src.domain.auth.services import Auths
+    from src.domain.todos import Todos
+
+    for user in seeded.users:
+        Auths.delete_auth_by_id(user.id)
+    for start in range(0, len(seeded.todo_ids), batch_size):
+        Todos.delete_todos(seeded.todo_ids[start : start + batch_size])
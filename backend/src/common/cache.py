@@ -0,0 +1,140 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Callable, Optional
+
+from pydantic import BaseModel
+
+
+class CacheStats(BaseModel):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
+
+class TTLCache[K, V]:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    Services call it from the DB executor threads and from the event loop, so
+    every operation holds a lock; none of them do any I/O while holding it.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl if ttl and ttl > 0 else None
+
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = item
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: K) -> Optional[V]:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def pop_where(self, predicate: Callable[[V], bool]) -> int:
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items() if predicate(value)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> CacheStats:
+        lookups = self.hits + self.misses
+        return CacheStats(
+            size=len(self._data),
+            maxsize=self.maxsize,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+        )
+
+
+class VersionedCache[K, V]:
+    """
+    LRU cache of values computed at some version of their source.
+
+    A read at any other version misses, and the value computed then replaces
+    the stale one: each key holds at most one copy, so bumping versions never
+    grows the cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self._cache: TTLCache[K, tuple[str, V]] = TTLCache(maxsize, ttl)
+        # lookups that found an entry of another version
+        self.stale = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def get(self, key: K, version: str) -> Optional[V]:
+        item = self._cache.get(key)
+        if item is None:
+            return None
+        if item[0] != version:
+            self.stale += 1
+            return None
+        return item[1]
+
+    def set(self, key: K, version: str, value: V) -> None:
+        self._cache.set(key, (version, value))
+
+    def pop(self, key: K) -> None:
+        self._cache.pop(key)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> CacheStats:
+        stats = self._cache.stats()
+        hits, misses = stats.hits - self.stale, stats.misses + self.stale
+        lookups = hits + misses
+        return stats.model_copy(
+            update={
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+        )
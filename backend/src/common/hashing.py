@@ -0,0 +1,139 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import time
+from typing import Callable, Optional
+
+from passlib.context import CryptContext
+from pydantic import BaseModel, computed_field
+
+# This module is imported by the hashing worker processes, keep it free of
+# app imports (env, db, ...) so a worker starts with passlib alone.
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHashTimeoutError(Exception):
+    """Raised when a hashing job waited longer than the queue timeout for a slot."""
+
+
+class OperationStats(BaseModel):
+    count: int = 0
+    time_total: float = 0.0
+    time_max: float = 0.0
+    wait_time_total: float = 0.0
+    wait_time_max: float = 0.0
+
+    @computed_field
+    @property
+    def time_avg(self) -> float:
+        return self.time_total / self.count if self.count else 0.0
+
+
+class PasswordHasherStats(BaseModel):
+    workers: int
+    max_concurrency: int
+    in_flight: int
+    waiting: int
+    timeouts: int
+    operations: dict[str, OperationStats]
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a process pool so it never holds the event loop.
+
+    At most `max_concurrency` jobs are submitted to the pool at once; callers
+    beyond that wait up to `queue_timeout` seconds and then get a
+    `PasswordHashTimeoutError`, which lets a login storm fail fast instead of
+    queueing without bound.
+    """
+
+    def __init__(self, workers: int, max_concurrency: int, queue_timeout: float):
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.queue_timeout: Optional[float] = (
+            queue_timeout if queue_timeout >= 0 else None
+        )
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self.operations: dict[str, OperationStats] = {
+            "hash": OperationStats(),
+            "verify": OperationStats(),
+        }
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # created on first use so importing the app never spawns processes
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _run[T](self, operation: str, f: Callable[..., T], *args) -> T:
+        stats = self.operations[operation]
+
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except TimeoutError:
+            self.timeouts += 1
+            raise PasswordHashTimeoutError(
+                f"Timed out after {self.queue_timeout}s waiting to {operation} a password"
+            )
+        finally:
+            self.waiting -= 1
+
+        started = time.perf_counter()
+        waited = started - start
+        stats.wait_time_total += waited
+        stats.wait_time_max = max(stats.wait_time_max, waited)
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, f, *args)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+            elapsed = time.perf_counter() - started
+            stats.count += 1
+            stats.time_total += elapsed
+            stats.time_max = max(stats.time_max, elapsed)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", check_password, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> PasswordHasherStats:
+        return PasswordHasherStats(
+            workers=self.workers,
+            max_concurrency=self.max_concurrency,
+            in_flight=self.in_flight,
+            waiting=self.waiting,
+            timeouts=self.timeouts,
+            operations=self.operations,
+        )
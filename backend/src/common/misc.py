@@ -1,4 +1,6 @@
 from datetime import timedelta
+import functools
+import inspect
 import re
 from typing import Optional, Callable
 
@@ -41,14 +43,40 @@ def parse_duration(duration: str) -> Optional[timedelta]:
     return total_duration
 
 
+class OverloadedError(Exception):
+    """
+    A shared resource stayed saturated for too long. `if_error_return` lets
+    these through, so the app can answer them with a 503.
+    """
+
+
 def if_error_return[TError](error: TError):
     def wrapper_decorator[T, **P](f: Callable[P, T]) -> Callable[P, T]:
+        if inspect.iscoroutinefunction(f):
+
+            @functools.wraps(f)
+            async def async_inner(*args: P.args, **kwargs: P.kwargs) -> T:
+                try:
+                    return await f(*args, **kwargs)
+                except OverloadedError:
+                    raise
+                except Exception:
+                    return error
+
+            # lets `instrument` count the errors from beneath this decorator
+            async_inner.error_return = error
+            return async_inner
+
+        @functools.wraps(f)
         def inner(*args: P.args, **kwargs: P.kwargs) -> T:
             try:
                 return f(*args, **kwargs)
+            except OverloadedError:
+                raise
             except Exception:
                 return error
 
+        inner.error_return = error
         return inner
 
     return wrapper_decorator
@@ -0,0 +1,32 @@
+import base64
+import json
+from typing import Any, Optional
+
+
+def encode_cursor(values: list[Any]) -> str:
+    """Opaque, url-safe cursor for the sort key of the last row of a page."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, types: tuple[type, ...]) -> list[Any]:
+    """Values of `encode_cursor`, checked against the sort key `types`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("Invalid cursor")
+    for value, expected in zip(values, types):
+        # JSON true/false decode to bool, which would pass for int
+        if type(value) is bool or not isinstance(value, expected):
+            raise ValueError("Invalid cursor")
+    return values
+
+
+def clamp_limit(limit: Optional[int], default: int, maximum: int) -> int:
+    if limit is None or limit <= 0:
+        return min(default, maximum)
+    return min(limit, maximum)
@@ -1 +1,10 @@
-from .db import engine as engine
+# `engine` is resolved on first access so that importing `src.core.env` or
+# `src.core.migrate` does not load the DB layer
+
+
+def __getattr__(name: str):
+    if name == "engine":
+        from .db import get_engine
+
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,167 @@
+"""
+Version bumps shared by the workers of one host.
+
+Every worker binds a Unix datagram socket named after its pid in
+`CACHE_BUS_DIR`, and sends each bump of `versions`, with the version it made,
+to the sockets of the others, which adopt it: their ETags and todo cache
+entries go stale as soon as the write commits, and the new tag is the same in
+every worker.
+
+A worker sends a join to the others when it starts, so they add its socket to
+the peers they publish to, which they otherwise only look up again when a send
+fails or a reset comes in.
+
+Datagrams are fire and forget: a bump sent to a worker whose socket buffer is
+full is lost. That worker is then sent a reset, retried every
+`RESET_RETRY_INTERVAL` until delivered, which makes it drop all its versions.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+import socket
+import threading
+from typing import Hashable, Optional
+
+from .env import CACHE_BUS_DIR, SRC_LOG_LEVELS
+from .etag import VersionTracker, versions
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+# larger than any bump: a batch write names at most TODO_BATCH_MAX_SIZE rows
+MAX_MESSAGE_SIZE = 64 * 1024
+
+# sent to a worker that missed a bump
+RESET = b'"reset"'
+# sent by a worker that just started
+JOIN = b'"join"'
+RESET_RETRY_INTERVAL = 1.0
+
+
+class VersionBus:
+    def __init__(self, directory: str, tracker: VersionTracker):
+        self.directory = Path(directory)
+        self._tracker = tracker
+        self._path = self.directory / f"{os.getpid()}.sock"
+        self._receiver: Optional[socket.socket] = None
+        self._sender: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        # sockets of the other workers, replaced whole so that readers need no
+        # lock
+        self._peers: tuple[Path, ...] = ()
+        # peers owed a reset, guarded by `_lock`
+        self._missed: set[Path] = set()
+        self._lock = threading.Lock()
+        # bumps are published from the event loop and from the db_executor
+        # threads: one datagram per sendto never interleaves with another, the
+        # lock only keeps `stop` from closing the socket under a send
+        self._send_lock = threading.Lock()
+
+    def start(self) -> None:
+        # only the workers of this user may send bumps
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        if self.directory.stat().st_uid != os.getuid():
+            log.error(
+                f"Not sharing version bumps: {self.directory} belongs to another user"
+            )
+            return
+        # left behind by a crashed worker that had the same pid
+        self._path.unlink(missing_ok=True)
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(str(self._path))
+        # wakes the receiver up to retry the resets owed
+        self._receiver.settimeout(RESET_RETRY_INTERVAL)
+        # never wait on a slow peer, from the event loop least of all
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+
+        self._thread = threading.Thread(
+            target=self._receive, name="version-bus", daemon=True
+        )
+        self._thread.start()
+        self._tracker.on_bump = self.publish
+        self._refresh()
+        for peer in self._peers:
+            if not self._send(peer, JOIN):
+                # a reset makes it look its peers up just the same
+                with self._lock:
+                    self._missed.add(peer)
+        log.info(f"Sharing version bumps through {self.directory}")
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._tracker.on_bump = None
+        # an empty datagram wakes the receiver up to exit
+        self._sender.sendto(b"", str(self._path))
+        self._thread.join()
+        self._path.unlink(missing_ok=True)
+        self._receiver.close()
+        with self._send_lock:
+            self._sender.close()
+            self._sender = None
+        self._thread = None
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                message = self._receiver.recv(MAX_MESSAGE_SIZE)
+            except TimeoutError:
+                self._send_resets()
+                continue
+            if not message:
+                return
+            try:
+                if message == JOIN:
+                    self._refresh()
+                    continue
+                if message == RESET:
+                    log.warning("Missed a version bump, dropping every version")
+                    self._refresh()
+                    self._tracker.reset()
+                    continue
+                table, keys, version = json.loads(message)
+                self._tracker.adopt(table, tuple(keys), version)
+            except Exception as err:
+                log.warning(f"Dropped a malformed version bump: {err}")
+
+    def _refresh(self) -> None:
+        self._peers = tuple(
+            peer for peer in self.directory.glob("*.sock") if peer != self._path
+        )
+
+    def _send(self, peer: Path, message: bytes) -> bool:
+        """Whether `peer` got `message` or is gone, in which case it needs none."""
+        try:
+            with self._send_lock:
+                if self._sender is None:
+                    return True
+                self._sender.sendto(message, str(peer))
+        except (ConnectionRefusedError, FileNotFoundError):
+            # nobody listens there anymore: its worker is gone
+            peer.unlink(missing_ok=True)
+            self._refresh()
+        except BlockingIOError:
+            return False
+        return True
+
+    def _send_resets(self) -> None:
+        with self._lock:
+            missed, self._missed = self._missed, set()
+        for peer in missed:
+            if not self._send(peer, RESET):
+                with self._lock:
+                    self._missed.add(peer)
+
+    def publish(self, table: str, keys: tuple[Hashable, ...], version: str) -> None:
+        message = json.dumps([table, list(keys), version]).encode()
+        for peer in self._peers:
+            if not self._send(peer, message):
+                log.warning(f"Version bump of '{table}' not delivered to {peer.name}")
+                with self._lock:
+                    self._missed.add(peer)
+
+
+version_bus = VersionBus(CACHE_BUS_DIR, versions) if CACHE_BUS_DIR else None
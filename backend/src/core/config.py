@@ -8,7 +8,8 @@ from .env import log, BACKEND_AUTH
 
 class EndpointFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
-        return record.getMessage().find("/health") == -1
+        message = record.getMessage()
+        return message.find("/health") == -1 and message.find("/metrics") == -1
 
 
 logging.getLogger("uvicorn.access").addFilter(EndpointFilter())
@@ -33,9 +34,11 @@ def get_config_value(config_path: str):
     path_parts = config_path.split(".")
     cur_config = CONFIG_DATA
     for key in path_parts:
-        if key in cur_config:
-            return cur_config[key]
-    return None
+        # a missing section is a missing value, not the parent section
+        if not isinstance(cur_config, dict) or key not in cur_config:
+            return None
+        cur_config = cur_config[key]
+    return cur_config
 
 
 PERSISTENT_CONFIG_REGISTRY: list[PersistentConfig] = []
@@ -183,6 +186,13 @@ ENABLE_LOGIN_FORM = PersistentConfig(
     os.environ.get("ENABLE_LOGIN_FORM", "True").lower() == "true",
 )
 
+# role of the users who sign up after the first one, who becomes admin
+DEFAULT_USER_ROLE = PersistentConfig(
+    "DEFAULT_USER_ROLE",
+    "ui.default_user_role",
+    os.environ.get("DEFAULT_USER_ROLE", "pending"),
+)
+
 
 ####################################
 # WEBUI_AUTH (Required for security)
@@ -211,6 +221,25 @@ JWT_EXPIRES_IN = PersistentConfig(
     "JWT_EXPIRES_IN", "auth.jwt_expiry", os.environ.get("JWT_EXPIRES_IN", "-1")
 )
 
+JWT_REFRESH_EXPIRES_IN = PersistentConfig(
+    "JWT_REFRESH_EXPIRES_IN",
+    "auth.jwt_refresh_expiry",
+    os.environ.get("JWT_REFRESH_EXPIRES_IN", "30d"),
+)
+
+# Sign role, email and name into the access token so role checks skip the DB
+JWT_EMBED_CLAIMS = PersistentConfig(
+    "JWT_EMBED_CLAIMS",
+    "auth.jwt_embed_claims",
+    os.environ.get("JWT_EMBED_CLAIMS", "False").lower() == "true",
+)
+
+JWT_CLAIMS_EXPIRES_IN = PersistentConfig(
+    "JWT_CLAIMS_EXPIRES_IN",
+    "auth.jwt_claims_expiry",
+    os.environ.get("JWT_CLAIMS_EXPIRES_IN", "5m"),
+)
+
 
 ####################################
 # OAuth config
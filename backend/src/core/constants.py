@@ -9,6 +9,9 @@ class ERROR_MESSAGES(str, Enum):
         lambda err="": f"{'Something went wrong :/' if err == '' else '[ERROR: ' + str(err) + ']'}"
     )
     ENV_VAR_NOT_FOUND = "Required environment variable not found. Terminating now."
+    DB_POOL_TIMEOUT = "The server is busy right now and could not get a database connection in time. Please try again in a moment."
+    AUTH_BUSY = "We are handling a lot of sign-ins right now. Please try again in a moment."
+    DB_DRIVER_NOT_FOUND = "The database driver requested in DATABASE_URL is not installed. Terminating now."
     CREATE_USER_ERROR = "Oops! Something went wrong while creating your account. Please try again later. If the issue persists, contact support for assistance."
     DELETE_USER_ERROR = "Oops! Something went wrong. We encountered an issue while trying to delete the user. Please give it another shot."
     EMAIL_MISMATCH = "Uh-oh! This email does not match the email your provider is registered with. Please check your email and try again."
@@ -20,6 +23,8 @@ class ERROR_MESSAGES(str, Enum):
     FILE_EXISTS = "Uh-oh! This file is already registered. Please choose another file."
 
     USER_NOT_FOUND = "We could not find what you're looking for :/"
+    NOT_FOUND = "We could not find what you're looking for :/"
+    INVALID_CURSOR = "The page cursor is invalid or has expired. Please start again from the first page."
 
     API_KEY_NOT_ALLOWED = "Use of API key is not enabled in the environment."
     API_KEY_NOT_FOUND = "Oops! It looks like there's a hiccup. The API key is missing. Please make sure to provide a valid API key to access this feature."
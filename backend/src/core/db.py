@@ -1,12 +1,406 @@
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Iterator, NamedTuple, Optional
+from urllib.parse import parse_qsl, unquote, urlencode, urlparse
+import weakref
+
 from ormlambda import create_engine
 
-from .env import DATABASE_URL, URI_DB_CONNECTION, DB_DATABASE
+from . import sqlite
+from .constants import ERROR_MESSAGES
+from .env import (
+    DATABASE_URL,
+    DB_DIALECT,
+    DB_POOL_SIZE,
+    DB_POOL_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    SQLITE_BUSY_TIMEOUT,
+    SRC_LOG_LEVELS,
+    STORAGE_BACKEND,
+)
+from .pool import PoolGate, PoolStats
+from .startup import phase
+from .timing import section
+from .query_stats import instrument_repository, record_query
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["DB"])
+
+
+ASYNC_SCHEMES = {"mysql+aiomysql"}
+
+DATABASE_SCHEME = urlparse(DATABASE_URL).scheme
+
+
+def _sync_database_url(url: str, pool_size: int) -> str:
+    """
+    `url` for ormlambda, which only understands the plain dialect name, with
+    a pool of `pool_size` connections: mysql-connector fails a checkout from
+    an exhausted pool instead of waiting, so it must hold one connection for
+    every query `db_gate` lets through.
+    """
+    parsed = urlparse(url)
+    query = dict(parse_qsl(parsed.query))
+    if query.get("pool_size", str(pool_size)) != str(pool_size):
+        log.warning(
+            f"Ignoring pool_size={query['pool_size']} of DATABASE_URL, "
+            f"DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW is {pool_size}"
+        )
+    query["pool_size"] = str(pool_size)
+    return parsed._replace(
+        scheme=parsed.scheme.split("+")[0], query=urlencode(query)
+    ).geturl()
+
+
+# only the MySQL engine is built from it
+SYNC_DATABASE_URL = (
+    _sync_database_url(DATABASE_URL, DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW)
+    if DB_DIALECT == "mysql"
+    else DATABASE_URL
+)
+
+
+class Dialect(NamedTuple):
+    name: str
+    # statement opening `transaction()`, None for an implicit transaction
+    begin: Optional[str]
+    # suffix locking the rows read inside `transaction()`
+    for_update: str
+    # `lastrowid` of a multi-row INSERT is its first id, not its last
+    lastrowid_is_first: bool
+    # query for the step between auto-increment ids, None when always 1
+    id_step_query: Optional[str]
+
+
+DIALECTS = {
+    "mysql": Dialect(
+        "mysql", None, " FOR UPDATE", True, "SELECT @@auto_increment_increment"
+    ),
+    # `BEGIN IMMEDIATE` already holds the database write lock
+    "sqlite": Dialect("sqlite", "BEGIN IMMEDIATE", "", False, None),
+}
+
+dialect = DIALECTS[DB_DIALECT]
+
+
+# Pools open their connections when created, so they are only built on first
+# use: importing the app never needs a reachable database.
+_engine = None
+_engine_lock = threading.Lock()
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_engine():
+    """ormlambda engine of a MySQL DATABASE_URL."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(SYNC_DATABASE_URL)
+    return _engine
+
+
+def get_repository():
+    """Source of the connections used by the helpers below."""
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                with phase("db.engine"):
+                    if dialect.name == "sqlite":
+                        repository = sqlite.ConnectionPool(
+                            sqlite.database_path(DATABASE_URL), SQLITE_BUSY_TIMEOUT
+                        )
+                    else:
+                        repository = get_engine().repository
+                    instrument_repository(repository)
+                    _repository = repository
+    return _repository
+
+
+def close_repository() -> None:
+    """Close the embedded database connections, checkpointing the WAL."""
+    if isinstance(_repository, sqlite.ConnectionPool):
+        _repository.close()
+
+
+def __getattr__(name: str):
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class ExecuteResult(NamedTuple):
+    rowcount: int
+    lastrowid: Optional[int]
+
+
+def placeholders(size: int) -> str:
+    return ", ".join("%s" for _ in range(size))
+
+
+def inserted_ids(cursor: Any, rows: int) -> list[int]:
+    """Ids of the `rows` rows added by the last INSERT on `cursor`, in order."""
+    first = last = cursor.lastrowid
+    step = 1
+    if dialect.id_step_query:
+        # replicated MySQL setups space ids by `auto_increment_increment`
+        cursor.execute(dialect.id_step_query)
+        (step,) = cursor.fetchone()
+    if not dialect.lastrowid_is_first:
+        first = last - (rows - 1) * step
+    return [first + i * step for i in range(rows)]
+
+
+# when each pooled MySQL connection was first checked out or last reopened;
+# mysql-connector pools have no recycling of their own
+_connected_at: "weakref.WeakKeyDictionary[Any, float]" = weakref.WeakKeyDictionary()
+
+
+def _recycle(cnx: Any) -> None:
+    """Reopen `cnx` once it is older than DB_POOL_RECYCLE seconds."""
+    now = time.monotonic()
+    if now - _connected_at.setdefault(cnx, now) > DB_POOL_RECYCLE:
+        cnx.reconnect()
+        _connected_at[cnx] = now
+
+
+@contextmanager
+def connection() -> Iterator[Any]:
+    """Check out a raw DB-API connection from the pool."""
+    with get_repository().get_connection() as cnx:
+        if dialect.name == "mysql" and DB_POOL_RECYCLE >= 0:
+            _recycle(cnx)
+        if DB_POOL_PRE_PING:
+            cnx.ping(reconnect=True)
+        yield cnx
+
+
+def fetch_one(query: str, params: tuple = ()) -> Optional[dict]:
+    with connection() as cnx:
+        with cnx.cursor(dictionary=True) as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchone()
+
+
+def fetch_all(query: str, params: tuple = ()) -> list[dict]:
+    with connection() as cnx:
+        with cnx.cursor(dictionary=True) as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+
+def execute(query: str, params: tuple = ()) -> ExecuteResult:
+    with connection() as cnx:
+        with cnx.cursor() as cursor:
+            cursor.execute(query, params)
+            cnx.commit()
+            return ExecuteResult(cursor.rowcount, cursor.lastrowid)
+
+
+@contextmanager
+def transaction() -> Iterator[Any]:
+    """Cursor whose statements are committed together, or rolled back on error."""
+    with connection() as cnx:
+        cursor = cnx.cursor()
+        try:
+            if dialect.begin:
+                cursor.execute(dialect.begin)
+            yield cursor
+            cnx.commit()
+        except Exception:
+            cnx.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+####################################
+# Async execution layer
+####################################
+
+# One worker per pooled connection: extra calls wait on `db_gate` instead of
+# holding a thread that blocks on the connection pool.
+db_gate = PoolGate(DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW, DB_POOL_TIMEOUT)
+db_executor = ThreadPoolExecutor(
+    max_workers=db_gate.capacity, thread_name_prefix="db"
+)
+
+
+async def run_in_db[T, **P](f: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+    loop = asyncio.get_running_loop()
+    # the request's query stats follow the call into the executor thread
+    context = contextvars.copy_context()
+    with section("db"):
+        async with db_gate.acquire():
+            return await loop.run_in_executor(
+                db_executor, functools.partial(context.run, f, *args, **kwargs)
+            )
+
+
+class AsyncTable[T]:
+    """
+    Awaitable view of a synchronous service table.
+
+    Every method of the wrapped table is exposed as a coroutine that runs the
+    original call on `db_executor`, so routers can `await` DB work without
+    blocking the event loop. Subclasses may override individual methods with
+    native coroutines running on `async_engine`.
+
+    Tables that never block (`blocking = False`, the in-memory backend) are
+    called inline instead of paying for the executor hop.
+    """
+
+    def __init__(self, table: T):
+        self._table = table
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._table, name)
+        if not callable(attr):
+            return attr
+
+        if not getattr(self._table, "blocking", True):
+
+            @functools.wraps(attr)
+            async def inline(*args, **kwargs):
+                return attr(*args, **kwargs)
+
+            return inline
+
+        @functools.wraps(attr)
+        async def inner(*args, **kwargs):
+            return await run_in_db(attr, *args, **kwargs)
+
+        return inner
+
+
+####################################
+# Native async engine
+####################################
+
+
+class AsyncEngine:
+    """
+    Coroutine-native MySQL engine backed by an aiomysql pool.
+
+    Selected with a `mysql+aiomysql://` DATABASE_URL. Queries use the DB-API
+    `%s` placeholder style and rows are returned as dicts.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        pool_size: int,
+        max_overflow: int = 0,
+        timeout: float = 30,
+        recycle: int = -1,
+        pre_ping: bool = False,
+    ):
+        parsed = urlparse(url)
+        self._connect_kwargs = {
+            "host": parsed.hostname or "localhost",
+            "port": parsed.port or 3306,
+            "user": unquote(parsed.username or ""),
+            "password": unquote(parsed.password or ""),
+            "db": parsed.path.lstrip("/") or None,
+        }
+        self.gate = PoolGate(pool_size, max_overflow, timeout)
+        self._recycle = recycle
+        self._pre_ping = pre_ping
+        self._pool = None
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        if self._pool is None:
+            async with self._lock:
+                if self._pool is None:
+                    self._pool = await aiomysql.create_pool(
+                        minsize=self.gate.size,
+                        maxsize=self.gate.capacity,
+                        pool_recycle=self._recycle,
+                        autocommit=True,
+                        **self._connect_kwargs,
+                    )
+        return self._pool
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    @asynccontextmanager
+    async def cursor(self) -> AsyncIterator[Any]:
+        pool = await self.connect()
+        async with self.gate.acquire(), pool.acquire() as conn:
+            if self._pre_ping:
+                await conn.ping(reconnect=True)
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                yield cur
+
+    async def fetch_one(self, query: str, params: tuple = ()) -> Optional[dict]:
+        with section("db"):
+            async with self.cursor() as cur:
+                with record_query(query):
+                    await cur.execute(query, params)
+                return await cur.fetchone()
+
+    async def fetch_all(self, query: str, params: tuple = ()) -> list[dict]:
+        with section("db"):
+            async with self.cursor() as cur:
+                with record_query(query):
+                    await cur.execute(query, params)
+                return list(await cur.fetchall())
+
+    async def execute(self, query: str, params: tuple = ()) -> ExecuteResult:
+        with section("db"):
+            async with self.cursor() as cur:
+                with record_query(query):
+                    await cur.execute(query, params)
+                return ExecuteResult(cur.rowcount, cur.lastrowid)
+
+
+async_engine: Optional[AsyncEngine] = None
 
+if STORAGE_BACKEND == "db" and DATABASE_SCHEME in ASYNC_SCHEMES:
+    if aiomysql is None:
+        raise ImportError(ERROR_MESSAGES.DB_DRIVER_NOT_FOUND)
+    async_engine = AsyncEngine(
+        DATABASE_URL,
+        DB_POOL_SIZE,
+        DB_POOL_MAX_OVERFLOW,
+        DB_POOL_TIMEOUT,
+        DB_POOL_RECYCLE,
+        DB_POOL_PRE_PING,
+    )
 
-no_db_con = create_engine(URI_DB_CONNECTION)
 
-if not no_db_con.schema_exists(DB_DATABASE):
-    no_db_con.create_schema(DB_DATABASE)
+async def warm_pool() -> None:
+    """Open and check every pooled connection before serving traffic."""
+    await asyncio.gather(
+        *(run_in_db(fetch_one, "SELECT 1") for _ in range(db_gate.size))
+    )
+    if async_engine:
+        await async_engine.connect()
+    log.info(f"DB pool warmed with {db_gate.size} connections")
 
 
-engine = create_engine(DATABASE_URL)
+def pool_stats() -> dict[str, PoolStats]:
+    stats = {"engine": db_gate.stats()}
+    if async_engine:
+        stats["async_engine"] = async_engine.gate.stats()
+    return stats
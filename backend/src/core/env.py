@@ -5,9 +5,12 @@ import os
 from pathlib import Path
 import logging
 import sys
+import tempfile
 from typing import Literal
+import zlib
 
 from .constants import ERROR_MESSAGES
+from .startup import phase
 
 CORE_DIR = Path(__file__).parent
 SRC_DIR = CORE_DIR.parent
@@ -18,7 +21,8 @@ BASE_DIR = BACKEND_DIR.parent
 try:
     from dotenv import find_dotenv, load_dotenv
 
-    load_dotenv(find_dotenv(str(BACKEND_DIR / ".env")))
+    with phase("env.dotenv"):
+        load_dotenv(find_dotenv(str(BACKEND_DIR / ".env")))
 
 except ImportError:
     print("dotenv not installed, skipping...")
@@ -39,11 +43,11 @@ log_levels: LogLevelType = [
 ]
 GLOBAL_LOG_LEVEL: LogLevelType = os.getenv("GLOBAL_LOG_LEVEL", "").upper()
 if GLOBAL_LOG_LEVEL in log_levels:
+    # `stream` and `handlers` are exclusive: basicConfig raises if both are set
     logging.basicConfig(
-        stream=sys.stdout,
         level=GLOBAL_LOG_LEVEL,
         force=True,
-        handlers=[logging.StreamHandler()],
+        handlers=[logging.StreamHandler(sys.stdout)],
     )
 else:
     GLOBAL_LOG_LEVEL = "INFO"
@@ -73,6 +77,20 @@ for source in log_sources:
 log.setLevel(SRC_LOG_LEVELS["CONFIG"])
 
 
+####################################
+# Storage backend
+####################################
+
+# 'db' keeps everything in MySQL, 'memory' in per-process dicts that are lost on
+# restart and not shared between workers (benchmarks and DB-free tests)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "db").lower()
+
+if STORAGE_BACKEND not in {"db", "memory"}:
+    raise ValueError(
+        f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}', expected 'db' or 'memory'"
+    )
+
+
 ####################################
 # Load DB variables
 ####################################
@@ -87,15 +105,147 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 
 DB_PORT = os.getenv("DB_PORT", "3306")
 
+# used verbatim when set: `mysql://`, `mysql+aiomysql://` or a SQLite file as
+# `sqlite:///relative/app.db` / `sqlite:////absolute/app.db`; otherwise built
+# from the DB_* variables above
+DATABASE_URL = os.getenv("DATABASE_URL", "")
 
-if DB_USERNAME is None or DB_PASSWORD is None:
+
+if (
+    STORAGE_BACKEND == "db"
+    and not DATABASE_URL
+    and (DB_USERNAME is None or DB_PASSWORD is None)
+):
     raise ValueError(ERROR_MESSAGES.ENV_VAR_NOT_FOUND)
 
-URI_DB_CONNECTION=f"mysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}?pool_size=3"
-DATABASE_URL = (
-    f"mysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}?pool_size=3"
+
+####################################
+# DB connection pool
+####################################
+
+# connections of the pool, whatever `pool_size` DATABASE_URL gives; the
+# mysql-connector pool cannot grow or shrink, so it keeps DB_POOL_SIZE +
+# DB_POOL_MAX_OVERFLOW connections open and the overflow only shows in the pool
+# stats: only aiomysql closes the connections above DB_POOL_SIZE
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "3"))
+
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "0"))
+
+# seconds a request may wait for a free connection, -1 waits forever
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# seconds after which a MySQL connection is reopened when next checked out,
+# before the server drops it (wait_timeout); -1 disables it
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() == "true"
+
+DB_POOL_WARMUP = os.getenv("DB_POOL_WARMUP", "True").lower() == "true"
+
+# 'mysql' uses the ormlambda engine only, 'mysql+aiomysql' also enables the
+# coroutine-native engine for the hot queries
+DB_SCHEME = os.getenv("DB_SCHEME", "mysql")
+
+# statements slower than this are logged with their route, -1 disables it
+DB_SLOW_QUERY_MS = int(os.getenv("DB_SLOW_QUERY_MS", "200"))
+
+# dev only: warn when a request issues more queries than this, 0 disables it
+DB_QUERY_BUDGET = int(os.getenv("DB_QUERY_BUDGET", "0"))
+
+####################################
+# DB migrations
+####################################
+
+# run pending migrations from the app lifespan, turn off when they are applied
+# by `python -m src.core.migrate` as a deploy step
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "True").lower() == "true"
+
+# seconds a process waits for another one to finish migrating
+DB_MIGRATE_LOCK_TIMEOUT = int(os.getenv("DB_MIGRATE_LOCK_TIMEOUT", "60"))
+
+if not DATABASE_URL:
+    DATABASE_URL = (
+        f"{DB_SCHEME}://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}"
+    )
+
+# 'mysql' or 'sqlite', without the driver part of the scheme
+DB_DIALECT = DATABASE_URL.split("://", 1)[0].split("+", 1)[0]
+
+if DB_DIALECT not in {"mysql", "sqlite"}:
+    raise ValueError(
+        f"Unsupported DATABASE_URL dialect '{DB_DIALECT}', expected 'mysql' or 'sqlite'"
+    )
+
+# seconds a SQLite writer waits for the database lock before failing
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))
+
+####################################
+# Pagination
+####################################
+
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "100"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "500"))
+
+# items accepted by one call of the bulk todo endpoints
+TODO_BATCH_MAX_SIZE = int(os.getenv("TODO_BATCH_MAX_SIZE", "500"))
+
+# rows read per query while streaming a listing as NDJSON
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "500"))
+
+####################################
+# ETags
+####################################
+
+# directory of the Unix sockets the workers of one host use to share version
+# bumps, so their writes invalidate each other's ETags and caches right away;
+# by default one per database in the temp directory, shared by every worker
+# using it; empty leaves each worker on its own until ETAG_VERSION_TTL
+CACHE_BUS_DIR = os.getenv("CACHE_BUS_DIR")
+if CACHE_BUS_DIR is None:
+    _database = zlib.crc32(DATABASE_URL.encode())
+    CACHE_BUS_DIR = (
+        os.path.join(
+            tempfile.gettempdir(), f"todo-api-bus-{os.getuid()}-{_database:08x}"
+        )
+        # the memory backend shares no data between workers
+        if STORAGE_BACKEND == "db"
+        else ""
+    )
+
+# worker processes the server runs, read by uvicorn and gunicorn as their
+# default; only used to warn when several run with the bus turned off
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# seconds a resource version is trusted: without the bus, the longest a write
+# made by another worker can go unseen by conditional GETs; 0 never expires,
+# the default with the bus (or a single worker), where an expired version only
+# makes a worker's tags differ from the others' until the next write
+ETAG_VERSION_TTL = float(
+    os.getenv("ETAG_VERSION_TTL", "0" if CACHE_BUS_DIR else "10")
 )
 
+# tables and rows whose version is kept, least recently used dropped first
+ETAG_VERSION_CACHE_SIZE = int(os.getenv("ETAG_VERSION_CACHE_SIZE", "100000"))
+
+####################################
+# Todo cache
+####################################
+
+# todo reads kept in memory by the todo service, least recently used dropped
+# first; 0 disables it
+TODO_CACHE_SIZE = int(os.getenv("TODO_CACHE_SIZE", "10000"))
+
+# listings longer than this are read from the database every time
+TODO_CACHE_MAX_ROWS = int(os.getenv("TODO_CACHE_MAX_ROWS", "1000"))
+
+####################################
+# Responses
+####################################
+
+# serialize every router's responses with `FastJSONRoute` (the todo router
+# always does)
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "False").lower() == "true"
+
 ####################################
 # ENV (dev, test, prod)
 ####################################
@@ -107,16 +257,31 @@ ENV: EnvType = os.getenv("ENV", "dev")
 PACKAGE_DATA: dict[PackageData, str]
 
 FROM_INIT_PY: bool = os.getenv("FROM_INIT_PY", "False").lower() == "true"
-if FROM_INIT_PY:
-    PACKAGE_DATA = {"version": importlib.metadata.version("fastapi-react")}
-else:
-    try:
-        PACKAGE_DATA = json.loads((BASE_DIR / "package.json").read_text())
-    except Exception:
-        PACKAGE_DATA = {"version": "0.0.0"}
+with phase("env.package_data"):
+    if FROM_INIT_PY:
+        PACKAGE_DATA = {"version": importlib.metadata.version("fastapi-react")}
+    else:
+        try:
+            PACKAGE_DATA = json.loads((BASE_DIR / "package.json").read_text())
+        except Exception:
+            PACKAGE_DATA = {"version": "0.0.0"}
 
 VERSION = PACKAGE_DATA["version"]
 
+# log the time spent in each startup phase once the app is ready, see
+# `src.core.startup`
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "False").lower() == "true"
+
+# serve the Prometheus metrics on `/metrics`
+ENABLE_METRICS = os.getenv("ENABLE_METRICS", "True").lower() == "true"
+
+# directory where the workers of one host share their metrics, so that any of
+# them answers a scrape for all; empty serves the metrics of the scraped
+# worker only (single worker)
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+# seconds between two writes of a worker's metrics to METRICS_DIR
+METRICS_WRITE_INTERVAL = float(os.getenv("METRICS_WRITE_INTERVAL", "5"))
+
 
 ####################################
 # BACKEND_AUTH (Required for security)
@@ -135,6 +300,30 @@ BYPASS_MODEL_ACCESS_CONTROL = (
     os.environ.get("BYPASS_MODEL_ACCESS_CONTROL", "False").lower() == "true"
 )
 
+# bcrypt runs on a process pool, at most PASSWORD_HASH_CONCURRENCY jobs at once
+PASSWORD_HASH_WORKERS = int(
+    os.environ.get("PASSWORD_HASH_WORKERS", str(max((os.cpu_count() or 2) // 2, 1)))
+)
+PASSWORD_HASH_CONCURRENCY = int(
+    os.environ.get("PASSWORD_HASH_CONCURRENCY", str(PASSWORD_HASH_WORKERS * 2))
+)
+# seconds a signin/signup may wait for a hashing slot, -1 waits forever
+PASSWORD_HASH_QUEUE_TIMEOUT = float(
+    os.environ.get("PASSWORD_HASH_QUEUE_TIMEOUT", "5")
+)
+
+# authenticated users kept in memory by `get_current_user`, 0 disables it
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.environ.get("PRINCIPAL_CACHE_TTL", "60"))
+
+# API key digest -> user resolver used for `sk-` tokens, 0 disables it
+API_KEY_CACHE_SIZE = int(os.environ.get("API_KEY_CACHE_SIZE", "10000"))
+API_KEY_CACHE_TTL = float(os.environ.get("API_KEY_CACHE_TTL", "60"))
+
+# `last_active_at` writes are buffered and flushed in bulk
+LAST_ACTIVE_FLUSH_INTERVAL = float(os.environ.get("LAST_ACTIVE_FLUSH_INTERVAL", "5"))
+LAST_ACTIVE_FLUSH_SIZE = int(os.environ.get("LAST_ACTIVE_FLUSH_SIZE", "500"))
+
 
 ####################################
 # BACKEND_SECRET_KEY
@@ -0,0 +1,159 @@
+"""
+Strong ETags from in-process versions of tables and rows.
+
+A version is an opaque tag handed out on first read and replaced by every
+write, after it committed, so the next read gets a new one. Readers take the
+version *before* reading, so a tag never outlives the data it was computed
+for. The same versions validate the todo service cache.
+
+Versions start with whether a read or a write made them and the time they
+were made on the host's monotonic clock, then a random per-process epoch: tags
+from another worker or from before a restart never match by accident. With
+`CACHE_BUS_DIR` set, the default with the database backend, the workers of a
+host send each other the version made by every write (see `bus`). A worker
+keeps the newest written version it knows, and any of them over one its own
+reads made, so after its first write a resource has the same tag in every
+worker and clients polling through any of them get their 304s. Until then,
+and after a version is evicted, each worker hands out its own.
+
+Without the bus, writes made by another worker go unseen until the version
+expires after `ETAG_VERSION_TTL` seconds, which bounds how long a client can
+be told 304 for a changed resource.
+"""
+
+import itertools
+import secrets
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional
+import zlib
+
+from fastapi import Request, Response, status
+
+from src.common.cache import TTLCache
+from .env import ETAG_VERSION_CACHE_SIZE, ETAG_VERSION_TTL
+
+CACHE_CONTROL = "private, no-cache"
+
+# first letter of a version, after what made it
+READ, WRITE = "r", "w"
+
+
+def _made_at(version: str) -> int:
+    return int(version[1:].split(".", 1)[0], 16)
+
+
+def _replaces(version: str, held: Optional[str]) -> bool:
+    """Whether the written `version` is newer than `held`."""
+    if held is None or not held.startswith(WRITE):
+        # made by a read, which knows nothing of writes
+        return True
+    return _made_at(version) >= _made_at(held)
+
+
+class VersionTracker:
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.epoch = secrets.token_hex(4)
+        self._counter = itertools.count(1)
+        # (table, key) -> version, key None for the whole table
+        self._versions: TTLCache[tuple[str, Any], str] = TTLCache(maxsize, ttl)
+        # orders the check and the update of a version against each other
+        self._lock = threading.Lock()
+        # told about every local bump, to forward it to the other workers
+        self.on_bump: Optional[Callable[[str, tuple[Hashable, ...], str], None]] = None
+        # table -> callbacks told about every bump of it, local or not
+        self._watchers: dict[
+            str, list[Callable[[Optional[tuple[Hashable, ...]]], None]]
+        ] = {}
+
+    def watch(
+        self, table: str, callback: Callable[[Optional[tuple[Hashable, ...]]], None]
+    ) -> None:
+        """
+        Call `callback(keys)` for every bump of `table`, in any worker, and
+        `callback(None)` when every version is dropped by `reset`.
+        """
+        self._watchers.setdefault(table, []).append(callback)
+
+    def _new_version(self, made_by: str) -> str:
+        # the monotonic clock is shared by the processes of a host
+        made_at = time.monotonic_ns()
+        return f"{made_by}{made_at:x}.{self.epoch}.{next(self._counter)}"
+
+    def _get(self, key: tuple[str, Any]) -> str:
+        version = self._versions.get(key)
+        if version is None:
+            with self._lock:
+                version = self._versions.get(key)
+                if version is None:
+                    version = self._new_version(READ)
+                    self._versions.set(key, version)
+        return version
+
+    def table(self, table: str) -> str:
+        """Version of every row of `table`."""
+        return self._get((table, None))
+
+    def row(self, table: str, key: Hashable) -> str:
+        return self._get((table, key))
+
+    def bump(self, table: str, *keys: Hashable) -> None:
+        """New version of `table` and its rows `keys`, after the write committed."""
+        version = self._new_version(WRITE)
+        self.adopt(table, keys, version)
+        if self.on_bump is not None:
+            self.on_bump(table, keys, version)
+
+    def adopt(self, table: str, keys: tuple[Hashable, ...], version: str) -> None:
+        """
+        `bump` with the `version` made by any worker. It replaces any version
+        made by a read, which may predate the write, but not a newer written
+        one: it was made before that, so before the write it stands for.
+        """
+        with self._lock:
+            for key in ((table, None), *((table, key) for key in keys)):
+                held = self._versions.get(key)
+                if _replaces(version, held):
+                    self._versions.set(key, version)
+        for callback in self._watchers.get(table, ()):
+            callback(keys)
+
+    def reset(self) -> None:
+        """Forget every version, for a worker that may have missed some bumps."""
+        with self._lock:
+            self._versions.clear()
+        for callbacks in self._watchers.values():
+            for callback in callbacks:
+                callback(None)
+
+
+versions = VersionTracker(ETAG_VERSION_CACHE_SIZE, ETAG_VERSION_TTL)
+
+
+def make_etag(version: str, variant: str = "") -> str:
+    """Strong ETag of `version`; `variant` tells apart the URLs sharing it."""
+    if variant:
+        return f'"{version}.{zlib.crc32(variant.encode()):08x}"'
+    return f'"{version}"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
+
+
+def conditional(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    `304 Not Modified` if the client already holds `etag`, else None after
+    setting it on `response` for the handler to fill in.
+    """
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,434 @@
+"""
+In-process metrics, exposed in the Prometheus text format on `/metrics`.
+
+Each uvicorn worker keeps its own registry, and a scrape reaches whichever
+worker accepts it. With `METRICS_DIR` set, every worker writes a snapshot of
+its registry there every `METRICS_WRITE_INTERVAL`, and the scraped one answers
+with all of them: counters and histograms summed, gauges per `worker` (pid),
+those of exited workers left out. Without it, only the scraped worker's
+samples are served, labelled with its `worker`: run a single worker.
+
+Updates only take the lock of the metric being updated for a dict update, and
+gauges that mirror existing stats (pools, caches) are read at scrape time by
+collectors instead of being kept up to date on the hot path.
+"""
+
+import asyncio
+import bisect
+from collections import defaultdict
+import functools
+import inspect
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+
+from src.common.misc import if_error_return
+
+from .env import METRICS_DIR, METRICS_WRITE_INTERVAL, SRC_LOG_LEVELS
+from .query_stats import service_method
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0
+)
+
+type LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterable[tuple[str, LabelValues, tuple[str, ...], float]]:
+        """`(name suffix, label values, extra label pairs, value)` per sample."""
+        raise NotImplementedError
+
+    def snapshot(self) -> dict[str, Any]:
+        """JSON-ready copy, with samples as `[suffix, names, values, value]`."""
+        return {
+            "help": self.help,
+            "kind": self.kind,
+            "samples": [
+                [suffix, [*self.labels, *extra[::2]], [*values, *extra[1::2]], value]
+                for suffix, values, extra, value in self.samples()
+            ],
+        }
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[LabelValues, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", key, (), value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", key, (), value
+
+
+class ObservedCounter(Gauge):
+    """Counter whose value is kept elsewhere and copied in by a collector."""
+
+    kind = "counter"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: [count per bucket (+Inf last), sum]
+        self._values: dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            data[0][index] += 1
+            data[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                yield "_bucket", key, ("le", _format_value(bound)), cumulative
+            yield "_sum", key, (), total
+            yield "_count", key, (), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register[M: Metric](self, metric: M) -> M:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def observed_counter(
+        self, name: str, help: str, labels: tuple[str, ...] = ()
+    ) -> ObservedCounter:
+        return self.register(ObservedCounter(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collector(self, f: Callable[[], None]) -> Callable[[], None]:
+        """Register `f` to refresh gauges right before each scrape."""
+        self._collectors.append(f)
+        return f
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        for collect in self._collectors:
+            collect()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def render(self) -> str:
+        return _render({str(os.getpid()): self.snapshot()}, aggregate=False)
+
+
+def _render(snapshots: dict[str, dict[str, dict]], aggregate: bool) -> str:
+    """
+    Text format of the snapshots of each worker: summed when `aggregate`,
+    except gauges which, like every sample otherwise, get a `worker` label.
+    """
+    merged: dict[str, tuple[dict, dict[tuple, float]]] = {}
+    for worker, snapshot in snapshots.items():
+        for name, metric in snapshot.items():
+            _, samples = merged.setdefault(name, (metric, {}))
+            per_worker = not aggregate or metric["kind"] == "gauge"
+            for suffix, names, values, value in metric["samples"]:
+                if per_worker:
+                    names, values = [*names, "worker"], [*values, worker]
+                key = (suffix, tuple(names), tuple(values))
+                samples[key] = samples.get(key, 0.0) + value
+
+    lines = []
+    for name, (metric, samples) in merged.items():
+        lines += [f"# HELP {name} {metric['help']}", f"# TYPE {name} {metric['kind']}"]
+        for (suffix, names, values), value in samples.items():
+            lines.append(
+                f"{name}{suffix}{_format_labels(names, values)} {_format_value(value)}"
+            )
+    return "\n".join(lines) + "\n"
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedRegistry(Registry):
+    """
+    Registry whose snapshots are written to `directory`, and rendered with
+    those of the other workers that write there.
+    """
+
+    def __init__(self, directory: str, interval: float):
+        super().__init__()
+        self.directory = Path(directory)
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def write(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # the pid of the worker, not of the process that imported this module
+        path = self.directory / f"{os.getpid()}.json"
+        partial = path.with_suffix(".tmp")
+        partial.write_text(json.dumps(self.snapshot()))
+        # readers never see a half-written snapshot
+        os.replace(partial, path)
+
+    def _read(self) -> dict[str, dict[str, dict]]:
+        snapshots = {}
+        for path in self.directory.glob("*.json"):
+            try:
+                snapshot = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            if not _is_alive(int(path.stem)):
+                # the counts of an exited worker still add up, its gauges do not
+                for name in [n for n, m in snapshot.items() if m["kind"] == "gauge"]:
+                    del snapshot[name]
+            snapshots[path.stem] = snapshot
+        return snapshots
+
+    def render(self) -> str:
+        self.write()
+        return _render(self._read(), aggregate=True)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # the last counts of this worker outlive it
+        self.write()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.write()
+            except OSError as err:
+                log.warning(f"Could not write metrics to {self.directory}: {err}")
+
+
+registry = (
+    SharedRegistry(METRICS_DIR, METRICS_WRITE_INTERVAL) if METRICS_DIR else Registry()
+)
+
+
+####################################
+# HTTP
+####################################
+
+http_requests = registry.counter(
+    "http_requests_total",
+    "HTTP requests by route template and status code.",
+    ("method", "route", "status"),
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route"),
+)
+
+
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request",
+    "DB queries issued by one HTTP request.",
+    ("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+
+
+def observe_request(
+    method: str, route: str, status: int, duration: float, queries: int
+) -> None:
+    http_requests.inc(method=method, route=route, status=status)
+    http_request_duration.observe(duration, method=method, route=route)
+    db_queries_per_request.observe(queries, method=method, route=route)
+
+
+####################################
+# Services
+####################################
+
+service_calls = registry.counter(
+    "db_service_calls_total",
+    "Calls of DB service methods.",
+    ("service", "method"),
+)
+service_errors = registry.counter(
+    "db_service_errors_total",
+    "DB service method calls that raised.",
+    ("service", "method"),
+)
+service_call_duration = registry.histogram(
+    "db_service_call_duration_seconds",
+    "Duration of DB service method calls.",
+    ("service", "method"),
+)
+
+
+def _instrument_method(
+    service: str, method: str, f: Callable[..., Any]
+) -> Callable[..., Any]:
+    labels = {"service": service, "method": method}
+    qualname = f"{service}.{method}"
+
+    def done(start: float, failed: bool) -> None:
+        service_calls.inc(**labels)
+        service_call_duration.observe(time.perf_counter() - start, **labels)
+        if failed:
+            service_errors.inc(**labels)
+
+    if inspect.iscoroutinefunction(f):
+
+        @functools.wraps(f)
+        async def wrapper(*args, **kwargs):
+            start, failed = time.perf_counter(), True
+            token = service_method.set(qualname)
+            try:
+                result = await f(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                service_method.reset(token)
+                done(start, failed)
+
+    else:
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            start, failed = time.perf_counter(), True
+            token = service_method.set(qualname)
+            try:
+                result = f(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                service_method.reset(token)
+                done(start, failed)
+
+    return wrapper
+
+
+def instrument[C: type](cls: C, name: Optional[str] = None) -> C:
+    """
+    Class decorator recording calls, errors and duration of every public
+    method defined on `cls` under `service=<name or class name>`.
+    """
+    service = name or cls.__name__
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith("_") or not inspect.isfunction(value):
+            continue
+        if hasattr(value, "error_return"):
+            # beneath `if_error_return`, which turns the errors into a value
+            method = _instrument_method(service, attr, value.__wrapped__)
+            setattr(cls, attr, if_error_return(value.error_return)(method))
+        else:
+            setattr(cls, attr, _instrument_method(service, attr, value))
+    return cls
@@ -0,0 +1,326 @@
+"""
+Versioned schema migrations.
+
+Apply them once per deploy with `python -m src.core.migrate`, or let the app
+lifespan do it when `DB_AUTO_MIGRATE` is on. Concurrent runners serialize on a
+MySQL named lock, or on the write lock of a SQLite database, so several
+workers starting together migrate exactly once.
+
+The migrations are the only definition of the schema: the services run plain
+SQL against it, there are no ORM table classes to keep in sync.
+
+This module only talks to the server through its own connection, importing it
+never touches the app engine (which needs the schema to exist).
+"""
+
+import argparse
+from contextlib import contextmanager
+import hashlib
+import logging
+import time
+import sqlite3
+from typing import Any, Callable, Iterator, NamedTuple, Optional
+from urllib.parse import urlparse, urlunparse
+
+from ormlambda import create_engine
+
+from . import sqlite
+from .env import (
+    DATABASE_URL,
+    DB_DIALECT,
+    DB_MIGRATE_LOCK_TIMEOUT,
+    SRC_LOG_LEVELS,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["DB"])
+
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+AUTO_INCREMENT_ID = {
+    "mysql": "INT NOT NULL AUTO_INCREMENT PRIMARY KEY",
+    "sqlite": "INTEGER PRIMARY KEY AUTOINCREMENT",
+}[DB_DIALECT]
+
+
+class MigrationLockError(Exception):
+    """Raised when another process held the migration lock for too long."""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Any], None]
+
+
+####################################
+# Helpers
+####################################
+
+# MySQL has no CREATE INDEX IF NOT EXISTS
+
+
+def index_exists(cursor, table: str, name: str) -> bool:
+    if DB_DIALECT == "sqlite":
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master "
+            "WHERE type = 'index' AND tbl_name = %s AND name = %s",
+            (table, name),
+        )
+    else:
+        cursor.execute(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s "
+            "LIMIT 1",
+            (table, name),
+        )
+    return cursor.fetchone() is not None
+
+
+def create_index(cursor, table: str, name: str, columns: list[str]) -> None:
+    if not index_exists(cursor, table, name):
+        cursor.execute(f"CREATE INDEX {name} ON `{table}` ({', '.join(columns)})")
+
+
+####################################
+# Migrations
+####################################
+
+# Each migration must be safe to re-run: MySQL commits DDL implicitly, so a
+# migration interrupted halfway is applied again from the start. Column types
+# are the MySQL ones, SQLite accepts them as they are.
+
+
+def _create_core_tables(cursor) -> None:
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS `auth` ("
+        "id CHAR(36) NOT NULL PRIMARY KEY, "
+        "email VARCHAR(255), "
+        "password VARCHAR(255), "
+        "active INT)"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS `user` ("
+        "id CHAR(36) NOT NULL PRIMARY KEY, "
+        "name VARCHAR(100), "
+        "email VARCHAR(100), "
+        "role VARCHAR(100), "
+        "profile_image_url VARCHAR(100), "
+        "last_active_at INT, "
+        "updated_at INT, "
+        "created_at INT, "
+        "api_key VARCHAR(40) UNIQUE, "
+        "settings VARCHAR(100), "
+        "info VARCHAR(100))"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS `todo` ("
+        f"id {AUTO_INCREMENT_ID}, "
+        "item VARCHAR(100))"
+    )
+
+
+def _create_refresh_token_table(cursor) -> None:
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS `refresh_token` ("
+        "id CHAR(64) NOT NULL PRIMARY KEY, "
+        "user_id CHAR(36), "
+        "family_id CHAR(36), "
+        "expires_at INT, "
+        "revoked INT)"
+    )
+    # revocation by user (password change, deletion) and by family (reuse)
+    create_index(cursor, "refresh_token", "idx_refresh_token_user_id", ["user_id"])
+    create_index(
+        cursor, "refresh_token", "idx_refresh_token_family_id", ["family_id"]
+    )
+
+
+def _create_api_key_table(cursor) -> None:
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS `api_key` ("
+        "id CHAR(64) NOT NULL PRIMARY KEY, "
+        "user_id CHAR(36) UNIQUE, "
+        "created_at INT)"
+    )
+
+
+def _create_user_keyset_index(cursor) -> None:
+    # keyset pagination of `/user/` walks this index
+    create_index(cursor, "user", "idx_user_created_at_id", ["created_at", "id"])
+
+
+def _move_api_keys_to_digests(cursor) -> None:
+    # `user.api_key` held the keys themselves: keep only their digest, the
+    # same one `hash_api_key` computes
+    cursor.execute("SELECT id, api_key FROM `user` WHERE api_key IS NOT NULL")
+    keys = cursor.fetchall()
+    now = int(time.time())
+    for user_id, api_key in keys:
+        cursor.execute("DELETE FROM api_key WHERE user_id = %s", (user_id,))
+        cursor.execute(
+            "INSERT INTO api_key (id, user_id, created_at) VALUES (%s, %s, %s)",
+            (hashlib.sha256(api_key.encode()).hexdigest(), user_id, now),
+        )
+    cursor.execute("UPDATE `user` SET api_key = NULL WHERE api_key IS NOT NULL")
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "create auth, user and todo tables", _create_core_tables),
+    Migration(2, "create refresh_token table", _create_refresh_token_table),
+    Migration(3, "create api_key table", _create_api_key_table),
+    Migration(4, "index user on created_at, id", _create_user_keyset_index),
+    Migration(5, "move api keys to digests", _move_api_keys_to_digests),
+]
+
+
+####################################
+# Runner
+####################################
+
+
+def _create_migrations_table(cursor) -> None:
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS `{MIGRATIONS_TABLE}` ("
+        "version INT NOT NULL PRIMARY KEY, "
+        "name VARCHAR(255), "
+        "applied_at INT)"
+    )
+
+
+@contextmanager
+def _mysql_locked_cursor() -> Iterator[Any]:
+    url = urlparse(DATABASE_URL)
+    database = url.path.lstrip("/")
+    lock_name = f"{database}.migrate"
+    # a server connection: the schema may not exist yet
+    server = create_engine(
+        urlunparse(url._replace(scheme="mysql", path="", query="pool_size=1"))
+    )
+    try:
+        with server.repository.get_connection() as cnx:
+            cnx.autocommit = True
+            cursor = cnx.cursor()
+            try:
+                timeout = DB_MIGRATE_LOCK_TIMEOUT
+                cursor.execute("SELECT GET_LOCK(%s, %s)", (lock_name, timeout))
+                (locked,) = cursor.fetchone()
+                if locked != 1:
+                    raise MigrationLockError(
+                        f"Timed out after {timeout}s waiting for lock '{lock_name}'"
+                    )
+                try:
+                    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{database}`")
+                    cursor.execute(f"USE `{database}`")
+                    _create_migrations_table(cursor)
+                    yield cursor
+                finally:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
+                    cursor.fetchone()
+            finally:
+                cursor.close()
+    finally:
+        # the pool keeps the connection open once given back, and this engine
+        # is not used again (mysql-connector pools have no public close)
+        server.repository._pool._remove_connections()
+
+
+@contextmanager
+def _sqlite_locked_cursor() -> Iterator[Any]:
+    # SQLite DDL is transactional: the whole run commits or leaves no trace
+    timeout = DB_MIGRATE_LOCK_TIMEOUT
+    cnx = sqlite.connect(sqlite.database_path(DATABASE_URL), timeout)
+    cursor = cnx.cursor()
+    try:
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            raise MigrationLockError(
+                f"Timed out after {timeout}s waiting for the database write lock"
+            ) from e
+        try:
+            _create_migrations_table(cursor)
+            yield cursor
+            cnx.commit()
+        except BaseException:
+            cnx.rollback()
+            raise
+    finally:
+        cursor.close()
+        cnx.close()
+
+
+def _locked_cursor():
+    """Cursor on the app schema, holding the migration lock."""
+    if DB_DIALECT == "sqlite":
+        return _sqlite_locked_cursor()
+    return _mysql_locked_cursor()
+
+
+def _applied_versions(cursor) -> set[int]:
+    cursor.execute(f"SELECT version FROM `{MIGRATIONS_TABLE}`")
+    return {version for (version,) in cursor.fetchall()}
+
+
+def migrate(target: Optional[int] = None) -> list[int]:
+    """Apply pending migrations up to `target` (all by default), in order."""
+    applied: list[int] = []
+    with _locked_cursor() as cursor:
+        done = _applied_versions(cursor)
+        for migration in MIGRATIONS:
+            if migration.version in done:
+                continue
+            if target is not None and migration.version > target:
+                break
+
+            log.info(f"Applying migration {migration.version}: {migration.name}")
+            start = time.perf_counter()
+            migration.apply(cursor)
+            cursor.execute(
+                f"INSERT INTO `{MIGRATIONS_TABLE}` (version, name, applied_at) "
+                "VALUES (%s, %s, %s)",
+                (migration.version, migration.name, int(time.time())),
+            )
+            log.info(
+                f"Applied migration {migration.version} "
+                f"in {time.perf_counter() - start:.3f}s"
+            )
+            applied.append(migration.version)
+
+    if not applied:
+        log.info("Schema is up to date")
+    return applied
+
+
+def status() -> list[tuple[Migration, bool]]:
+    with _locked_cursor() as cursor:
+        done = _applied_versions(cursor)
+    return [(migration, migration.version in done) for migration in MIGRATIONS]
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.core.migrate", description="Apply schema migrations."
+    )
+    parser.add_argument(
+        "command", nargs="?", default="up", choices=["up", "status"]
+    )
+    parser.add_argument(
+        "--target", type=int, default=None, help="last version to apply"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        for migration, applied in status():
+            mark = "x" if applied else " "
+            print(f"[{mark}] {migration.version:>4}  {migration.name}")
+        return
+
+    applied = migrate(args.target)
+    print(f"Applied {len(applied)} migration(s): {applied}" if applied else "Up to date")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
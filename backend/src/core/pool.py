@@ -0,0 +1,97 @@
+import asyncio
+from contextlib import asynccontextmanager
+import time
+from typing import AsyncIterator, Optional
+
+from pydantic import BaseModel
+
+from src.common.misc import OverloadedError
+
+
+class PoolTimeoutError(OverloadedError):
+    """Raised when no pooled connection became free within the pool timeout."""
+
+
+class PoolStats(BaseModel):
+    size: int
+    max_overflow: int
+    in_use: int
+    # slots of `size` not in use, not a count of open idle connections
+    available: int
+    overflow: int
+    waiting: int
+    acquisitions: int
+    timeouts: int
+    wait_time_total: float
+    wait_time_max: float
+    wait_time_avg: float
+
+
+class PoolGate:
+    """
+    Admission control in front of a connection pool.
+
+    Allows at most `size + max_overflow` concurrent checkouts, makes callers
+    wait at most `timeout` seconds for a slot and keeps the counters needed to
+    size the pool from real traffic.
+    """
+
+    def __init__(self, size: int, max_overflow: int = 0, timeout: float = 30):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout: Optional[float] = timeout if timeout >= 0 else None
+
+        self._semaphore = asyncio.Semaphore(size + max_overflow)
+        self.in_use = 0
+        self.waiting = 0
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return self.size + self.max_overflow
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[None]:
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except TimeoutError:
+            self.timeouts += 1
+            raise PoolTimeoutError(
+                f"Timed out after {self.timeout}s waiting for a database connection"
+            )
+        finally:
+            self.waiting -= 1
+
+        waited = time.perf_counter() - start
+        self.acquisitions += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+
+        self.in_use += 1
+        try:
+            yield
+        finally:
+            self.in_use -= 1
+            self._semaphore.release()
+
+    def stats(self) -> PoolStats:
+        return PoolStats(
+            size=self.size,
+            max_overflow=self.max_overflow,
+            in_use=self.in_use,
+            available=max(self.size - self.in_use, 0),
+            overflow=max(self.in_use - self.size, 0),
+            waiting=self.waiting,
+            acquisitions=self.acquisitions,
+            timeouts=self.timeouts,
+            wait_time_total=self.wait_time_total,
+            wait_time_max=self.wait_time_max,
+            wait_time_avg=(
+                self.wait_time_total / self.acquisitions if self.acquisitions else 0.0
+            ),
+        )
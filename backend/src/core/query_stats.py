@@ -0,0 +1,166 @@
+"""
+Per-request query accounting.
+
+Every statement sent through the `db` helpers (via `instrument_repository`)
+or the async engine is recorded in the `QueryStats` of the current request:
+
+- the number of queries and the time spent in them, reported on the
+  `Server-Timing` header and in the `db_queries_per_request` histogram;
+- statements slower than `DB_SLOW_QUERY_MS` are logged with the route and
+  the service method that issued them;
+- in dev, a request issuing more than `DB_QUERY_BUDGET` queries logs a warning
+  with its most repeated statement, the usual sign of an N+1 loop.
+
+The stats live in a context variable; `run_in_db` runs its function in a copy
+of the caller's context so the executor threads report to the same request.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import threading
+from time import perf_counter_ns
+from typing import Any, Iterator, Optional
+
+from .env import DB_SLOW_QUERY_MS, DB_QUERY_BUDGET, ENV, SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["DB"])
+
+SLOW_QUERY_NS = DB_SLOW_QUERY_MS * 1_000_000 if DB_SLOW_QUERY_MS >= 0 else None
+# statements are only tallied when the budget is checked
+QUERY_BUDGET = DB_QUERY_BUDGET if ENV == "dev" and DB_QUERY_BUDGET > 0 else None
+
+
+class QueryStats:
+    __slots__ = ("scope", "count", "time_ns", "statements", "_lock")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.count = 0
+        self.time_ns = 0
+        self.statements: Optional[Counter[str]] = (
+            Counter() if QUERY_BUDGET is not None else None
+        )
+        # statements of one request may run on several executor threads
+        self._lock = threading.Lock()
+
+    @property
+    def route(self) -> str:
+        # the route template once routing is done, the raw path before
+        route = getattr(self.scope.get("route"), "path", None) or self.scope["path"]
+        return f"{self.scope['method']} {route}"
+
+    def add(self, statement: str, elapsed_ns: int) -> None:
+        with self._lock:
+            self.count += 1
+            self.time_ns += elapsed_ns
+            if self.statements is not None:
+                self.statements[statement] += 1
+
+    def check_budget(self) -> None:
+        if QUERY_BUDGET is None or self.count <= QUERY_BUDGET:
+            return
+        statement, repeated = self.statements.most_common(1)[0]
+        log.warning(
+            f"{self.route} issued {self.count} queries in {self.time_ns / 1e6:.1f} ms "
+            f"(budget {QUERY_BUDGET}), "
+            f"most repeated ({repeated}x): {_shorten(statement)}"
+        )
+
+
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "query_stats", default=None
+)
+# `Class.method` of the service method being run, set by `metrics.instrument`
+service_method: ContextVar[Optional[str]] = ContextVar("service_method", default=None)
+
+
+def _shorten(statement: str, size: int = 500) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= size else f"{statement[:size]}..."
+
+
+def _statement(operation: Any) -> str:
+    if isinstance(operation, bytes):
+        return operation.decode(errors="replace")
+    return str(operation)
+
+
+@contextmanager
+def record_query(operation: Any) -> Iterator[None]:
+    start = perf_counter_ns()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter_ns() - start
+        stats = query_stats.get()
+        statement = _statement(operation)
+        if stats is not None:
+            stats.add(statement, elapsed)
+        if SLOW_QUERY_NS is not None and elapsed >= SLOW_QUERY_NS:
+            route = stats.route if stats is not None else "-"
+            log.warning(
+                f"Slow query ({elapsed / 1e6:.1f} ms) on {route} "
+                f"in {service_method.get() or '-'}: {_shorten(statement)}"
+            )
+
+
+####################################
+# Engine instrumentation
+####################################
+
+
+class _RecordingCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, *args, **kwargs):
+        with record_query(operation):
+            return self._cursor.execute(operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        with record_query(operation):
+            return self._cursor.executemany(operation, *args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+
+class _RecordingConnection:
+    def __init__(self, cnx):
+        self._cnx = cnx
+
+    def cursor(self, *args, **kwargs) -> _RecordingCursor:
+        return _RecordingCursor(self._cnx.cursor(*args, **kwargs))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cnx, name)
+
+
+def instrument_repository(repository) -> None:
+    """
+    Record the statements of every cursor opened from `repository`.
+
+    The `db` helpers and the ormlambda repository methods get their connection
+    from `repository.get_connection()`, so shadowing it on the instance covers
+    every statement, whichever the dialect.
+    """
+    get_connection = repository.get_connection
+
+    @contextmanager
+    def recording_connection(*args, **kwargs):
+        with get_connection(*args, **kwargs) as cnx:
+            yield _RecordingConnection(cnx)
+
+    repository.get_connection = recording_connection
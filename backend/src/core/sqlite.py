@@ -0,0 +1,158 @@
+"""
+Embedded SQLite database for `sqlite://` DATABASE_URLs.
+
+Connections speak the part of the mysql-connector API used by the `db`
+helpers and the migration runner (`%s` placeholders, `cursor(dictionary=True)`,
+cursors as context managers, `commit`/`rollback`/`ping`), so the services run
+the same statements on both databases.
+
+Every connection is in autocommit mode with a WAL journal: readers never block
+the single writer, and `transaction()` starts with `BEGIN IMMEDIATE` to take
+the write lock up front instead of failing to upgrade a read lock later.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Any, Iterator, Optional
+from urllib.parse import unquote, urlparse
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    # with WAL, only a power loss can drop the last commits, never corrupt
+    "synchronous": "NORMAL",
+    # 64 MiB page cache per connection
+    "cache_size": -64 * 1024,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+
+def database_path(url: str) -> str:
+    """
+    File of `sqlite:///relative/app.db` or `sqlite:////absolute/app.db`.
+
+    In-memory databases are rejected: each connection would get its own
+    empty one. Use `STORAGE_BACKEND=memory` instead.
+    """
+    path = unquote(urlparse(url).path)
+    # the first slash separates the empty host from the path
+    path = path[1:] if path.startswith("/") else path
+    if path in ("", ":memory:"):
+        raise ValueError(
+            f"'{url}' is not a SQLite database file, use STORAGE_BACKEND=memory "
+            "for an in-memory store"
+        )
+    return path
+
+
+class Cursor:
+    def __init__(self, cursor: sqlite3.Cursor, dictionary: bool = False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self) -> Optional[int]:
+        return self._cursor.lastrowid
+
+    def execute(self, operation: str, params: Any = ()) -> None:
+        self._cursor.execute(operation.replace("%s", "?"), tuple(params))
+
+    def executemany(self, operation: str, seq_params: Any) -> None:
+        self._cursor.executemany(
+            operation.replace("%s", "?"), [tuple(params) for params in seq_params]
+        )
+
+    def _row(self, row: Optional[tuple]) -> Any:
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip((column[0] for column in self._cursor.description), row))
+
+    def fetchone(self) -> Any:
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self) -> list:
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self) -> None:
+        self._cursor.close()
+
+    def __iter__(self):
+        return (self._row(row) for row in self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Connection:
+    def __init__(self, cnx: sqlite3.Connection):
+        self._cnx = cnx
+
+    def cursor(self, dictionary: bool = False) -> Cursor:
+        return Cursor(self._cnx.cursor(), dictionary)
+
+    def commit(self) -> None:
+        if self._cnx.in_transaction:
+            self._cnx.commit()
+
+    def rollback(self) -> None:
+        if self._cnx.in_transaction:
+            self._cnx.rollback()
+
+    def ping(self, reconnect: bool = False) -> None:
+        # a local file, there is no server to lose
+        pass
+
+    def close(self) -> None:
+        self._cnx.close()
+
+
+def connect(path: str, busy_timeout: float) -> Connection:
+    """Open `path`, creating it and its directory if needed."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    cnx = sqlite3.connect(
+        path, timeout=busy_timeout, isolation_level=None, check_same_thread=False
+    )
+    for name, value in PRAGMAS.items():
+        cnx.execute(f"PRAGMA {name} = {value}")
+    return Connection(cnx)
+
+
+class ConnectionPool:
+    """
+    One connection per thread, opened on first use.
+
+    Queries run on the long-lived `db_executor` threads, so this holds at most
+    one connection per worker; `db_gate` already bounds the concurrency.
+    """
+
+    def __init__(self, path: str, busy_timeout: float):
+        self.path = path
+        self._busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: list[Connection] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def get_connection(self) -> Iterator[Connection]:
+        cnx = getattr(self._local, "cnx", None)
+        if cnx is None:
+            cnx = self._local.cnx = connect(self.path, self._busy_timeout)
+            with self._lock:
+                self._connections.append(cnx)
+        yield cnx
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for cnx in connections:
+            cnx.close()
@@ -0,0 +1,123 @@
+"""
+Startup profiling.
+
+`phase` times a named step of the app start. The timings are always collected
+(a couple of `perf_counter` calls per phase) and are logged once the app is
+ready when `STARTUP_PROFILE` is on.
+
+Per-module import cost is reported by `python -m src.core.startup`, which
+imports the app in a fresh interpreter under `python -X importtime`.
+
+Keep this module free of app imports, `src.core.env` times itself with it.
+"""
+
+import argparse
+from contextlib import contextmanager
+from pathlib import Path
+import subprocess
+import sys
+import time
+from typing import Iterator, NamedTuple, Optional
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+
+# first app module to be imported is `src.core.env`, which imports this one
+STARTED_AT = time.perf_counter()
+
+
+class Phase(NamedTuple):
+    name: str
+    started: float  # seconds since STARTED_AT
+    elapsed: float
+
+
+phases: list[Phase] = []
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        phases.append(Phase(name, start - STARTED_AT, end - start))
+
+
+def format_report() -> str:
+    lines = [f"Startup ready in {(time.perf_counter() - STARTED_AT) * 1000:.1f} ms"]
+    for p in sorted(phases, key=lambda p: p.started):
+        lines.append(
+            f"  +{p.started * 1000:8.1f} ms  {p.elapsed * 1000:8.1f} ms  {p.name}"
+        )
+    return "\n".join(lines)
+
+
+####################################
+# Import time
+####################################
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def parse_importtime(output: str) -> list[ImportTime]:
+    """Parse the `-X importtime` lines written to stderr."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header
+        imports.append(
+            ImportTime(fields[2].strip(), int(fields[0]), int(fields[1]))
+        )
+    return imports
+
+
+def measure_imports(module: str = "src.main") -> list[ImportTime]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.core.startup",
+        description="Report the import time of the app, slowest modules first.",
+    )
+    parser.add_argument("--module", default="src.main")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--sort", choices=["cumulative", "self"], default="cumulative")
+    parser.add_argument(
+        "--prefix", default="", help="only show modules starting with this, e.g. src."
+    )
+    args = parser.parse_args(argv)
+
+    imports = measure_imports(args.module)
+    total = sum(i.self_us for i in imports)
+    key = (lambda i: i.self_us) if args.sort == "self" else (lambda i: i.cumulative_us)
+    shown = sorted(
+        (i for i in imports if i.module.startswith(args.prefix)),
+        key=key,
+        reverse=True,
+    )[: args.top]
+
+    print(f"{len(imports)} modules imported in {total / 1000:.1f} ms")
+    print(f"{'self ms':>10} {'cumul. ms':>10}  module")
+    for i in shown:
+        print(f"{i.self_us / 1000:10.1f} {i.cumulative_us / 1000:10.1f}  {i.module}")
+
+
+if __name__ == "__main__":
+    main()
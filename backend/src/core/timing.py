@@ -0,0 +1,214 @@
+"""
+Per-request latency attribution.
+
+`TimingMiddleware` starts a `RequestTimings` for every HTTP request and, when
+the response starts, reports it in a `Server-Timing` header:
+
+    auth;dur=0.412, db;dur=3.120, ser;dur=0.230, app;dur=0.901, total;dur=4.663
+
+`auth`, `db` and `ser` are filled by the code that does that work (`section` /
+`timed`), each section only counts its own time, excluding nested sections,
+and `app` is whatever is left: routing, validation and handler code.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import inspect
+from time import perf_counter_ns
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+from fastapi.routing import APIRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import observe_request
+from .query_stats import QueryStats, query_stats
+
+SECTIONS = ("auth", "db", "ser")
+
+
+class RequestTimings:
+    __slots__ = ("start_ns", "totals", "returned_ns", "_nested")
+
+    def __init__(self):
+        self.start_ns = perf_counter_ns()
+        self.totals: dict[str, int] = dict.fromkeys(SECTIONS, 0)
+        # when the endpoint returned, serialization runs from there
+        self.returned_ns: Optional[int] = None
+        # time spent in the sections nested in each open section
+        self._nested: list[int] = []
+
+    def add(self, name: str, elapsed_ns: int) -> None:
+        self.totals[name] += elapsed_ns
+        if self._nested:
+            self._nested[-1] += elapsed_ns
+
+    def elapsed_ns(self) -> int:
+        return perf_counter_ns() - self.start_ns
+
+    def server_timing(self, total_ns: int, queries: int = 0) -> str:
+        app_ns = max(total_ns - sum(self.totals.values()), 0)
+        entries = [*self.totals.items(), ("app", app_ns), ("total", total_ns)]
+        return ", ".join(
+            f'{name};dur={ns / 1e6:.3f};desc="{queries} queries"'
+            if name == "db"
+            else f"{name};dur={ns / 1e6:.3f}"
+            for name, ns in entries
+        )
+
+
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def section(name: str) -> Iterator[None]:
+    """Count the enclosed time as `name` for the current request, if any."""
+    timings = request_timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = perf_counter_ns()
+    timings._nested.append(0)
+    try:
+        yield
+    finally:
+        elapsed = perf_counter_ns() - start
+        timings.totals[name] += elapsed - timings._nested.pop()
+        if timings._nested:
+            timings._nested[-1] += elapsed
+
+
+def timed[**P, T](
+    name: str,
+) -> Callable[[Callable[P, Awaitable[T]]], Callable[P, Awaitable[T]]]:
+    """`section` for a coroutine function, keeps the signature for `Depends`."""
+
+    def decorator(f: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+        @functools.wraps(f)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            with section(name):
+                return await f(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+####################################
+# Serialization
+####################################
+
+
+def _mark_returned(call: Callable[..., Any]) -> Callable[..., Any]:
+    def mark() -> None:
+        if (timings := request_timings.get()) is not None:
+            timings.returned_ns = perf_counter_ns()
+
+    if inspect.iscoroutinefunction(call):
+
+        @functools.wraps(call)
+        async def endpoint(*args, **kwargs):
+            result = await call(*args, **kwargs)
+            mark()
+            return result
+
+    else:
+
+        @functools.wraps(call)
+        def endpoint(*args, **kwargs):
+            result = call(*args, **kwargs)
+            mark()
+            return result
+
+    return endpoint
+
+
+class TimedRoute(APIRoute):
+    """
+    Route that reports the time from the endpoint's return to the finished
+    response (validation of the return value, JSON encoding) as `ser`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dependant.call = _mark_returned(self.dependant.call)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            timings = request_timings.get()
+            if timings is not None and timings.returned_ns is not None:
+                timings.add("ser", perf_counter_ns() - timings.returned_ns)
+            return response
+
+        return timed_handler
+
+
+####################################
+# Middleware
+####################################
+
+
+class TimingMiddleware:
+    """
+    Plain ASGI middleware: no task or body stream is added per request, the
+    headers are appended to the `http.response.start` message.
+
+    Also records the request in the `/metrics` route latency histogram, by
+    route template so that path parameters don't create new series.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # read by the API key authentication
+        scope.setdefault("state", {})["enable_api_key"] = scope[
+            "app"
+        ].state.config.ENABLE_API_KEY
+
+        timings = RequestTimings()
+        queries = QueryStats(scope)
+        token = request_timings.set(timings)
+        queries_token = query_stats.set(queries)
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total_ns = timings.elapsed_ns()
+                headers = list(message.get("headers", []))
+                headers.append(
+                    (
+                        b"server-timing",
+                        timings.server_timing(total_ns, queries.count).encode(),
+                    )
+                )
+                headers.append((b"x-process-time", f"{total_ns / 1e9:.6f}".encode()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
+            query_stats.reset(queries_token)
+            route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+            observe_request(
+                scope["method"],
+                route,
+                status,
+                timings.elapsed_ns() / 1e9,
+                queries.count,
+            )
+            queries.check_budget()
@@ -1,6 +1,5 @@
 from typing import Optional
-from pydantic import BaseModel
-from ormlambda import Table, Column, VARCHAR,INT, CHAR
+from pydantic import BaseModel, ConfigDict
 
 
 ####################
@@ -8,15 +7,6 @@ from ormlambda import Table, Column, VARCHAR,INT, CHAR
 ####################
 
 
-class Auth(Table):
-    __table_name__ = "auth"
-
-    id: Column[CHAR] = Column(CHAR(36), is_primary_key=True)
-    email: Column[VARCHAR] = Column(VARCHAR(255))
-    password: Column[VARCHAR] = Column(VARCHAR(255))
-    active: Column[INT] = Column(INT())
-
-
 class AuthModel(BaseModel):
     id: str
     email: str
@@ -24,6 +14,16 @@ class AuthModel(BaseModel):
     active: bool = True
 
 
+class RefreshTokenModel(BaseModel):
+    id: str
+    user_id: str
+    family_id: str
+    expires_at: int
+    revoked: bool = False
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 ####################
 # Forms
 ####################
@@ -34,6 +34,17 @@ class Token(BaseModel):
     token_type: str
 
 
+class Principal(BaseModel):
+    """Authenticated caller as far as authorization needs to know it."""
+
+    id: str
+    email: str
+    name: str
+    role: str
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class ApiKey(BaseModel):
     api_key: Optional[str] = None
 
@@ -49,6 +60,15 @@ class UserResponse(BaseModel):
 class SiginResponse(Token, UserResponse): ...
 
 
+class RefreshForm(BaseModel):
+    refresh_token: Optional[str] = None
+
+
+class RefreshResponse(Token):
+    expires_at: Optional[int] = None
+    refresh_token: str
+
+
 class SigninForm(BaseModel):
     email: str
     password: str
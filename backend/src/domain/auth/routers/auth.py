@@ -10,14 +10,18 @@ from src.core.env import (
     BACKEND_AUTH_TRUSTED_NAME_HEADER,
     BACKEND_SESSION_COOKIE_SAME_SITE,
     BACKEND_SESSION_COOKIE_SECURE,
+    API_URI,
 )
 from ..utils import (
+    API_KEY_MASK,
     create_api_key,
     create_access_token,
-    get_password_hash,
+    get_password_hash_async,
+    get_token_claims,
 )
-from ..services.auth_service import get_current_user
+from ..services.auth_service import get_current_user, get_cached_user
 from src.core.constants import ERROR_MESSAGES
+from src.core.routing import AppRoute
 from src.common.misc import validate_email_format
 
 from ..models import (
@@ -25,12 +29,14 @@ from ..models import (
     Token,
     SigninForm,
     SignupForm,
+    RefreshForm,
+    RefreshResponse,
 )
 
-from ..services import Auths
+from ..services import AsyncAuths, AsyncRefreshTokens
 
 from src.common.misc import parse_duration
-from src.domain.user import Users, UserModel, UserResponse
+from src.domain.user import AsyncUsers, UserModel, UserResponse
 
 
 class RouterResponse(BaseModel):
@@ -38,7 +44,7 @@ class RouterResponse(BaseModel):
     password: str
 
 
-router = APIRouter()
+router = APIRouter(route_class=AppRoute)
 
 
 ############################
@@ -49,6 +55,7 @@ GetCurrentUser=  Annotated[UserModel, Depends(get_current_user)]
 
 class SessionUserResponse(Token, UserResponse):
     expires_at: Optional[int] = None
+    refresh_token: Optional[str] = None
     permissions: Optional[dict] = None
 
 
@@ -60,7 +67,7 @@ async def generate_api_key(request: Request, user: GetCurrentUser):
             detail=ERROR_MESSAGES.API_KEY_CREATION_NOT_ALLOWED,
         )
     api_key = create_api_key()
-    success = Users.update_user_api_key_by_id(user.id, api_key)
+    success = await AsyncUsers.update_user_api_key_by_id(user.id, api_key)
 
     if success:
         return {"api_key": api_key}
@@ -72,21 +79,90 @@ async def generate_api_key(request: Request, user: GetCurrentUser):
 
 @router.delete("/api_key", response_model=bool)
 async def delete_api_key(user: GetCurrentUser):
-    return Users.update_user_api_key_by_id(user.id, None)
+    return await AsyncUsers.update_user_api_key_by_id(user.id, None)
 
 
 @router.get("/api_key", response_model=ApiKey)
 async def get_api_key(user: GetCurrentUser):
-    api_key = Users.get_user_api_key_by_id(user.id)
-    if api_key:
+    if await AsyncUsers.has_api_key(user.id):
         return {
-            "api_key": api_key,
+            "api_key": API_KEY_MASK,
         }
     raise HTTPException(
         status.HTTP_404_NOT_FOUND, detail=ERROR_MESSAGES.API_KEY_NOT_FOUND
     )
 
 
+############################
+# Session token
+############################
+
+
+def set_session_token(
+    request: Request, response: Response, user: UserModel
+) -> tuple[str, Optional[int]]:
+    """Create the access token for `user` and store it in the session cookie."""
+    config = request.app.state.config
+
+    if config.JWT_EMBED_CLAIMS:
+        # role checks are answered from the signed claims, so keep them short-lived
+        data = get_token_claims(user)
+        expires_delta = parse_duration(config.JWT_CLAIMS_EXPIRES_IN)
+    else:
+        data = {"id": user.id}
+        expires_delta = parse_duration(config.JWT_EXPIRES_IN)
+
+    expires_at = None
+    if expires_delta:
+        expires_at = int(time.time()) + int(expires_delta.total_seconds())
+
+    token = create_access_token(data=data, expires_delta=expires_delta)
+    datetime_expires_at = (
+        datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc)
+        if expires_at
+        else None
+    )
+
+    # Set the cookie token
+    response.set_cookie(
+        key="token",
+        value=token,
+        expires=datetime_expires_at,
+        httponly=True,  # Ensures the cookie is not accessible via JavaScript
+        samesite=BACKEND_SESSION_COOKIE_SAME_SITE,
+        secure=BACKEND_SESSION_COOKIE_SECURE,
+    )
+    return token, expires_at
+
+
+REFRESH_TOKEN_COOKIE_PATH = f"{API_URI}/auth"
+
+
+def set_refresh_token_cookie(
+    request: Request, response: Response, refresh_token: str
+) -> None:
+    expires_delta = parse_duration(request.app.state.config.JWT_REFRESH_EXPIRES_IN)
+    response.set_cookie(
+        key="refresh_token",
+        value=refresh_token,
+        max_age=int(expires_delta.total_seconds()) if expires_delta else None,
+        path=REFRESH_TOKEN_COOKIE_PATH,
+        httponly=True,
+        samesite=BACKEND_SESSION_COOKIE_SAME_SITE,
+        secure=BACKEND_SESSION_COOKIE_SECURE,
+    )
+
+
+async def issue_refresh_token(
+    request: Request, response: Response, user: UserModel
+) -> str:
+    refresh_token = await AsyncRefreshTokens.insert_new_refresh_token(
+        user.id, parse_duration(request.app.state.config.JWT_REFRESH_EXPIRES_IN)
+    )
+    set_refresh_token_cookie(request, response, refresh_token)
+    return refresh_token
+
+
 ############################
 # SignIn
 ############################
@@ -107,16 +183,16 @@ async def signin(request: Request, response: Response, form_data: SigninForm):
                 BACKEND_AUTH_TRUSTED_NAME_HEADER, trusted_email
             )
 
-        if not Users.get_user_by_email(trusted_name.lower()):
+        if not await AsyncUsers.get_user_by_email(trusted_name.lower()):
             await signup(request)
 
     elif BACKEND_AUTH is False:
         admin_email = "admin@localhost"
         admin_password = "admin"
-        if Users.get_user_by_email(admin_email):
-            user = Auths.authenticate_user(admin_email, admin_password)
+        if await AsyncUsers.get_user_by_email(admin_email):
+            user = await AsyncAuths.authenticate_user(admin_email, admin_password)
         else:
-            if Users.get_num_users() != 0:
+            if await AsyncUsers.get_num_users() != 0:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail=ERROR_MESSAGES.EXISTING_USERS,
@@ -126,36 +202,19 @@ async def signin(request: Request, response: Response, form_data: SigninForm):
                 response,
                 SignupForm(email=admin_email, password=admin_password, name="User"),
             )
-            user = Auths.authenticate_user(admin_email, admin_password)
+            user = await AsyncAuths.authenticate_user(admin_email, admin_password)
     else:
-        user = Auths.authenticate_user(form_data.email.lower(), form_data.password)
+        user = await AsyncAuths.authenticate_user(
+            form_data.email.lower(), form_data.password
+        )
 
     if not user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail=ERROR_MESSAGES.INVALID_CRED
         )
 
-    expires_delta = parse_duration(request.app.state.config.JWT_EXPIRES_IN)
-    expires_at = None
-    if expires_delta:
-        expires_at = int(time.time()) + int(expires_delta.total_seconds())
-
-    token = create_access_token(data={"id": user.id}, expires_delta=expires_delta)
-    datetime_expires_at = (
-        datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc)
-        if expires_at
-        else None
-    )
-
-    # Set the cookie token
-    response.set_cookie(
-        key="token",
-        value=token,
-        expires=datetime_expires_at,
-        httponly=True,  # Ensures the cookie is not accessible via JavaScript
-        samesite=BACKEND_SESSION_COOKIE_SAME_SITE,
-        secure=BACKEND_SESSION_COOKIE_SECURE,
-    )
+    token, expires_at = set_session_token(request, response, user)
+    refresh_token = await issue_refresh_token(request, response, user)
 
     # user_permissions= get_permissions(
     #     user.id, request.app.state.config.USER_PERMISSIONS
@@ -165,6 +224,7 @@ async def signin(request: Request, response: Response, form_data: SigninForm):
         "token": token,
         "token_type": "Bearer",
         "expires_at": expires_at,
+        "refresh_token": refresh_token,
         "id": user.id,
         "email": user.email,
         "name": user.name,
@@ -189,7 +249,7 @@ async def signup(request: Request, response: Response, form_data: SignupForm):
             )
 
     else:
-        if Users.get_num_users() != 0:
+        if await AsyncUsers.get_num_users() != 0:
             raise HTTPException(
                 status.HTTP_403_FORBIDDEN, detail=ERROR_MESSAGES.ACCESS_PROHIBITED
             )
@@ -199,20 +259,21 @@ async def signup(request: Request, response: Response, form_data: SignupForm):
             status.HTTP_400_BAD_REQUEST, detail=ERROR_MESSAGES.INVALID_EMAIL_FORMAT
         )
 
-    if Users.get_user_by_email(form_data.email.lower()):
+    if await AsyncUsers.get_user_by_email(form_data.email.lower()):
         raise HTTPException(
             status.HTTP_400_BAD_REQUEST, detail=ERROR_MESSAGES.EMAIL_TAKEN
         )
 
+    hashed = await get_password_hash_async(form_data.password)
+
     try:
-        num_users: int = Users.get_num_users()
+        num_users: int = await AsyncUsers.get_num_users()
         role = "admin" if num_users == 0 else request.app.state.config.DEFAULT_USER_ROLE
 
         if num_users == 0:
             request.app.state.config.ENABLE_SIGNUP = False
 
-        hashed = get_password_hash(form_data.password)
-        user = Auths.insert_new_auth(
+        user = await AsyncAuths.insert_new_auth(
             form_data.email.lower(),
             hashed,
             form_data.name,
@@ -226,27 +287,8 @@ async def signup(request: Request, response: Response, form_data: SignupForm):
                 detail=ERROR_MESSAGES.CREATE_USER_ERROR,
             )
 
-        expires_delta = parse_duration(request.app.state.config.JWT_EXPIRES_IN)
-        expires_at = None
-        if expires_delta:
-            expires_at = int(time.time()) + int(expires_delta.total_seconds())
-
-        token = create_access_token(data={"id": user.id}, expires_delta=expires_delta)
-        datetime_expires_at = (
-            datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc)
-            if expires_at
-            else None
-        )
-
-        # Set the cookie token
-        response.set_cookie(
-            key="token",
-            value=token,
-            expires=datetime_expires_at,
-            httponly=True,  # Ensures the cookie is not accessible via JavaScript
-            samesite=BACKEND_SESSION_COOKIE_SAME_SITE,
-            secure=BACKEND_SESSION_COOKIE_SECURE,
-        )
+        token, expires_at = set_session_token(request, response, user)
+        refresh_token = await issue_refresh_token(request, response, user)
 
         if request.app.state.config.BACKEND_URL:
             ...
@@ -259,6 +301,7 @@ async def signup(request: Request, response: Response, form_data: SignupForm):
             "token": token,
             "token_type": "Bearer",
             "expires_at": expires_at,
+            "refresh_token": refresh_token,
             "id": user.id,
             "email": user.email,
             "name": user.name,
@@ -273,7 +316,49 @@ async def signup(request: Request, response: Response, form_data: SignupForm):
         )
 
 
+############################
+# Refresh
+############################
+
+
+@router.post("/refresh", response_model=RefreshResponse)
+async def refresh(
+    request: Request, response: Response, form_data: Optional[RefreshForm] = None
+):
+    refresh_token = (form_data.refresh_token if form_data else None) or (
+        request.cookies.get("refresh_token")
+    )
+    if not refresh_token:
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED, detail=ERROR_MESSAGES.INVALID_TOKEN
+        )
+
+    rotated = await AsyncRefreshTokens.rotate_refresh_token(
+        refresh_token,
+        parse_duration(request.app.state.config.JWT_REFRESH_EXPIRES_IN),
+    )
+    user = await get_cached_user(rotated[0]) if rotated else None
+    if user is None:
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED, detail=ERROR_MESSAGES.INVALID_TOKEN
+        )
+
+    token, expires_at = set_session_token(request, response, user)
+    set_refresh_token_cookie(request, response, rotated[1])
+
+    return {
+        "token": token,
+        "token_type": "Bearer",
+        "expires_at": expires_at,
+        "refresh_token": rotated[1],
+    }
+
+
 @router.get("/signout")
-async def signout(response: Response):
+async def signout(request: Request, response: Response):
+    if refresh_token := request.cookies.get("refresh_token"):
+        await AsyncRefreshTokens.revoke_refresh_token(refresh_token)
+
     response.delete_cookie("token")
+    response.delete_cookie("refresh_token", path=REFRESH_TOKEN_COOKIE_PATH)
     return {"status": True}
@@ -3,6 +3,15 @@ from .auth_service import (  # noqa: F401
     get_current_user_by_api_key,
     get_verified_user,
     get_admin_user,
-    AuthORM,
+    get_current_principal,
+    get_verified_principal,
+    get_admin_principal,
+    load_principal_user,
     Auths,
+    AsyncAuths,
+    get_cached_user,
+)
+from .refresh_token_service import (  # noqa: F401
+    RefreshTokens,
+    AsyncRefreshTokens,
 )
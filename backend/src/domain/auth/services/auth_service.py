@@ -1,27 +1,47 @@
+import threading
 import uuid
-from typing import Optional, Annotated
-from fastapi import Request, HTTPException, Depends, status, BackgroundTasks
+from typing import Optional, Annotated, Protocol
+from fastapi import Request, HTTPException, Depends, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from ormlambda import ORM
 
 from src.core.constants import ERROR_MESSAGES
-from src.core.db import engine
-
-from src.domain.user import Users, UserModel
+from src.core.db import AsyncTable, execute, fetch_one
+from src.core.env import STORAGE_BACKEND
+from src.core.etag import versions
+from src.core.metrics import instrument
+from src.core.pool import PoolTimeoutError
+from src.core.timing import timed
+
+from src.domain.user import (
+    Users,
+    AsyncUsers,
+    UserModel,
+    principal_cache,
+    api_key_cache,
+    invalidate_principal,
+    last_active_buffer,
+)
+from src.domain.user.utils import hash_api_key
 
 from .. import log
-from ..models import Auth, AuthModel
-from ..utils import decode_token, verify_password
+from .refresh_token_service import RefreshTokens
+from ..models import AuthModel, Principal
+from ..utils import (
+    decode_token,
+    verify_password,
+    verify_password_async,
+    PasswordHashTimeoutError,
+)
 
 
 bearer_security = HTTPBearer(auto_error=False)
 
+PRINCIPAL_CLAIMS = set(Principal.model_fields)
 
-def get_current_user(
-    request: Request,
-    background_tasks: BackgroundTasks,
-    auth_token: Annotated[HTTPAuthorizationCredentials, Depends(bearer_security)],
-) -> UserModel:
+
+def get_token_from_request(
+    request: Request, auth_token: Optional[HTTPAuthorizationCredentials]
+) -> str:
     token = None
     if auth_token is not None:
         token = auth_token.credentials
@@ -31,6 +51,27 @@ def get_current_user(
 
     if token is None:
         raise HTTPException(status.HTTP_403_FORBIDDEN, detail=ERROR_MESSAGES.NOT_AUTHENTICATED)
+    return token
+
+
+async def get_cached_user(user_id: str) -> Optional[UserModel]:
+    user = principal_cache.get(user_id)
+    if user is None:
+        # a write committed during the fetch bumps the version: the row read
+        # may predate it, so it is used once but not cached
+        version = versions.row("user", user_id)
+        user = await AsyncUsers.get_user_by_id(user_id)
+        if user is not None and versions.row("user", user_id) == version:
+            principal_cache.set(user.id, user)
+    return user
+
+
+@timed("auth")
+async def get_current_user(
+    request: Request,
+    auth_token: Annotated[HTTPAuthorizationCredentials, Depends(bearer_security)],
+) -> UserModel:
+    token = get_token_from_request(request, auth_token)
 
     # auth by api key
     if token.startswith("sk-"):
@@ -39,7 +80,7 @@ def get_current_user(
                 status.HTTP_403_FORBIDDEN, detail=ERROR_MESSAGES.API_KEY_NOT_ALLOWED
             )
 
-        return get_current_user_by_api_key(token)
+        return await get_current_user_by_api_key(token)
 
     # auth by jwt token
     try:
@@ -51,17 +92,14 @@ def get_current_user(
         )
 
     if data is not None and "id" in data:
-        user = Users.get_user_by_id(data["id"])
+        user = await get_cached_user(data["id"])
         if user is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail=ERROR_MESSAGES.INVALID_TOKEN,
             )
-        else:
-            # Refresh the user's last active timestamp asynchronously
-            # to prevent blocking the request
-            if background_tasks:
-                background_tasks.add_task(Users.update_user_last_active_by_id, user.id)
+        # Refreshed in bulk by the write-behind buffer, never inside the request
+        last_active_buffer.touch(user.id)
         return user
     else:
         raise HTTPException(
@@ -70,19 +108,78 @@ def get_current_user(
         )
 
 
-def get_current_user_by_api_key(api_key: str):
-    user = Users.get_user_by_api_key(api_key)
+async def get_current_user_by_api_key(api_key: str):
+    digest = hash_api_key(api_key)
+    user = api_key_cache.get(digest)
+    if user is None:
+        # the owner is unknown until fetched: any user write skips the fill
+        version = versions.table("user")
+        user = await AsyncUsers.get_user_by_api_key(api_key)
+        if user is not None and versions.table("user") == version:
+            api_key_cache.set(digest, user)
 
     if user is None:
         raise HTTPException(
             status.HTTP_401_UNAUTHORIZED, detail=ERROR_MESSAGES.INVALID_TOKEN
         )
-    Users.update_user_last_active_by_id(user.id)
+    last_active_buffer.touch(user.id)
+
+    return user
+
+
+@timed("auth")
+async def get_current_principal(
+    request: Request,
+    auth_token: Annotated[HTTPAuthorizationCredentials, Depends(bearer_security)],
+) -> Principal:
+    """
+    Like `get_current_user`, but answers from the signed token claims when
+    `JWT_EMBED_CLAIMS` is on, so no user row is loaded.
+    """
+    token = get_token_from_request(request, auth_token)
+
+    if not token.startswith("sk-") and request.app.state.config.JWT_EMBED_CLAIMS:
+        data = decode_token(token)
+        if data is not None and PRINCIPAL_CLAIMS <= data.keys():
+            last_active_buffer.touch(data["id"])
+            return Principal.model_validate(data)
+
+    user = await get_current_user(request, auth_token)
+    return Principal.model_validate(user)
+
 
+@timed("auth")
+async def load_principal_user(principal: Principal) -> UserModel:
+    """Full `UserModel` for handlers that need more than the principal."""
+    user = await get_cached_user(principal.id)
+    if user is None:
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED, detail=ERROR_MESSAGES.INVALID_TOKEN
+        )
     return user
 
 
-def get_verified_user(user: Annotated[UserModel, Depends(get_current_user)]):
+async def get_verified_principal(
+    principal: Annotated[Principal, Depends(get_current_principal)],
+) -> Principal:
+    if principal.role not in {"users", "admin"}:
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED, detail=ERROR_MESSAGES.ACCESS_PROHIBITED
+        )
+    return principal
+
+
+async def get_admin_principal(
+    principal: Annotated[Principal, Depends(get_current_principal)],
+) -> Principal:
+    if principal.role != "admin":
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED, detail=ERROR_MESSAGES.ACCESS_PROHIBITED
+        )
+    return principal
+
+
+async def get_verified_user(user: Annotated[UserModel, Depends(get_current_user)]):
     if user.role not in {"users", "admin"}:
         raise HTTPException(
             status.HTTP_401_UNAUTHORIZED, detail=ERROR_MESSAGES.ACCESS_PROHIBITED
@@ -90,7 +187,7 @@ def get_verified_user(user: Annotated[UserModel, Depends(get_current_user)]):
     return user
 
 
-def get_admin_user(user: Annotated[UserModel, Depends(get_current_user)]) -> UserModel:
+async def get_admin_user(user: Annotated[UserModel, Depends(get_current_user)]) -> UserModel:
     if user.role != "admin":
         raise HTTPException(
             status.HTTP_401_UNAUTHORIZED, detail=ERROR_MESSAGES.ACCESS_PROHIBITED
@@ -98,9 +195,35 @@ def get_admin_user(user: Annotated[UserModel, Depends(get_current_user)]) -> Use
     return user
 
 
-AuthORM = ORM(Auth, engine)
+class AuthsRepository(Protocol):
+    """Storage behind `Auths`, picked by `STORAGE_BACKEND`."""
+
+    def insert_new_auth(
+        self,
+        email: str,
+        password: str,
+        name: str,
+        profile_image_url: str = "/user.png",
+        role: str = "pending",
+        oauth_sub: Optional[str] = None,
+    ) -> Optional[UserModel]: ...
+
+    def get_active_auth_by_email(self, email: str) -> Optional[AuthModel]: ...
+
+    def authenticate_user(self, email: str, password: str) -> Optional[UserModel]: ...
+
+    def authenticate_user_by_api_key(self, api_key: str) -> Optional[UserModel]: ...
+
+    def authenticate_user_by_trusted_header(self, email: str) -> Optional[UserModel]: ...
+
+    def update_user_password_by_id(self, id: str, new_password: str) -> bool: ...
+
+    def update_email_by_id(self, id: str, email: str) -> bool: ...
+
+    def delete_auth_by_id(self, id: str) -> bool: ...
 
 
+@instrument
 class AuthsTable:
     def insert_new_auth(
         self,
@@ -115,30 +238,28 @@ class AuthsTable:
 
         id = str(uuid.uuid4())
 
-        auth = AuthModel(
-            **{
-                "id": id,
-                "email": email,
-                "password": password,
-                "active": True,
-            }
+        execute(
+            "INSERT INTO auth (id, email, password, active) VALUES (%s, %s, %s, %s)",
+            (id, email, password, 1),
         )
-        result = Auth(**auth.model_dump())
-        AuthORM.insert(result)
 
-        user = Users.insert_new_user(
+        return Users.insert_new_user(
             id, name, email, profile_image_url, role, oauth_sub
         )
 
-        if result and user:
-            return user
-        return None
+    def get_active_auth_by_email(self, email: str) -> Optional[AuthModel]:
+        row = fetch_one(
+            "SELECT id, email, password, active FROM auth "
+            "WHERE email = %s AND active = 1 LIMIT 1",
+            (email,),
+        )
+        return AuthModel.model_validate(row) if row else None
 
     def authenticate_user(self, email: str, password: str) -> Optional[UserModel]:
         log.info(f"authenticate_user: {email}")
 
         try:
-            auth = AuthORM.where([Auth.email == email, Auth.active == 1]).first()
+            auth = self.get_active_auth_by_email(email)
             if auth and verify_password(password, auth.password):
                 return Users.get_user_by_id(auth.id)
             return None
@@ -160,11 +281,7 @@ class AuthsTable:
     def authenticate_user_by_trusted_header(self, email: str) -> Optional[UserModel]:
         log.info(f"authenticate_user_by_trusted_header: {email}")
         try:
-            auth = (
-                AuthORM.where(lambda x: x.email == email)
-                .where(lambda x: x.active is True)
-                .select_one()
-            )
+            auth = self.get_active_auth_by_email(email)
             if auth:
                 user = Users.get_user_by_id(auth.id)
                 return user
@@ -173,17 +290,20 @@ class AuthsTable:
 
     def update_user_password_by_id(self, id: str, new_password: str) -> bool:
         try:
-            result = AuthORM.where(lambda x: x.id == id).update(
-                {"password": new_password}
+            result = execute(
+                "UPDATE auth SET password = %s WHERE id = %s", (new_password, id)
             )
-            return True if result == 1 else False
+            if result.rowcount == 1:
+                RefreshTokens.revoke_refresh_tokens_by_user_id(id)
+                return True
+            return False
         except Exception:
             return False
 
     def update_email_by_id(self, id: str, email: str) -> bool:
         try:
-            result = AuthORM.where(lambda x: x.id == id).update({"email": email})
-            return True if result == 1 else False
+            result = execute("UPDATE auth SET email = %s WHERE id = %s", (email, id))
+            return result.rowcount == 1
         except Exception:
             return False
 
@@ -193,7 +313,10 @@ class AuthsTable:
             result = Users.delete_user_by_id(id)
 
             if result:
-                AuthORM.where(lambda x: x.id == id).delete()
+                if execute("DELETE FROM auth WHERE id = %s", (id,)).rowcount == 0:
+                    return False
+                RefreshTokens.revoke_refresh_tokens_by_user_id(id)
+                invalidate_principal(id)
 
                 return True
             else:
@@ -202,7 +325,104 @@ class AuthsTable:
             return False
 
 
-Auths = AuthsTable()
+@instrument
+class AsyncAuthsTable(AsyncTable[AuthsTable]):
+    @timed("auth")
+    async def authenticate_user(
+        self, email: str, password: str
+    ) -> Optional[UserModel]:
+        """Same as `AuthsTable.authenticate_user`, with bcrypt on the hashing pool."""
+        log.info(f"authenticate_user: {email}")
+
+        try:
+            auth = await self.get_active_auth_by_email(email)
+            if auth and await verify_password_async(password, auth.password):
+                return await AsyncUsers.get_user_by_id(auth.id)
+            return None
+        except PasswordHashTimeoutError:
+            raise
+        except PoolTimeoutError:
+            raise
+        except Exception:
+            return None
+
+
+@instrument
+class MemoryAuthsTable(AuthsTable):
+    """`AuthsRepository` kept in process memory, indexed by email."""
+
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id: dict[str, AuthModel] = {}
+        self._by_email: dict[str, AuthModel] = {}
+
+    def _update(self, id: str, **values) -> bool:
+        with self._lock:
+            auth = self._by_id.get(id)
+            if auth is None:
+                return False
+            email = values.get("email", auth.email)
+            if self._by_email.get(email, auth) is not auth:
+                return False
+            if self._by_email.get(auth.email) is auth:
+                del self._by_email[auth.email]
+            auth = self._by_id[id] = auth.model_copy(update=values)
+            self._by_email[auth.email] = auth
+            return True
+
+    def insert_new_auth(
+        self,
+        email: str,
+        password: str,
+        name: str,
+        profile_image_url: str = "/user.png",
+        role: str = "pending",
+        oauth_sub: Optional[str] = None,
+    ) -> Optional[UserModel]:
+        log.info("insert_new_auth")
+
+        auth = AuthModel(id=str(uuid.uuid4()), email=email, password=password)
+        with self._lock:
+            # signup checks the email first, this only settles concurrent ones
+            if email in self._by_email:
+                raise ValueError(f"Duplicate entry '{email}' for key 'auth.email'")
+            self._by_id[auth.id] = auth
+            self._by_email[email] = auth
+        return Users.insert_new_user(
+            auth.id, name, email, profile_image_url, role, oauth_sub
+        )
+
+    def get_active_auth_by_email(self, email: str) -> Optional[AuthModel]:
+        auth = self._by_email.get(email)
+        return auth if auth is not None and auth.active else None
+
+    def update_user_password_by_id(self, id: str, new_password: str) -> bool:
+        if not self._update(id, password=new_password):
+            return False
+        RefreshTokens.revoke_refresh_tokens_by_user_id(id)
+        return True
+
+    def update_email_by_id(self, id: str, email: str) -> bool:
+        return self._update(id, email=email)
+
+    def delete_auth_by_id(self, id: str) -> bool:
+        if not Users.delete_user_by_id(id):
+            return False
+        with self._lock:
+            auth = self._by_id.pop(id, None)
+            if auth is not None and self._by_email.get(auth.email) is auth:
+                del self._by_email[auth.email]
+        RefreshTokens.revoke_refresh_tokens_by_user_id(id)
+        invalidate_principal(id)
+        return True
+
+
+Auths: AuthsRepository = (
+    MemoryAuthsTable() if STORAGE_BACKEND == "memory" else AuthsTable()
+)
+AsyncAuths = AsyncAuthsTable(Auths)
 
 
 __all__ = [
@@ -210,6 +430,11 @@ __all__ = [
     "get_current_user_by_api_key",
     "get_verified_user",
     "get_admin_user",
-    "AuthORM",
+    "get_current_principal",
+    "get_verified_principal",
+    "get_admin_principal",
+    "load_principal_user",
+    "get_cached_user",
     "Auths",
+    "AsyncAuths",
 ]
@@ -0,0 +1,171 @@
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Optional
+
+from src.core.db import AsyncTable, execute, fetch_one
+from src.core.env import STORAGE_BACKEND
+from src.core.metrics import instrument
+from src.common.misc import if_error_return
+
+from .. import log
+from ..models import RefreshTokenModel
+from ..utils import create_refresh_token_value, hash_refresh_token
+
+
+@instrument
+class RefreshTokensTable:
+    """
+    Rotating refresh tokens.
+
+    Only the keyed hash of a token is stored. Every successful refresh revokes
+    the presented token and issues a new one in the same family; presenting an
+    already revoked token is treated as theft and revokes the whole family.
+    """
+
+    def insert_new_refresh_token(
+        self,
+        user_id: str,
+        expires_delta: Optional[timedelta],
+        family_id: Optional[str] = None,
+    ) -> str:
+        token = create_refresh_token_value()
+        expires_at = (
+            int(time.time()) + int(expires_delta.total_seconds()) if expires_delta else 0
+        )
+        self._insert(
+            RefreshTokenModel(
+                id=hash_refresh_token(token),
+                user_id=user_id,
+                family_id=family_id or str(uuid.uuid4()),
+                expires_at=expires_at,
+            )
+        )
+        return token
+
+    def _insert(self, token: RefreshTokenModel) -> None:
+        execute(
+            "INSERT INTO refresh_token (id, user_id, family_id, expires_at, revoked) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            (
+                token.id,
+                token.user_id,
+                token.family_id,
+                token.expires_at,
+                int(token.revoked),
+            ),
+        )
+
+    def _consume(self, id: str) -> bool:
+        """Revoke the token with digest `id`, False if it was already revoked."""
+        result = execute(
+            "UPDATE refresh_token SET revoked = 1 WHERE id = %s AND revoked = 0", (id,)
+        )
+        return result.rowcount == 1
+
+    @if_error_return(None)
+    def get_refresh_token(self, token: str) -> Optional[RefreshTokenModel]:
+        row = fetch_one(
+            "SELECT id, user_id, family_id, expires_at, revoked FROM refresh_token "
+            "WHERE id = %s LIMIT 1",
+            (hash_refresh_token(token),),
+        )
+        return RefreshTokenModel.model_validate(row) if row else None
+
+    @if_error_return(None)
+    def rotate_refresh_token(
+        self, token: str, expires_delta: Optional[timedelta]
+    ) -> Optional[tuple[str, str]]:
+        """Returns `(user_id, new_token)`, or None if `token` can't be used."""
+        current = self.get_refresh_token(token)
+        if current is None:
+            return None
+
+        if current.revoked:
+            log.warning(f"Refresh token reuse detected for user {current.user_id}")
+            self.revoke_refresh_token_family(current.family_id)
+            return None
+
+        if current.expires_at and current.expires_at < int(time.time()):
+            return None
+
+        # only one concurrent refresh may consume the token
+        if not self._consume(current.id):
+            return None
+
+        new_token = self.insert_new_refresh_token(
+            current.user_id, expires_delta, current.family_id
+        )
+        return current.user_id, new_token
+
+    @if_error_return(False)
+    def revoke_refresh_token(self, token: str) -> bool:
+        current = self.get_refresh_token(token)
+        if current is None:
+            return False
+        return self.revoke_refresh_token_family(current.family_id)
+
+    @if_error_return(False)
+    def revoke_refresh_token_family(self, family_id: str) -> bool:
+        execute(
+            "UPDATE refresh_token SET revoked = 1 WHERE family_id = %s", (family_id,)
+        )
+        return True
+
+    @if_error_return(False)
+    def revoke_refresh_tokens_by_user_id(self, user_id: str) -> bool:
+        execute("UPDATE refresh_token SET revoked = 1 WHERE user_id = %s", (user_id,))
+        return True
+
+
+@instrument
+class MemoryRefreshTokensTable(RefreshTokensTable):
+    """`RefreshTokensTable` kept in process memory, by token digest."""
+
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens: dict[str, RefreshTokenModel] = {}
+
+    def _insert(self, token: RefreshTokenModel) -> None:
+        with self._lock:
+            self._tokens[token.id] = token
+
+    def _consume(self, id: str) -> bool:
+        with self._lock:
+            token = self._tokens.get(id)
+            if token is None or token.revoked:
+                return False
+            self._tokens[id] = token.model_copy(update={"revoked": True})
+            return True
+
+    def _revoke_where(self, field: str, value: str) -> None:
+        with self._lock:
+            for id, token in self._tokens.items():
+                if getattr(token, field) == value and not token.revoked:
+                    self._tokens[id] = token.model_copy(update={"revoked": True})
+
+    def get_refresh_token(self, token: str) -> Optional[RefreshTokenModel]:
+        return self._tokens.get(hash_refresh_token(token))
+
+    def revoke_refresh_token_family(self, family_id: str) -> bool:
+        self._revoke_where("family_id", family_id)
+        return True
+
+    def revoke_refresh_tokens_by_user_id(self, user_id: str) -> bool:
+        self._revoke_where("user_id", user_id)
+        return True
+
+
+RefreshTokens = (
+    MemoryRefreshTokensTable() if STORAGE_BACKEND == "memory" else RefreshTokensTable()
+)
+AsyncRefreshTokens = AsyncTable(RefreshTokens)
+
+
+__all__ = [
+    "RefreshTokens",
+    "AsyncRefreshTokens",
+]
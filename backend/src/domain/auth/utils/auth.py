@@ -1,10 +1,24 @@
 from datetime import UTC, datetime, timedelta
+import hashlib
+import hmac
+import secrets
 from typing import Optional
 import uuid
 import jwt
-from passlib.context import CryptContext
 
-from src.core.env import BACKEND_SECRET_KEY
+from src.core.env import (
+    BACKEND_SECRET_KEY,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_CONCURRENCY,
+    PASSWORD_HASH_QUEUE_TIMEOUT,
+)
+from src.core.timing import timed
+from src.common.hashing import (
+    PasswordHasher,
+    PasswordHashTimeoutError as PasswordHashTimeoutError,
+    check_password,
+    hash_password,
+)
 
 # openssl rand -hex 32
 SESSION_SECRET = BACKEND_SECRET_KEY
@@ -16,17 +30,31 @@ ALGORITHM = "HS256"
 ##############
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(
+    PASSWORD_HASH_WORKERS, PASSWORD_HASH_CONCURRENCY, PASSWORD_HASH_QUEUE_TIMEOUT
+)
 
 
 def verify_password(plain_password: str, hashed_password: Optional[str] = None):
-    return (
-        pwd_context.verify(plain_password, hashed_password) if hashed_password else None
-    )
+    return check_password(plain_password, hashed_password) if hashed_password else None
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hash_password(password)
+
+
+@timed("auth")
+async def verify_password_async(
+    plain_password: str, hashed_password: Optional[str] = None
+):
+    if not hashed_password:
+        return None
+    return await password_hasher.verify(plain_password, hashed_password)
+
+
+@timed("auth")
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -40,6 +68,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+def get_token_claims(user) -> dict:
+    """Claims signed into self-contained access tokens (`JWT_EMBED_CLAIMS`)."""
+    return {"id": user.id, "email": user.email, "name": user.name, "role": user.role}
+
+
 def decode_token(token: str) -> Optional[dict]:
     try:
         decoded = jwt.decode(token, SESSION_SECRET, algorithms=[ALGORITHM])
@@ -55,3 +88,16 @@ def extract_token_from_auth_header(auth_header: str):
 def create_api_key():
     key = str(uuid.uuid4()).replace("-", "")
     return f"sk-{key}"
+
+
+# stands for a stored key: only its digest is kept, the key is shown once
+API_KEY_MASK = "sk-" + "*" * 32
+
+
+def create_refresh_token_value() -> str:
+    return f"rt-{secrets.token_urlsafe(32)}"
+
+
+def hash_refresh_token(token: str) -> str:
+    """Fixed-length lookup key for a refresh token, keyed with the session secret."""
+    return hmac.new(SESSION_SECRET.encode(), token.encode(), hashlib.sha256).hexdigest()
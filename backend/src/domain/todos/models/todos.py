@@ -1,16 +1,33 @@
-from typing import Optional
-from pydantic import BaseModel, ConfigDict
-from ormlambda import Table, Column, ORM, VARCHAR, INT
-from src.core import engine
+import bisect
+import functools
+import inspect
+import threading
+from typing import Any, Callable, Optional, Protocol
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from src.core.db import (
+    AsyncTable,
+    async_engine,
+    dialect,
+    execute,
+    fetch_all,
+    fetch_one,
+    inserted_ids,
+    placeholders,
+    run_in_db,
+    transaction,
+)
+from src.core.env import (
+    STORAGE_BACKEND,
+    TODO_BATCH_MAX_SIZE,
+    TODO_CACHE_MAX_ROWS,
+    TODO_CACHE_SIZE,
+)
+from src.core.etag import versions
+from src.core.metrics import instrument
+from src.common.cache import VersionedCache
 from src.common.misc import if_error_return
 
 
-class Todo(Table):
-    __table_name__ = "todo"
-    id: Column[INT] = Column(INT(), is_primary_key=True, is_auto_increment=True)
-    item: Column[VARCHAR] = Column(VARCHAR(100))
-
-
 class TodoModel(BaseModel):
     id: int
     item: str
@@ -32,33 +49,465 @@ class TodoForm(BaseModel):
     }
 
 
-class TodoTable:
-    def __init__(self):
-        self.model = ORM(Todo, engine)
+class TodoUpdateForm(TodoForm):
+    id: int
+
+
+class TodoBatchCreateForm(BaseModel):
+    items: list[TodoForm] = Field(min_length=1, max_length=TODO_BATCH_MAX_SIZE)
+
+
+class TodoBatchUpdateForm(BaseModel):
+    items: list[TodoUpdateForm] = Field(min_length=1, max_length=TODO_BATCH_MAX_SIZE)
+
+
+class TodoBatchDeleteForm(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=TODO_BATCH_MAX_SIZE)
+
+
+class TodoBatchResult(BaseModel):
+    id: Optional[int] = None
+    ok: bool
+    todo: Optional[TodoModel] = None
+    error: Optional[str] = None
+
+
+TODO_NOT_FOUND = "Todo not found"
+
+
+def _check_batch_size(size: int) -> None:
+    if not 0 < size <= TODO_BATCH_MAX_SIZE:
+        raise ValueError(
+            f"Batch size must be between 1 and {TODO_BATCH_MAX_SIZE}, got {size}"
+        )
+
+
+# validates a whole result set in one call instead of one per row
+TodoList = TypeAdapter(list[TodoModel])
+
+
+def _todo_page(rows: list[dict], limit: int) -> tuple[list[TodoModel], Optional[int]]:
+    todos = TodoList.validate_python(rows[:limit])
+    return todos, todos[-1].id if len(rows) > limit else None
+
+
+SELECT_ALL_TODOS = "SELECT id, item FROM todo"
+SELECT_TODO_PAGE = "SELECT id, item FROM todo WHERE id > %s ORDER BY id LIMIT %s"
+SELECT_TODO = "SELECT id, item FROM todo WHERE id = %s LIMIT 1"
+
+
+def select_all_todos() -> list[TodoModel]:
+    return TodoList.validate_python(fetch_all(SELECT_ALL_TODOS))
+
+
+def select_todos(
+    after: Optional[int], limit: int
+) -> tuple[list[TodoModel], Optional[int]]:
+    return _todo_page(fetch_all(SELECT_TODO_PAGE, (after or 0, limit + 1)), limit)
+
+
+def select_todo(id: int) -> Optional[TodoModel]:
+    row = fetch_one(SELECT_TODO, (id,))
+    return TodoModel.model_validate(row) if row else None
+
+
+####################
+# Cache
+####################
+
+# Results of the todo reads, each stored with the `versions` tag of the table,
+# or of the row for single todos, taken before it was read. A write bumps the
+# versions it touched once committed, which is also what changes the ETags.
+# Results are shared between callers: never mutate them.
+todo_cache: VersionedCache[tuple, Any] = VersionedCache(TODO_CACHE_SIZE)
+
+
+def _version(key: tuple) -> str:
+    return versions.row("todo", key[1]) if key[0] == "row" else versions.table("todo")
+
+
+def _store(key: tuple, version: str, result: Any, rows: int) -> None:
+    # a missing todo is not worth a slot, and a listing of the whole table
+    # would pin as much memory as the table itself
+    if result is not None and rows <= TODO_CACHE_MAX_ROWS:
+        todo_cache.set(key, version, result)
+
+
+def read_through(key: Callable[..., tuple], rows: Callable[[Any], int] = lambda _: 1):
+    """
+    Serve a todo read from `todo_cache`, keyed by `key(*args, **kwargs)`.
+
+    `("row", id)` keys follow the version of that row, any other key the one
+    of the whole table. `rows(result)` is the size of a result to store.
+    """
+
+    def decorator[T, **P](f: Callable[P, T]) -> Callable[P, T]:
+        if inspect.iscoroutinefunction(f):
+
+            @functools.wraps(f)
+            async def async_inner(self, *args, **kwargs):
+                cache_key = key(*args, **kwargs)
+                version = _version(cache_key)
+                result = todo_cache.get(cache_key, version)
+                if result is None:
+                    result = await f(self, *args, **kwargs)
+                    _store(cache_key, version, result, rows(result))
+                return result
+
+            return async_inner
+
+        @functools.wraps(f)
+        def inner(self, *args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            version = _version(cache_key)
+            result = todo_cache.get(cache_key, version)
+            if result is None:
+                result = f(self, *args, **kwargs)
+                _store(cache_key, version, result, rows(result))
+            return result
+
+        return inner
+
+    return decorator
+
+
+def _all_key() -> tuple:
+    return ("all",)
+
+
+def _page_key(after: Optional[int], limit: int) -> tuple:
+    return ("page", after or 0, limit)
+
+
+def _row_key(id) -> tuple:
+    return ("row", int(id))
+
+
+def _page_rows(page: tuple[list[TodoModel], Optional[int]]) -> int:
+    return len(page[0])
+
+
+def invalidate_todos(*ids: int) -> None:
+    """Called by every write once committed, with the ids of the rows it changed."""
+    for id in ids:
+        todo_cache.pop(("row", id))
+    # listings hold every row: the table version goes too
+    versions.bump("todo", *ids)
+
+
+def invalidate_batch(results: list[TodoBatchResult]) -> list[TodoBatchResult]:
+    invalidate_todos(*(result.id for result in results if result.ok))
+    return results
+
+
+class TodosRepository(Protocol):
+    """Storage behind `Todos`, picked by `STORAGE_BACKEND`."""
+
+    def insert_new_todo(self, todo_form: TodoForm) -> Optional[TodoModel]: ...
+
+    def get_all_todos(self) -> list[TodoModel]: ...
+
+    def get_todos(
+        self, after: Optional[int], limit: int
+    ) -> tuple[list[TodoModel], Optional[int]]: ...
+
+    def get_todo_by_id(self, id: str) -> Optional[TodoModel]: ...
 
+    def update_todo(self, id, item: str) -> Optional[int]: ...
+
+    def delete_todo_by_id(self, id) -> bool: ...
+
+    def insert_new_todos(self, todo_forms: list[TodoForm]) -> list[TodoBatchResult]: ...
+
+    def update_todos(self, updates: list[TodoUpdateForm]) -> list[TodoBatchResult]: ...
+
+    def delete_todos(self, ids: list[int]) -> list[TodoBatchResult]: ...
+
+
+@instrument
+class TodoTable:
     @if_error_return(None)
     def insert_new_todo(self, todo_form: TodoForm) -> Optional[TodoModel]:
-        todo = Todo(**todo_form.model_dump())
+        result = execute("INSERT INTO todo (item) VALUES (%s)", (todo_form.item,))
+        # the row may have been read as missing before
+        invalidate_todos(result.lastrowid)
+        return TodoModel(id=result.lastrowid, item=todo_form.item)
+
+    @if_error_return([])
+    @read_through(_all_key, len)
+    def get_all_todos(self) -> list[TodoModel]:
+        return select_all_todos()
+
+    @read_through(_page_key, _page_rows)
+    def get_todos(
+        self, after: Optional[int], limit: int
+    ) -> tuple[list[TodoModel], Optional[int]]:
+        """Keyset page of todos ordered by id, plus the id to continue after."""
+        return select_todos(after, limit)
+
+    @if_error_return(None)
+    @read_through(_row_key)
+    def get_todo_by_id(self, id: str) -> Optional[TodoModel]:
+        return select_todo(int(id))
+
+    @if_error_return(-1)
+    def update_todo(self, id, item: str) -> Optional[int]:
+        rowcount = execute(
+            "UPDATE todo SET item = %s WHERE id = %s", (item, id)
+        ).rowcount
+        if rowcount > 0:
+            invalidate_todos(int(id))
+        return rowcount
+
+    @if_error_return(False)
+    def delete_todo_by_id(self, id) -> bool:
+        if execute("DELETE FROM todo WHERE id = %s", (id,)).rowcount > 0:
+            invalidate_todos(int(id))
+        return True
+
+    ####################
+    # Batch
+    ####################
+
+    def insert_new_todos(self, todo_forms: list[TodoForm]) -> list[TodoBatchResult]:
+        _check_batch_size(len(todo_forms))
+
+        items = [form.item for form in todo_forms]
+        with transaction() as cursor:
+            cursor.execute(
+                f"INSERT INTO todo (item) VALUES {', '.join('(%s)' for _ in items)}",
+                items,
+            )
+            # InnoDB and SQLite hand out evenly spaced ids to a multi-row
+            # VALUES insert run under the write lock
+            ids = inserted_ids(cursor, len(items))
+
+        return invalidate_batch(
+            [
+                TodoBatchResult(id=id, ok=True, todo=TodoModel(id=id, item=item))
+                for id, item in zip(ids, items)
+            ]
+        )
+
+    def update_todos(self, updates: list[TodoUpdateForm]) -> list[TodoBatchResult]:
+        _check_batch_size(len(updates))
+
+        # the last update of an id wins, as if they were applied one by one
+        items = {update.id: update.item for update in updates}
+        ids = list(items)
+        with transaction() as cursor:
+            cursor.execute(
+                f"SELECT id FROM todo WHERE id IN ({placeholders(len(ids))})"
+                f"{dialect.for_update}",
+                ids,
+            )
+            found = [row[0] for row in cursor.fetchall()]
+            if found:
+                cases = " ".join("WHEN %s THEN %s" for _ in found)
+                cursor.execute(
+                    f"UPDATE todo SET item = CASE id {cases} END "
+                    f"WHERE id IN ({placeholders(len(found))})",
+                    [*(value for id in found for value in (id, items[id])), *found],
+                )
+
+        found = set(found)
+        return invalidate_batch(
+            [
+                TodoBatchResult(id=id, ok=True, todo=TodoModel(id=id, item=items[id]))
+                if id in found
+                else TodoBatchResult(id=id, ok=False, error=TODO_NOT_FOUND)
+                for id in ids
+            ]
+        )
+
+    def delete_todos(self, ids: list[int]) -> list[TodoBatchResult]:
+        _check_batch_size(len(ids))
 
-        self.model.insert(todo)
-        return self.model.order(Todo.id, "DESC").first(flavour=TodoModel)
+        ids = list(dict.fromkeys(ids))
+        with transaction() as cursor:
+            cursor.execute(
+                f"SELECT id FROM todo WHERE id IN ({placeholders(len(ids))})"
+                f"{dialect.for_update}",
+                ids,
+            )
+            found = [row[0] for row in cursor.fetchall()]
+            if found:
+                cursor.execute(
+                    f"DELETE FROM todo WHERE id IN ({placeholders(len(found))})",
+                    found,
+                )
+
+        found = set(found)
+        return invalidate_batch(
+            [
+                TodoBatchResult(id=id, ok=True)
+                if id in found
+                else TodoBatchResult(id=id, ok=False, error=TODO_NOT_FOUND)
+                for id in ids
+            ]
+        )
+
+
+@instrument
+class AsyncTodoTable(AsyncTable[TodoTable]):
+    """
+    `TodoTable` reads answered from `todo_cache` on the event loop, without
+    waiting for a connection. Misses and the hot queries run natively on
+    `async_engine` when there is one, on `db_executor` otherwise.
+    """
+
+    @if_error_return(None)
+    async def insert_new_todo(self, todo_form: TodoForm) -> Optional[TodoModel]:
+        if async_engine is None:
+            return await run_in_db(self._table.insert_new_todo, todo_form)
+        result = await async_engine.execute(
+            "INSERT INTO todo (item) VALUES (%s)", (todo_form.item,)
+        )
+        invalidate_todos(result.lastrowid)
+        return TodoModel(id=result.lastrowid, item=todo_form.item)
 
     @if_error_return([])
+    @read_through(_all_key, len)
+    async def get_all_todos(self) -> list[TodoModel]:
+        if async_engine is None:
+            return await run_in_db(select_all_todos)
+        rows = await async_engine.fetch_all(SELECT_ALL_TODOS)
+        return TodoList.validate_python(rows)
+
+    @read_through(_page_key, _page_rows)
+    async def get_todos(
+        self, after: Optional[int], limit: int
+    ) -> tuple[list[TodoModel], Optional[int]]:
+        if async_engine is None:
+            return await run_in_db(select_todos, after, limit)
+        rows = await async_engine.fetch_all(SELECT_TODO_PAGE, (after or 0, limit + 1))
+        return _todo_page(rows, limit)
+
+    @if_error_return(None)
+    @read_through(_row_key)
+    async def get_todo_by_id(self, id: str) -> Optional[TodoModel]:
+        if async_engine is None:
+            return await run_in_db(select_todo, int(id))
+        row = await async_engine.fetch_one(SELECT_TODO, (int(id),))
+        return TodoModel.model_validate(row) if row else None
+
+
+@instrument
+class MemoryTodoTable:
+    """`TodosRepository` kept in process memory, indexed by id."""
+
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._todos: dict[int, TodoModel] = {}
+        # ids in ascending order, for keyset pages
+        self._ids: list[int] = []
+        self._next_id = 1
+
+    def _insert(self, item: str) -> TodoModel:
+        # called with the lock held; ids only grow, so `_ids` stays sorted
+        todo = TodoModel(id=self._next_id, item=item)
+        self._todos[todo.id] = todo
+        self._ids.append(todo.id)
+        self._next_id += 1
+        return todo
+
+    def _delete(self, id: int) -> bool:
+        if self._todos.pop(id, None) is None:
+            return False
+        del self._ids[bisect.bisect_left(self._ids, id)]
+        return True
+
+    def insert_new_todo(self, todo_form: TodoForm) -> Optional[TodoModel]:
+        with self._lock:
+            todo = self._insert(todo_form.item)
+        invalidate_todos(todo.id)
+        return todo
+
     def get_all_todos(self) -> list[TodoModel]:
-        return self.model.select(flavour=TodoModel)
+        with self._lock:
+            return list(self._todos.values())
+
+    def get_todos(
+        self, after: Optional[int], limit: int
+    ) -> tuple[list[TodoModel], Optional[int]]:
+        with self._lock:
+            start = bisect.bisect_right(self._ids, after or 0)
+            page = [self._todos[id] for id in self._ids[start : start + limit + 1]]
+        todos = page[:limit]
+        return todos, todos[-1].id if len(page) > limit else None
 
     @if_error_return(None)
     def get_todo_by_id(self, id: str) -> Optional[TodoModel]:
-        return self.model.where(Todo.id == id).first(flavour=TodoModel)
+        return self._todos.get(int(id))
 
     @if_error_return(-1)
     def update_todo(self, id, item: str) -> Optional[int]:
-        return self.model.where(Todo.id == id).update({Todo.item: item})
+        id = int(id)
+        with self._lock:
+            todo = self._todos.get(id)
+            # like MySQL, a row set to its current value is not counted
+            if todo is None or todo.item == item:
+                return 0
+            self._todos[id] = TodoModel(id=id, item=item)
+        invalidate_todos(id)
+        return 1
 
     @if_error_return(False)
     def delete_todo_by_id(self, id) -> bool:
-        self.model.where(Todo.id == id).delete()
+        id = int(id)
+        with self._lock:
+            deleted = self._delete(id)
+        if deleted:
+            invalidate_todos(id)
         return True
 
+    def insert_new_todos(self, todo_forms: list[TodoForm]) -> list[TodoBatchResult]:
+        _check_batch_size(len(todo_forms))
+
+        with self._lock:
+            todos = [self._insert(form.item) for form in todo_forms]
+        return invalidate_batch(
+            [TodoBatchResult(id=todo.id, ok=True, todo=todo) for todo in todos]
+        )
+
+    def update_todos(self, updates: list[TodoUpdateForm]) -> list[TodoBatchResult]:
+        _check_batch_size(len(updates))
+
+        items = {update.id: update.item for update in updates}
+        with self._lock:
+            found = {id for id in items if id in self._todos}
+            for id in found:
+                self._todos[id] = TodoModel(id=id, item=items[id])
+
+        return invalidate_batch(
+            [
+                TodoBatchResult(id=id, ok=True, todo=TodoModel(id=id, item=items[id]))
+                if id in found
+                else TodoBatchResult(id=id, ok=False, error=TODO_NOT_FOUND)
+                for id in items
+            ]
+        )
+
+    def delete_todos(self, ids: list[int]) -> list[TodoBatchResult]:
+        _check_batch_size(len(ids))
+
+        ids = list(dict.fromkeys(ids))
+        with self._lock:
+            found = {id for id in ids if self._delete(id)}
+
+        return invalidate_batch(
+            [
+                TodoBatchResult(id=id, ok=True)
+                if id in found
+                else TodoBatchResult(id=id, ok=False, error=TODO_NOT_FOUND)
+                for id in ids
+            ]
+        )
+
 
-Todos = TodoTable()
+Todos: TodosRepository = (
+    MemoryTodoTable() if STORAGE_BACKEND == "memory" else TodoTable()
+)
+AsyncTodos = AsyncTodoTable(Todos) if STORAGE_BACKEND == "db" else AsyncTable(Todos)
@@ -1,31 +1,120 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import AsyncIterator, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from src.core.constants import ERROR_MESSAGES
+from src.core.etag import conditional, make_etag, versions
+from src.core.routing import FastJSONRoute
+from src.core.env import PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT, STREAM_CHUNK_SIZE
+from src.common.pagination import encode_cursor, decode_cursor, clamp_limit
 
-from src.domain.auth import get_verified_user
-from src.domain.todos import Todos, TodoModel, TodoForm
+from src.domain.auth import get_verified_principal
+from src.domain.todos import (
+    AsyncTodos,
+    TodoModel,
+    TodoForm,
+    TodoBatchCreateForm,
+    TodoBatchUpdateForm,
+    TodoBatchDeleteForm,
+    TodoBatchResult,
+)
 
-router = APIRouter(dependencies=[Depends(get_verified_user)])
+router = APIRouter(
+    route_class=FastJSONRoute, dependencies=[Depends(get_verified_principal)]
+)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def stream_todos() -> AsyncIterator[bytes]:
+    """Every todo as NDJSON, read `STREAM_CHUNK_SIZE` rows at a time."""
+    after = None
+    while True:
+        todos, after = await AsyncTodos.get_todos(after, STREAM_CHUNK_SIZE)
+        if todos:
+            yield "".join(f"{todo.model_dump_json()}\n" for todo in todos).encode()
+        if after is None:
+            break
+
+
+def _found(todo: Optional[TodoModel]) -> TodoModel:
+    if todo is None:
+        raise HTTPException(
+            status.HTTP_404_NOT_FOUND, detail=ERROR_MESSAGES.NOT_FOUND
+        )
+    return todo
 
 
 @router.get("/", response_model=list[TodoModel])
-async def get_all_todos():
-    return Todos.get_all_todos()
+async def get_all_todos(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    stream: bool = False,
+):
+    if stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return StreamingResponse(stream_todos(), media_type=NDJSON_MEDIA_TYPE)
+
+    after = None
+    if cursor:
+        try:
+            (after,) = decode_cursor(cursor, (int,))
+        except ValueError:
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST, detail=ERROR_MESSAGES.INVALID_CURSOR
+            )
+
+    etag = make_etag(versions.table("todo"), request.url.query)
+    if not_modified := conditional(request, response, etag):
+        return not_modified
+
+    todos, next_after = await AsyncTodos.get_todos(
+        after, clamp_limit(limit, PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT)
+    )
+    if next_after:
+        response.headers["X-Next-Cursor"] = encode_cursor([next_after])
+    return todos
+
+
+############################
+# Batch
+############################
+
+
+@router.post("/batch", response_model=list[TodoBatchResult])
+async def insert_todos(form_data: TodoBatchCreateForm) -> list[TodoBatchResult]:
+    return await AsyncTodos.insert_new_todos(form_data.items)
+
+
+@router.patch("/batch", response_model=list[TodoBatchResult])
+async def update_todos(form_data: TodoBatchUpdateForm) -> list[TodoBatchResult]:
+    return await AsyncTodos.update_todos(form_data.items)
+
+
+@router.delete("/batch", response_model=list[TodoBatchResult])
+async def delete_todos(form_data: TodoBatchDeleteForm) -> list[TodoBatchResult]:
+    return await AsyncTodos.delete_todos(form_data.ids)
 
 
 @router.get("/{todo_id}", response_model=TodoModel)
-async def get_todo(todo_id: int) -> TodoModel:
-    return Todos.get_todo_by_id(todo_id)
+async def get_todo(todo_id: int, request: Request, response: Response) -> TodoModel:
+    etag = make_etag(versions.row("todo", todo_id))
+    if not_modified := conditional(request, response, etag):
+        return not_modified
+    return _found(await AsyncTodos.get_todo_by_id(todo_id))
 
 
 @router.patch("/{todo_id}", response_model=TodoModel)
 async def update_todo(todo_id: int, todo: TodoForm) -> TodoModel:
-    Todos.update_todo(todo_id, item=todo.item)
-    return Todos.get_todo_by_id(todo_id)
+    if await AsyncTodos.update_todo(todo_id, item=todo.item) > 0:
+        return TodoModel(id=todo_id, item=todo.item)
+    # no row changed: the todo is missing or already holds this item
+    return _found(await AsyncTodos.get_todo_by_id(todo_id))
 
 
 @router.post("/", response_model=TodoModel)
 async def insert_todo(todo: TodoForm) -> TodoModel:
-    inserted_todo = Todos.insert_new_todo(todo)
+    inserted_todo = await AsyncTodos.insert_new_todo(todo)
 
     if not inserted_todo:
         raise HTTPException(
@@ -40,4 +129,4 @@ async def insert_todo(todo: TodoForm) -> TodoModel:
 
 @router.delete("/{todo_id}", response_model=bool)
 async def delete_todo(todo_id: int) -> bool:
-    return Todos.delete_todo_by_id(todo_id)
+    return await AsyncTodos.delete_todo_by_id(todo_id)
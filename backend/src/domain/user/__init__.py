@@ -1,2 +1,9 @@
-from .services.user_services import Users as Users
+from .services.user_services import (
+    Users as Users,
+    AsyncUsers as AsyncUsers,
+    principal_cache as principal_cache,
+    api_key_cache as api_key_cache,
+    invalidate_principal as invalidate_principal,
+)
+from .services.last_active import last_active_buffer as last_active_buffer
 from .models import *  # noqa: F403
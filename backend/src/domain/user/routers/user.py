@@ -1,21 +1,25 @@
 import logging
 from typing import Optional
 from typing_extensions import Annotated
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from pydantic import BaseModel
-from src.core.env import SRC_LOG_LEVELS
-from src.domain.user import UserModel, Users, UserRoleUpdateForm
+from src.core.env import SRC_LOG_LEVELS, PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT
+from src.common.pagination import encode_cursor, decode_cursor, clamp_limit
+from src.domain.user import UserModel, AsyncUsers, UserRoleUpdateForm
 from src.core.constants import ERROR_MESSAGES
+from src.core.etag import conditional, make_etag, versions
+from src.core.routing import AppRoute
 
+from src.domain.auth.models import Principal
 from src.domain.auth.services import (
-    get_admin_user,
-    get_verified_user,
+    get_admin_principal,
+    get_verified_principal,
 )
 
 log = logging.getLogger(__name__)
 log.setLevel(SRC_LOG_LEVELS["MODELS"])
 
-router = APIRouter()
+router = APIRouter(route_class=AppRoute)
 
 
 ############################
@@ -23,12 +27,27 @@ router = APIRouter()
 ############################
 
 
-@router.get("/", response_model=list[UserModel], dependencies=[Depends(get_admin_user)])
+@router.get("/", response_model=list[UserModel], dependencies=[Depends(get_admin_principal)])
 async def get_users(
-    skip: Optional[int] = None,
+    response: Response,
+    cursor: Optional[str] = None,
     limit: Optional[int] = None,
 ):
-    return Users.get_users(skip, limit)
+    after = None
+    if cursor:
+        try:
+            after = tuple(decode_cursor(cursor, (int, str)))
+        except ValueError:
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST, detail=ERROR_MESSAGES.INVALID_CURSOR
+            )
+
+    users, next_after = await AsyncUsers.get_users(
+        after, clamp_limit(limit, PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT)
+    )
+    if next_after:
+        response.headers["X-Next-Cursor"] = encode_cursor(list(next_after))
+    return users
 
 
 ############################
@@ -38,10 +57,12 @@ async def get_users(
 
 @router.post("/update/role", response_model=Optional[UserModel])
 async def update_user_role(
-    form_data: UserRoleUpdateForm, user: Annotated[UserModel, Depends(get_admin_user)]
+    form_data: UserRoleUpdateForm,
+    user: Annotated[Principal, Depends(get_admin_principal)],
 ):
-    if user.id != form_data.id and form_data.id != Users.get_first_user().id:
-        return Users.update_user_role_by_id(form_data.id, form_data.role)
+    first_user = await AsyncUsers.get_first_user()
+    if user.id != form_data.id and form_data.id != first_user.id:
+        return await AsyncUsers.update_user_role_by_id(form_data.id, form_data.role)
     raise HTTPException(
         status_code=status.HTTP_403_FORBIDDEN, detail=ERROR_MESSAGES.ACTION_PROHIBITED
     )
@@ -63,10 +84,10 @@ class UserResponse(BaseModel):
 
 
 @router.post(
-    "/{user_id}", response_model=UserResponse, dependencies=[Depends(get_verified_user)]
+    "/{user_id}", response_model=UserResponse, dependencies=[Depends(get_verified_principal)]
 )
 async def insert_new_user(user_id: str):
-    user = Users.get_user_by_id(user_id)
+    user = await AsyncUsers.get_user_by_id(user_id)
     if user:
         return UserResponse(
             **{
@@ -81,10 +102,14 @@ async def insert_new_user(user_id: str):
 
 
 @router.get(
-    "/{user_id}", response_model=UserResponse, dependencies=[Depends(get_verified_user)]
+    "/{user_id}", response_model=UserResponse, dependencies=[Depends(get_verified_principal)]
 )
-async def get_user_by_id(user_id: str):
-    user = Users.get_user_by_id(user_id)
+async def get_user_by_id(user_id: str, request: Request, response: Response):
+    etag = make_etag(versions.row("user", user_id))
+    if not_modified := conditional(request, response, etag):
+        return not_modified
+
+    user = await AsyncUsers.get_user_by_id(user_id)
     if user:
         return UserResponse(
             **{
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from src.core.env import (
+    SRC_LOG_LEVELS,
+    LAST_ACTIVE_FLUSH_INTERVAL,
+    LAST_ACTIVE_FLUSH_SIZE,
+)
+
+from .user_services import AsyncUsers
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["DB"])
+
+
+class LastActiveBuffer:
+    """
+    Write-behind buffer for `user.last_active_at`.
+
+    `touch` only records the latest timestamp per user in memory; pending
+    timestamps are written with a single bulk UPDATE every `interval` seconds,
+    as soon as `max_size` users are pending, and once more on shutdown.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[dict[str, int]], Awaitable[int]],
+        interval: float,
+        max_size: int,
+    ):
+        self._flush = flush
+        self.interval = interval
+        self.max_size = max_size
+
+        self._pending: dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._flushes: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def touch(self, user_id: str, timestamp: Optional[int] = None) -> None:
+        self._pending[user_id] = timestamp or int(time.time())
+        if len(self._pending) >= self.max_size:
+            task = asyncio.get_running_loop().create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        try:
+            return await self._flush(pending)
+        except asyncio.CancelledError:
+            self._restore(pending)
+            raise
+        except Exception as err:
+            log.warning(f"Could not flush {len(pending)} last active timestamps: {err}")
+            self._restore(pending)
+            return 0
+
+    def _restore(self, pending: dict[str, int]) -> None:
+        # keep them for the next flush unless a newer timestamp arrived
+        for user_id, timestamp in pending.items():
+            self._pending.setdefault(user_id, timestamp)
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except TimeoutError:
+                await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Write everything still pending, after the flushes in progress."""
+        if self._task is not None:
+            # not cancelled: a periodic flush may be halfway through its write
+            self._stopping.set()
+            await self._task
+            self._task = None
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        await self.flush()
+
+
+last_active_buffer = LastActiveBuffer(
+    AsyncUsers.update_users_last_active,
+    LAST_ACTIVE_FLUSH_INTERVAL,
+    LAST_ACTIVE_FLUSH_SIZE,
+)
@@ -1,16 +1,164 @@
+import bisect
+import threading
 import time
-from typing import Optional
-from ormlambda import ORM
-
-from src.core.db import engine
+from typing import Optional, Protocol
+
+from pydantic import TypeAdapter
+
+from src.core.db import (
+    AsyncTable,
+    async_engine,
+    execute,
+    fetch_all,
+    fetch_one,
+    placeholders,
+    transaction,
+)
+from src.core.etag import versions
+from src.core.metrics import instrument
+from src.core.env import (
+    PRINCIPAL_CACHE_SIZE,
+    PRINCIPAL_CACHE_TTL,
+    API_KEY_CACHE_SIZE,
+    API_KEY_CACHE_TTL,
+    STORAGE_BACKEND,
+)
+from src.common.cache import TTLCache
 from src.common.misc import if_error_return
-from ..models import UserModel, User
+from ..models import UserModel
+from ..utils import hash_api_key
+
+
+UserList = TypeAdapter(list[UserModel])
+
+USER_COLUMNS = ", ".join(UserModel.model_fields)
+USER_KEY_COLUMNS = ", ".join(f"u.{column}" for column in UserModel.model_fields)
+
+USER_BY_ID = f"SELECT {USER_COLUMNS} FROM `user` WHERE id = %s LIMIT 1"
+USER_BY_API_KEY_DIGEST = (
+    f"SELECT {USER_KEY_COLUMNS} FROM api_key k JOIN `user` u ON u.id = k.user_id "
+    "WHERE k.id = %s LIMIT 1"
+)
+INSERT_API_KEY = "INSERT INTO api_key (id, user_id, created_at) VALUES (%s, %s, %s)"
+HAS_API_KEY = "SELECT 1 FROM api_key WHERE user_id = %s LIMIT 1"
+
+
+def _user_or_none(row: Optional[dict]) -> Optional[UserModel]:
+    return UserModel.model_validate(row) if row else None
+
+
+def _bulk_last_active_query(last_active: dict[str, int]) -> tuple[str, tuple]:
+    cases = " ".join("WHEN %s THEN %s" for _ in last_active)
+    ids = ", ".join("%s" for _ in last_active)
+    params = (
+        *(value for item in last_active.items() for value in item),
+        *last_active,
+    )
+    return (
+        f"UPDATE `user` SET last_active_at = CASE id {cases} END WHERE id IN ({ids})",
+        params,
+    )
+
+
+# Authenticated users by id. Entries are dropped whenever a write changes what
+# the auth dependencies check (role, api key, existence).
+principal_cache: TTLCache[str, UserModel] = TTLCache(
+    PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL
+)
+
+# Authenticated users by API key digest, so steady-state `sk-` requests never
+# reach the database.
+api_key_cache: TTLCache[str, UserModel] = TTLCache(
+    API_KEY_CACHE_SIZE, API_KEY_CACHE_TTL
+)
+
+
+def _drop_principals(ids: Optional[tuple[str, ...]]) -> None:
+    if ids is None:
+        principal_cache.clear()
+        api_key_cache.clear()
+        return
+    for id in ids:
+        principal_cache.pop(id)
+    if ids:
+        api_key_cache.pop_where(lambda user: user.id in ids)
+
+
+# bumps of user rows come from this worker or, through the bus, from the others
+versions.watch("user", _drop_principals)
+
+
+def invalidate_principal(id: str) -> None:
+    # every write to a user row lands here, after it is committed
+    versions.bump("user", id)
+
+
+def _new_user(
+    id: str,
+    name: str,
+    email: str,
+    profile_image_url: str,
+    role: str,
+    oauth_sub: Optional[str],
+) -> UserModel:
+    now = int(time.time())
+    return UserModel(
+        **{
+            "id": id,
+            "name": name,
+            "email": email,
+            "role": role,
+            "profile_image_url": profile_image_url,
+            "last_active_at": now,
+            "created_at": now,
+            "updated_at": now,
+            "oauth_sub": oauth_sub,
+        }
+    )
+
+
+class UsersRepository(Protocol):
+    """Storage behind `Users`, picked by `STORAGE_BACKEND`."""
 
+    def insert_new_user(
+        self,
+        id: str,
+        name: str,
+        email: str,
+        profile_image_url: str = "/user.png",
+        role: str = "pending",
+        oauth_sub: Optional[str] = None,
+    ) -> Optional[UserModel]: ...
 
-class UsersTable:
-    def __init__(self):
-        self.model = ORM(User, engine)
+    def get_user_by_id(self, id: str) -> Optional[UserModel]: ...
+
+    def get_user_by_api_key(self, api_key: str) -> Optional[UserModel]: ...
+
+    def get_user_by_email(self, email: str) -> Optional[UserModel]: ...
+
+    def get_users(
+        self, after: Optional[tuple[int, str]], limit: int
+    ) -> tuple[list[UserModel], Optional[tuple[int, str]]]: ...
+
+    def get_num_users(self) -> Optional[int]: ...
+
+    def get_first_user(self) -> Optional[UserModel]: ...
+
+    def update_user_role_by_id(self, id: str, role: str) -> Optional[UserModel]: ...
+
+    def update_user_last_active_by_id(self, id: str) -> bool: ...
+
+    def update_users_last_active(self, last_active: dict[str, int]) -> int: ...
+
+    def delete_user_by_id(self, id: str) -> bool: ...
+
+    def update_user_api_key_by_id(self, id: str, api_key: str) -> bool: ...
 
+    def has_api_key(self, id: str) -> bool: ...
+
+
+@instrument
+class UsersTable:
     def insert_new_user(
         self,
         id: str,
@@ -20,34 +168,31 @@ class UsersTable:
         role: str = "pending",
         oauth_sub: Optional[str] = None,
     ) -> Optional[UserModel]:
-        user = UserModel(
-            **{
-                "id": id,
-                "name": name,
-                "email": email,
-                "role": role,
-                "profile_image_url": profile_image_url,
-                "last_active_at": int(time.time()),
-                "created_at": int(time.time()),
-                "updated_at": int(time.time()),
-                "oauth_sub": oauth_sub,
-            }
+        user = _new_user(id, name, email, profile_image_url, role, oauth_sub)
+        execute(
+            f"INSERT INTO `user` ({USER_COLUMNS}) "
+            f"VALUES ({placeholders(len(UserModel.model_fields))})",
+            tuple(user.model_dump().values()),
         )
-        result = User(**user.model_dump())
-        self.model.insert(result)
-        return user if result else None
+        return user
 
     @if_error_return(None)
     def get_user_by_id(self, id: str) -> Optional[UserModel]:
-        return self.model.where(lambda x: x.id == id).first(flavour=UserModel)
+        return _user_or_none(fetch_one(USER_BY_ID, (id,)))
 
     @if_error_return(None)
     def get_user_by_api_key(self, api_key: str) -> Optional[UserModel]:
-        return self.model.where(lambda x: x.api_key == api_key).first(flavour=UserModel)
+        return _user_or_none(
+            fetch_one(USER_BY_API_KEY_DIGEST, (hash_api_key(api_key),))
+        )
 
     @if_error_return(None)
     def get_user_by_email(self, email: str) -> Optional[UserModel]:
-        return self.model.where(User.email == email).first(flavour=UserModel)
+        return _user_or_none(
+            fetch_one(
+                f"SELECT {USER_COLUMNS} FROM `user` WHERE email = %s LIMIT 1", (email,)
+            )
+        )
 
     # def get_user_by_oauth_sub(self, sub: str) -> Optional[UserModel]:
     #     try:
@@ -58,16 +203,29 @@ class UsersTable:
     #         return None
 
     def get_users(
-        self, skip: Optional[int] = None, limit: Optional[int] = None
-    ) -> list[UserModel]:
-        query = self.model.order(lambda x: x.created_at, order_type="DESC")
-
-        query.offset(skip) if skip else None
-        query.limit(limit) if limit else None
-
-        users = query.select()
+        self, after: Optional[tuple[int, str]], limit: int
+    ) -> tuple[list[UserModel], Optional[tuple[int, str]]]:
+        """
+        Keyset page of users, newest first, ordered by `(created_at, id)`.
+
+        `after` is the sort key of the last user of the previous page; the
+        second item returned is the key to pass for the next page, if any.
+        """
+        where, params = "", ()
+        if after is not None:
+            where = "WHERE created_at < %s OR (created_at = %s AND id < %s)"
+            params = (after[0], after[0], after[1])
+
+        rows = fetch_all(
+            f"SELECT {USER_COLUMNS} FROM `user` {where} "
+            "ORDER BY created_at DESC, id DESC LIMIT %s",
+            (*params, limit + 1),
+        )
+        users = UserList.validate_python(rows[:limit])
 
-        return [UserModel.model_validate(user) for user in users]
+        if len(rows) > limit:
+            return users, (users[-1].created_at, users[-1].id)
+        return users, None
 
     # def get_users_by_user_ids(self, user_ids: list[str]) -> list[UserModel]:
     #     with get_db() as db:
@@ -75,12 +233,14 @@ class UsersTable:
     #         return [UserModel.model_validate(user) for user in users]
 
     def get_num_users(self) -> Optional[int]:
-        return self.model.count(execute=True)
+        return fetch_one("SELECT COUNT(*) AS count FROM `user`")["count"]
 
     @if_error_return(None)
     def get_first_user(self) -> UserModel:
-        return self.model.order(lambda x: x.created_at, order_type="DESC").first(
-            flavour=UserModel
+        return _user_or_none(
+            fetch_one(
+                f"SELECT {USER_COLUMNS} FROM `user` ORDER BY created_at DESC LIMIT 1"
+            )
         )
 
     # def get_user_webhook_url_by_id(self, id: str) -> Optional[str]:
@@ -101,9 +261,12 @@ class UsersTable:
 
     @if_error_return(None)
     def update_user_role_by_id(self, id: str, role: str) -> Optional[UserModel]:
-        self.model.where(lambda x: x.id == id).update({"role": role})
-        user = self.model.where(lambda x: x.id == id).first()
-        return UserModel.model_validate(user)
+        cached = principal_cache.get(id)
+        execute("UPDATE `user` SET role = %s WHERE id = %s", (role, id))
+        invalidate_principal(id)
+        if cached is not None:
+            return cached.model_copy(update={"role": role})
+        return self.get_user_by_id(id)
 
     # def update_user_profile_image_url_by_id(
     #     self, id: str, profile_image_url: str
@@ -120,13 +283,16 @@ class UsersTable:
     #     except Exception:
     #         return None
 
-    @if_error_return(None)
-    def update_user_last_active_by_id(self, id: str) -> Optional[UserModel]:
-        self.model.where(lambda x: x.id == id).update(
-            {User.last_active_at: int(time.time())}
+    @if_error_return(False)
+    def update_user_last_active_by_id(self, id: str) -> bool:
+        execute(
+            "UPDATE `user` SET last_active_at = %s WHERE id = %s", (int(time.time()), id)
         )
-        user = self.model.where(User.id == id).first()
-        return UserModel.model_validate(user)
+        return True
+
+    def update_users_last_active(self, last_active: dict[str, int]) -> int:
+        query, params = _bulk_last_active_query(last_active)
+        return execute(query, params).rowcount
 
     # def update_user_oauth_sub_by_id(
     #     self, id: str, oauth_sub: str
@@ -168,16 +334,24 @@ class UsersTable:
 
         #     return True
         # return False
+        invalidate_principal(id)
         return True
 
     @if_error_return(False)
     def update_user_api_key_by_id(self, id: str, api_key: str) -> bool:
-        self.model.where(lambda x: x.id == id).update({User.api_key: api_key})
+        # only the digest is stored, `user.api_key` stays empty
+        with transaction() as cursor:
+            cursor.execute("DELETE FROM api_key WHERE user_id = %s", (id,))
+            if api_key:
+                cursor.execute(
+                    INSERT_API_KEY, (hash_api_key(api_key), id, int(time.time()))
+                )
+        invalidate_principal(id)
         return True
 
-    @if_error_return(None)
-    def get_user_api_key_by_id(self, id: str) -> Optional[str]:
-        return self.model.where(User.id == id).first().api_key
+    @if_error_return(False)
+    def has_api_key(self, id: str) -> bool:
+        return fetch_one(HAS_API_KEY, (id,)) is not None
 
     # def get_valid_user_ids(self, user_ids: list[str]) -> list[str]:
     #     with get_db() as db:
@@ -185,4 +359,165 @@ class UsersTable:
     #         return [user.id for user in users]
 
 
-Users = UsersTable()
+@instrument
+class AsyncUsersTable(AsyncTable[UsersTable]):
+    """Hot `UsersTable` queries served natively by `async_engine`."""
+
+    @if_error_return(None)
+    async def get_user_by_id(self, id: str) -> Optional[UserModel]:
+        return _user_or_none(await async_engine.fetch_one(USER_BY_ID, (id,)))
+
+    @if_error_return(None)
+    async def get_user_by_api_key(self, api_key: str) -> Optional[UserModel]:
+        return _user_or_none(
+            await async_engine.fetch_one(
+                USER_BY_API_KEY_DIGEST, (hash_api_key(api_key),)
+            )
+        )
+
+    @if_error_return(False)
+    async def update_user_last_active_by_id(self, id: str) -> bool:
+        await async_engine.execute(
+            "UPDATE `user` SET last_active_at = %s WHERE id = %s",
+            (int(time.time()), id),
+        )
+        return True
+
+    async def update_users_last_active(self, last_active: dict[str, int]) -> int:
+        query, params = _bulk_last_active_query(last_active)
+        return (await async_engine.execute(query, params)).rowcount
+
+
+@instrument
+class MemoryUsersTable:
+    """
+    `UsersRepository` kept in process memory, indexed by id, email and api key
+    digest.
+
+    Models are never mutated: updates store a copy, so users handed out
+    earlier (and cached by the auth layer) keep their values.
+    """
+
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id: dict[str, UserModel] = {}
+        self._by_email: dict[str, str] = {}
+        # api key digest -> user id, and back
+        self._by_api_key: dict[str, str] = {}
+        self._api_keys: dict[str, str] = {}
+        # `(created_at, id)` of every user in ascending order, for keyset pages
+        self._keys: list[tuple[int, str]] = []
+
+    def _update(self, id: str, **values) -> Optional[UserModel]:
+        with self._lock:
+            user = self._by_id.get(id)
+            if user is None:
+                return None
+            user = self._by_id[id] = user.model_copy(update=values)
+            return user
+
+    def insert_new_user(
+        self,
+        id: str,
+        name: str,
+        email: str,
+        profile_image_url: str = "/user.png",
+        role: str = "pending",
+        oauth_sub: Optional[str] = None,
+    ) -> Optional[UserModel]:
+        user = _new_user(id, name, email, profile_image_url, role, oauth_sub)
+        with self._lock:
+            # the primary key of `user`
+            if id in self._by_id:
+                raise ValueError(f"Duplicate entry '{id}' for key 'user.PRIMARY'")
+            self._by_id[id] = user
+            self._by_email[email] = id
+            bisect.insort(self._keys, (user.created_at, id))
+        return user
+
+    def get_user_by_id(self, id: str) -> Optional[UserModel]:
+        return self._by_id.get(id)
+
+    def get_user_by_api_key(self, api_key: str) -> Optional[UserModel]:
+        id = self._by_api_key.get(hash_api_key(api_key))
+        return self._by_id.get(id) if id is not None else None
+
+    def get_user_by_email(self, email: str) -> Optional[UserModel]:
+        id = self._by_email.get(email)
+        return self._by_id.get(id) if id is not None else None
+
+    def get_users(
+        self, after: Optional[tuple[int, str]], limit: int
+    ) -> tuple[list[UserModel], Optional[tuple[int, str]]]:
+        with self._lock:
+            end = (
+                len(self._keys)
+                if after is None
+                else bisect.bisect_left(self._keys, (after[0], after[1]))
+            )
+            start = max(end - limit, 0)
+            users = [self._by_id[id] for _, id in reversed(self._keys[start:end])]
+
+        if start > 0 and users:
+            return users, (users[-1].created_at, users[-1].id)
+        return users, None
+
+    def get_num_users(self) -> Optional[int]:
+        return len(self._by_id)
+
+    def get_first_user(self) -> Optional[UserModel]:
+        # same order as `UsersTable.get_first_user`
+        with self._lock:
+            return self._by_id[self._keys[-1][1]] if self._keys else None
+
+    def update_user_role_by_id(self, id: str, role: str) -> Optional[UserModel]:
+        user = self._update(id, role=role)
+        invalidate_principal(id)
+        return user
+
+    def update_user_last_active_by_id(self, id: str) -> bool:
+        return self._update(id, last_active_at=int(time.time())) is not None
+
+    def update_users_last_active(self, last_active: dict[str, int]) -> int:
+        return sum(
+            self._update(id, last_active_at=value) is not None
+            for id, value in last_active.items()
+        )
+
+    def delete_user_by_id(self, id: str) -> bool:
+        with self._lock:
+            user = self._by_id.pop(id, None)
+            if user is not None:
+                if self._by_email.get(user.email) == id:
+                    del self._by_email[user.email]
+                if (digest := self._api_keys.pop(id, None)) is not None:
+                    del self._by_api_key[digest]
+                del self._keys[bisect.bisect_left(self._keys, (user.created_at, id))]
+        invalidate_principal(id)
+        return user is not None
+
+    def update_user_api_key_by_id(self, id: str, api_key: str) -> bool:
+        with self._lock:
+            if id not in self._by_id:
+                return False
+            # `api_key.id` is the primary key of the digest table
+            if api_key and self._by_api_key.get(hash_api_key(api_key), id) != id:
+                return False
+            if (digest := self._api_keys.pop(id, None)) is not None:
+                del self._by_api_key[digest]
+            if api_key:
+                digest = self._api_keys[id] = hash_api_key(api_key)
+                self._by_api_key[digest] = id
+        invalidate_principal(id)
+        return True
+
+    def has_api_key(self, id: str) -> bool:
+        return id in self._api_keys
+
+
+Users: UsersRepository = (
+    MemoryUsersTable() if STORAGE_BACKEND == "memory" else UsersTable()
+)
+AsyncUsers = AsyncUsersTable(Users) if async_engine else AsyncTable(Users)
@@ -0,0 +1,6 @@
+import hashlib
+
+
+def hash_api_key(api_key: str) -> str:
+    """Fixed-length digest used to store and look up API keys."""
+    return hashlib.sha256(api_key.encode()).hexdigest()
@@ -1,14 +1,15 @@
+import asyncio
 from contextlib import asynccontextmanager
 import logging
-import time
+import multiprocessing
 from typing import Optional
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from fastapi.middleware.cors import CORSMiddleware
 import sys
 
 from starlette.datastructures import State
-from starlette.middleware.base import RequestResponseEndpoint
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent))
@@ -19,45 +20,56 @@ from src.core.env import (
     BACKEND_AUTH_TRUSTED_NAME_HEADER,
     SRC_LOG_LEVELS,
     API_URI,
+    DB_POOL_WARMUP,
+    DB_AUTO_MIGRATE,
+    STARTUP_PROFILE,
+    ENABLE_METRICS,
+    STORAGE_BACKEND,
+    WEB_CONCURRENCY,
 )
+from src.core.startup import phase, format_report
+from src.core.constants import ERROR_MESSAGES
 from src.core.config import (
     CORS_ALLOW_ORIGIN,
     # Task
     BACKEND_URL,
     ENABLE_SIGNUP,
+    DEFAULT_USER_ROLE,
     ENABLE_LOGIN_FORM,
     ENABLE_API_KEY,
     ENABLE_API_KEY_ENDPOINT_RESTRICTIONS,
     API_KEY_ALLOWED_ENDPOINTS,
     JWT_EXPIRES_IN,
+    JWT_REFRESH_EXPIRES_IN,
+    JWT_EMBED_CLAIMS,
+    JWT_CLAIMS_EXPIRES_IN,
     SHOW_ADMIN_DETAILS,
     ADMIN_EMAIL,
     AppConfig,
 )
-from src.domain.auth.routers import auth
-from src.domain.user.routers import user
-from src.domain.todos.routers import todos
 
-from src.core import engine
-from src.domain.auth.models import Auth
-from src.domain.user.models import User
-from src.domain.todos.models import Todo
-
-from ormlambda import ORM
-
-
-auth_model= ORM(Auth, engine)
-user_model= ORM(User, engine)
-todo_model= ORM(Todo, engine)
-
-if not auth_model.table_exists():
-    auth_model.create_table()
-
-if not user_model.table_exists():
-    user_model.create_table()
-
-if not todo_model.table_exists():
-    todo_model.create_table()
+with phase("main.routers"):
+    from src.domain.auth.routers import auth
+    from src.domain.user.routers import user
+    from src.domain.todos.routers import todos
+
+from src.core.db import (
+    db_executor,
+    async_engine,
+    warm_pool,
+    pool_stats,
+    close_repository,
+)
+from src.core.bus import version_bus
+from src.core.migrate import migrate
+from src.core.pool import PoolTimeoutError
+from src.core.routing import AppRoute
+from src.core.timing import TimingMiddleware
+from src.core.metrics import registry, SharedRegistry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from src.domain.user import principal_cache, api_key_cache, last_active_buffer
+from src.domain.todos import todo_cache
+from src.domain.auth import get_admin_principal
+from src.domain.auth.utils import password_hasher, PasswordHashTimeoutError
 
 
 log = logging.getLogger(__name__)
@@ -67,7 +79,38 @@ log.setLevel(SRC_LOG_LEVELS["MAIN"])
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     log.info("Starts API REST")
+    uses_db = STORAGE_BACKEND == "db"
+    if uses_db and DB_AUTO_MIGRATE:
+        with phase("lifespan.migrate"):
+            await asyncio.to_thread(migrate)
+    if uses_db and DB_POOL_WARMUP:
+        with phase("lifespan.warm_pool"):
+            await warm_pool()
+    last_active_buffer.start()
+    if version_bus:
+        version_bus.start()
+    elif uses_db and (WEB_CONCURRENCY > 1 or multiprocessing.parent_process()):
+        # `uvicorn --workers` spawns its workers without setting WEB_CONCURRENCY
+        log.warning(
+            "Running as one of several workers with an empty CACHE_BUS_DIR: a "
+            "write is seen by the ETags and todo cache of the other workers "
+            "only after ETAG_VERSION_TTL"
+        )
+    if ENABLE_METRICS and isinstance(registry, SharedRegistry):
+        registry.start()
+    if STARTUP_PROFILE:
+        log.info(format_report())
     yield
+    await last_active_buffer.stop()
+    if version_bus:
+        version_bus.stop()
+    if isinstance(registry, SharedRegistry):
+        await registry.stop()
+    if async_engine:
+        await async_engine.close()
+    db_executor.shutdown(wait=True)
+    close_repository()
+    password_hasher.shutdown()
     log.info("Ends API REST")
 
 
@@ -93,6 +136,7 @@ app: FastApiMixIn = FastAPI(
     lifespan=lifespan,
 )
 
+app.router.route_class = AppRoute
 app.state.config = AppConfig()
 
 ########################################
@@ -103,6 +147,7 @@ app.state.config = AppConfig()
 
 app.state.config.BACKEND_URL = BACKEND_URL
 app.state.config.ENABLE_SIGNUP = ENABLE_SIGNUP
+app.state.config.DEFAULT_USER_ROLE = DEFAULT_USER_ROLE
 app.state.config.ENABLE_LOGIN_FORM = ENABLE_LOGIN_FORM
 
 app.state.config.ENABLE_API_KEY = ENABLE_API_KEY
@@ -112,6 +157,9 @@ app.state.config.ENABLE_API_KEY_ENDPOINT_RESTRICTIONS = (
 app.state.config.API_KEY_ALLOWED_ENDPOINTS = API_KEY_ALLOWED_ENDPOINTS
 
 app.state.config.JWT_EXPIRES_IN = JWT_EXPIRES_IN
+app.state.config.JWT_REFRESH_EXPIRES_IN = JWT_REFRESH_EXPIRES_IN
+app.state.config.JWT_EMBED_CLAIMS = JWT_EMBED_CLAIMS
+app.state.config.JWT_CLAIMS_EXPIRES_IN = JWT_CLAIMS_EXPIRES_IN
 
 app.state.config.SHOW_ADMIN_DETAILS = SHOW_ADMIN_DETAILS
 app.state.config.ADMIN_EMAIL = ADMIN_EMAIL
@@ -130,17 +178,121 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Process-Time", "Server-Timing", "ETag"],
+)
+
+
+# outermost, so the reported total includes the other middlewares
+app.add_middleware(TimingMiddleware)
+
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    log.warning(f"{request.method} {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": ERROR_MESSAGES.DB_POOL_TIMEOUT},
+    )
+
+
+@app.exception_handler(PasswordHashTimeoutError)
+async def password_hash_timeout_handler(
+    request: Request, exc: PasswordHashTimeoutError
+):
+    log.warning(f"{request.method} {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": ERROR_MESSAGES.AUTH_BUSY},
+    )
+
+
+@app.get("/health")
+async def healthcheck():
+    return {"status": True}
+
+
+# pool, cache and hasher internals are for admins only
+@app.get("/health/db", dependencies=[Depends(get_admin_principal)])
+async def healthcheck_db():
+    return {"status": True, "pool": pool_stats()}
+
+
+@app.get("/health/cache", dependencies=[Depends(get_admin_principal)])
+async def healthcheck_cache():
+    return {
+        "status": True,
+        "principal": principal_cache.stats(),
+        "api_key": api_key_cache.stats(),
+        "todo": todo_cache.stats(),
+    }
+
+
+@app.get("/health/auth", dependencies=[Depends(get_admin_principal)])
+async def healthcheck_auth():
+    return {"status": True, "password_hasher": password_hasher.stats()}
+
+
+########################################
+#
+# METRICS
+#
+########################################
+
+pool_connections = registry.gauge(
+    "db_pool_connections", "DB pool connections by state.", ("engine", "state")
+)
+pool_waiting = registry.gauge(
+    "db_pool_waiting", "Calls waiting for a DB connection.", ("engine",)
+)
+pool_timeouts = registry.observed_counter(
+    "db_pool_timeouts_total", "Calls that timed out waiting for a connection.", ("engine",)
+)
+hasher_in_flight = registry.gauge(
+    "password_hasher_in_flight", "Password hashing jobs running."
+)
+hasher_waiting = registry.gauge(
+    "password_hasher_waiting", "Password hashing jobs queued for a slot."
+)
+hasher_timeouts = registry.observed_counter(
+    "password_hasher_timeouts_total", "Password hashing jobs that timed out queued."
+)
+cache_size = registry.gauge("cache_size", "Entries held by a cache.", ("cache",))
+cache_hits = registry.observed_counter("cache_hits_total", "Cache hits.", ("cache",))
+cache_misses = registry.observed_counter(
+    "cache_misses_total", "Cache misses.", ("cache",)
 )
 
 
-@app.middleware("http")
-async def measure_request_time(request: Request, call_next: RequestResponseEndpoint):
-    start_time = int(time.time())
-    request.state.enable_api_key = app.state.config.ENABLE_API_KEY
-    response = await call_next(request)
-    process_time = int(time.time()) - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
+@registry.collector
+def collect_stats():
+    for engine, stats in pool_stats().items():
+        pool_connections.set(stats.in_use, engine=engine, state="in_use")
+        pool_connections.set(stats.available, engine=engine, state="available")
+        pool_waiting.set(stats.waiting, engine=engine)
+        pool_timeouts.set(stats.timeouts, engine=engine)
+
+    hasher = password_hasher.stats()
+    hasher_in_flight.set(hasher.in_flight)
+    hasher_waiting.set(hasher.waiting)
+    hasher_timeouts.set(hasher.timeouts)
+
+    caches = {
+        "principal": principal_cache,
+        "api_key": api_key_cache,
+        "todo": todo_cache,
+    }
+    for name, cache in caches.items():
+        stats = cache.stats()
+        cache_size.set(stats.size, cache=name)
+        cache_hits.set(stats.hits, cache=name)
+        cache_misses.set(stats.misses, cache=name)
+
+
+if ENABLE_METRICS:
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(registry.render(), media_type=METRICS_CONTENT_TYPE)
 
 
 app.include_router(todos.router, prefix=f"{API_URI}/todo", tags=["todos"])
@@ -0,0 +1,35 @@
+import os
+
+# read by src.core.env on import: no database, and enough DB workers for the
+# concurrency tests
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("DB_POOL_SIZE", "8")
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+from src.core.env import API_URI  # noqa: E402
+from src.main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def client():
+    # the lifespan shuts the DB executor down: run it once for every test
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url=f"http://test{API_URI}"
+        ) as client:
+            yield client
+
+
+@pytest.fixture
+def override():
+    """Set `app.dependency_overrides` for one test."""
+    yield app.dependency_overrides.__setitem__
+    app.dependency_overrides.clear()
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from src.core import sqlite
+from src.core.etag import versions
+from src.core.migrate import MIGRATIONS
+from src.domain.auth import API_KEY_MASK, Auths, create_access_token
+from src.domain.user import Users, api_key_cache
+from src.domain.user.utils import hash_api_key
+
+pytestmark = pytest.mark.anyio
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def test_api_key_is_stored_as_digest(client):
+    user = Auths.insert_new_auth("keys@localhost", "x", "keys", role="users")
+    session = bearer(create_access_token({"id": user.id}))
+
+    response = await client.post("/auth/api_key", headers=session)
+    assert response.status_code == 200
+    api_key = response.json()["api_key"]
+
+    assert Users.get_user_by_id(user.id).api_key is None
+    # the key itself is never shown again
+    response = await client.get("/auth/api_key", headers=bearer(api_key))
+    assert response.status_code == 200
+    assert response.json() == {"api_key": API_KEY_MASK}
+
+    assert (await client.delete("/auth/api_key", headers=session)).json() is True
+    response = await client.get("/auth/api_key", headers=bearer(api_key))
+    assert response.status_code == 401
+
+
+def test_user_write_drops_cached_api_key_principal():
+    user = Auths.insert_new_auth("cached-key@localhost", "x", "cached", role="users")
+    digest = hash_api_key("sk-cached")
+    api_key_cache.set(digest, user)
+
+    # what a bump received from another worker does
+    versions.adopt("user", (user.id,), f"w{time.monotonic_ns():x}.peer.1")
+    assert api_key_cache.get(digest) is None
+
+
+def test_migration_moves_api_keys_to_digests(tmp_path):
+    cnx = sqlite.connect(str(tmp_path / "app.db"), 1)
+    cursor = cnx.cursor()
+    # the columns of `user` the migration reads, as migration 1 left them
+    cursor.execute("CREATE TABLE `user` (id CHAR(36), api_key VARCHAR(40) UNIQUE)")
+    cursor.execute(
+        "INSERT INTO `user` (id, api_key) VALUES (%s, %s)", ("u1", "sk-plain")
+    )
+    for migration in MIGRATIONS:
+        if migration.name in ("create api_key table", "move api keys to digests"):
+            migration.apply(cursor)
+
+    cursor.execute("SELECT api_key FROM `user`")
+    assert cursor.fetchall() == [(None,)]
+    cursor.execute("SELECT id, user_id FROM api_key")
+    assert cursor.fetchall() == [(hash_api_key("sk-plain"), "u1")]
+    cnx.close()
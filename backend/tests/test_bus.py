@@ -0,0 +1,48 @@
+import time
+
+from src.core.bus import VersionBus
+from src.core.etag import VersionTracker
+
+
+def bus(directory, name: str) -> VersionBus:
+    worker = VersionBus(str(directory), VersionTracker(100))
+    # one process plays every worker
+    worker._path = directory / f"{name}.sock"
+    worker.start()
+    return worker
+
+
+def eventually(check) -> None:
+    deadline = time.monotonic() + 2
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_worker_started_later_gets_the_bumps(tmp_path):
+    a = bus(tmp_path, "a")
+    b = bus(tmp_path, "b")
+    try:
+        eventually(lambda: a._peers == (b._path,))
+        a._tracker.bump("todo", 1)
+        written = a._tracker._versions.get(("todo", 1))
+        # reading through `row` would make b a version of its own
+        eventually(lambda: b._tracker._versions.get(("todo", 1)) == written)
+    finally:
+        a.stop()
+        b.stop()
+
+
+def test_exited_worker_is_dropped_from_the_peers(tmp_path):
+    a = bus(tmp_path, "a")
+    b = bus(tmp_path, "b")
+    eventually(lambda: a._peers == (b._path,))
+    b.stop()
+    # what a crashed worker leaves behind
+    b._path.touch()
+    try:
+        a._tracker.bump("todo", 1)
+        assert a._peers == ()
+        assert not b._path.exists()
+    finally:
+        a.stop()
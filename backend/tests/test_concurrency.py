@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+import pytest
+
+from src.core.db import AsyncTable, db_gate
+from src.domain.auth import get_verified_principal
+from src.domain.todos.routers import todos as todos_router
+
+# seconds each call blocks its thread, like a slow MySQL round trip
+DELAY = 0.2
+
+pytestmark = pytest.mark.anyio
+
+
+class SlowTodoTable:
+    def get_todos(self, after, limit):
+        time.sleep(DELAY)
+        return [], None
+
+    def get_all_todos(self):
+        time.sleep(DELAY)
+        return []
+
+
+async def test_todo_listings_overlap(client, override, monkeypatch):
+    monkeypatch.setattr(todos_router, "AsyncTodos", AsyncTable(SlowTodoTable()))
+    override(get_verified_principal, lambda: None)
+
+    concurrency = db_gate.capacity
+    start = time.perf_counter()
+    responses = await asyncio.gather(
+        *(client.get("/todo/", params={"limit": 10}) for _ in range(concurrency))
+    )
+    elapsed = time.perf_counter() - start
+
+    assert [response.status_code for response in responses] == [200] * concurrency
+    # one after the other they would take `concurrency * DELAY`
+    assert concurrency > 2
+    assert elapsed < 2 * DELAY
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.core import db
+
+
+class InsertCursor:
+    """What a cursor holds after a multi-row INSERT."""
+
+    def __init__(self, lastrowid: int, step: int):
+        self.lastrowid = lastrowid
+        self.step = step
+
+    def execute(self, query, params=()):
+        assert query == "SELECT @@auto_increment_increment"
+
+    def fetchone(self):
+        return (self.step,)
+
+
+@pytest.mark.parametrize(
+    "name, lastrowid, step, ids",
+    [
+        ("mysql", 11, 1, [11, 12, 13]),
+        # auto_increment_increment = 2, e.g. one of two replication sources
+        ("mysql", 11, 2, [11, 13, 15]),
+        ("sqlite", 13, 1, [11, 12, 13]),
+    ],
+)
+def test_inserted_ids(monkeypatch, name, lastrowid, step, ids):
+    monkeypatch.setattr(db, "dialect", db.DIALECTS[name])
+    assert db.inserted_ids(InsertCursor(lastrowid, step), 3) == ids
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("mysql+aiomysql://u:p@db:3306/todo", "mysql://u:p@db:3306/todo?pool_size=4"),
+        # the connections `db_gate` admits queries for, whatever the URL says
+        (
+            "mysql://u:p@db/todo?charset=utf8mb4&pool_size=9",
+            "mysql://u:p@db/todo?charset=utf8mb4&pool_size=4",
+        ),
+    ],
+)
+def test_sync_database_url_sizes_the_pool(url, expected):
+    assert db._sync_database_url(url, 4) == expected
+
+
+class PooledConnection:
+    def __init__(self):
+        self.reconnects = 0
+
+    def reconnect(self):
+        self.reconnects += 1
+
+
+def test_old_connection_is_reopened(monkeypatch):
+    cnx = PooledConnection()
+    now = [1000.0]
+    monkeypatch.setattr(db, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    db._recycle(cnx)
+    now[0] += db.DB_POOL_RECYCLE
+    db._recycle(cnx)
+    assert cnx.reconnects == 0
+
+    now[0] += 1
+    db._recycle(cnx)
+    db._recycle(cnx)
+    assert cnx.reconnects == 1
@@ -0,0 +1,48 @@
+import pytest
+
+from src.common.misc import if_error_return
+from src.core.pool import PoolTimeoutError
+
+
+@if_error_return(None)
+async def saturated():
+    raise PoolTimeoutError("no connection")
+
+
+@if_error_return(None)
+async def failing():
+    raise RuntimeError("query failed")
+
+
+@pytest.mark.anyio
+async def test_if_error_return_lets_pool_timeouts_through():
+    assert await failing() is None
+    with pytest.raises(PoolTimeoutError):
+        await saturated()
+
+
+class SaturatedUsers:
+    async def get_user_by_id(self, id: str):
+        raise PoolTimeoutError("no connection")
+
+
+@pytest.mark.anyio
+async def test_signin_reports_pool_timeouts(monkeypatch):
+    from src.domain.auth.services import auth_service
+
+    auths = auth_service.AsyncAuths
+
+    async def get_active_auth_by_email(email):
+        return auth_service.AuthModel(
+            id="saturated", email=email, password="hash", active=True
+        )
+
+    async def verify_password_async(password, hashed):
+        return True
+
+    monkeypatch.setattr(auths, "get_active_auth_by_email", get_active_auth_by_email)
+    monkeypatch.setattr(auth_service, "verify_password_async", verify_password_async)
+    monkeypatch.setattr(auth_service, "AsyncUsers", SaturatedUsers())
+
+    with pytest.raises(PoolTimeoutError):
+        await auths.authenticate_user("saturated@localhost", "password")
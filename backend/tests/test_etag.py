@@ -0,0 +1,59 @@
+from src.core.etag import VersionTracker
+
+
+def workers(count: int) -> list[VersionTracker]:
+    """Trackers sending each other their bumps, like workers on the bus."""
+    trackers = [VersionTracker(100) for _ in range(count)]
+    for tracker in trackers:
+        others = [other for other in trackers if other is not tracker]
+        tracker.on_bump = lambda table, keys, version, others=others: [
+            other.adopt(table, keys, version) for other in others
+        ]
+    return trackers
+
+
+def test_written_resources_have_the_same_version_everywhere():
+    a, b = workers(2)
+    before = a.row("todo", 1)
+    assert before != b.row("todo", 1)
+
+    a.bump("todo", 1)
+    assert a.row("todo", 1) == b.row("todo", 1) != before
+    assert a.table("todo") == b.table("todo")
+
+
+def test_late_bump_does_not_replace_a_newer_version():
+    a, b = VersionTracker(100), VersionTracker(100)
+    sent = []
+    a.on_bump = lambda *bump: sent.append(bump)
+    a.bump("todo", 1)
+    # b writes the same row before a's bump reaches it
+    b.bump("todo", 1)
+    newer = b.row("todo", 1)
+
+    b.adopt(*sent[0])
+    assert b.row("todo", 1) == newer
+
+
+def test_bump_replaces_a_version_read_after_the_write():
+    a, b = VersionTracker(100), VersionTracker(100)
+    sent = []
+    a.on_bump = lambda *bump: sent.append(bump)
+    a.bump("todo", 1)
+    # b serves a read before a's bump reaches it
+    b.row("todo", 1)
+
+    b.adopt(*sent[0])
+    assert b.row("todo", 1) == a.row("todo", 1)
+    assert b.table("todo") == a.table("todo")
+
+
+def test_reset_forgets_every_version():
+    tracker = VersionTracker(100)
+    dropped = []
+    tracker.watch("user", dropped.append)
+    before = tracker.row("user", "id")
+
+    tracker.reset()
+    assert tracker.row("user", "id") != before
+    assert dropped == [None]
@@ -0,0 +1,31 @@
+import pytest
+
+from src.domain.auth import Auths, create_access_token, get_admin_principal
+
+pytestmark = pytest.mark.anyio
+
+INTERNALS = ["/health/db", "/health/cache", "/health/auth"]
+
+
+async def test_health_is_public(client):
+    assert (await client.get("http://test/health")).status_code == 200
+
+
+@pytest.mark.parametrize("path", INTERNALS)
+async def test_internals_need_an_admin(client, path):
+    # no credentials at all are refused by the bearer scheme
+    assert (await client.get(f"http://test{path}")).status_code == 403
+
+    email = f"{path.rsplit('/', 1)[-1]}-health@localhost"
+    user = Auths.insert_new_auth(email, "x", "health", role="users")
+    headers = {"Authorization": f"Bearer {create_access_token({'id': user.id})}"}
+    response = await client.get(f"http://test{path}", headers=headers)
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize("path", INTERNALS)
+async def test_internals_are_shown_to_admins(client, override, path):
+    override(get_admin_principal, lambda: None)
+    response = await client.get(f"http://test{path}")
+    assert response.status_code == 200
+    assert response.json()["status"] is True
@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+from src.domain.user.services.last_active import LastActiveBuffer
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_stop_waits_for_the_periodic_flush():
+    written: dict[str, int] = {}
+    writing = asyncio.Event()
+
+    async def slow_write(pending: dict[str, int]) -> int:
+        writing.set()
+        await asyncio.sleep(0.05)
+        written.update(pending)
+        return len(pending)
+
+    buffer = LastActiveBuffer(slow_write, interval=0.01, max_size=100)
+    buffer.start()
+    buffer.touch("a", 1)
+    await writing.wait()
+    # arrives while the periodic flush holds the first batch
+    buffer.touch("b", 2)
+    await buffer.stop()
+
+    assert written == {"a": 1, "b": 2}
+    assert len(buffer) == 0
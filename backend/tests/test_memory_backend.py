@@ -0,0 +1,119 @@
+import pytest
+
+from src.domain.auth import Auths, get_password_hash
+from src.domain.todos import Todos
+from src.domain.user import Users
+from src.main import app
+
+pytestmark = pytest.mark.anyio
+
+PASSWORD = "memory-password"
+
+
+@pytest.fixture
+def signup_enabled():
+    config = app.state.config
+    enabled = config.ENABLE_SIGNUP
+    config.ENABLE_SIGNUP = True
+    yield
+    config.ENABLE_SIGNUP = enabled
+
+
+@pytest.fixture
+async def session(client) -> dict:
+    user = Auths.insert_new_auth(
+        "todos@localhost", get_password_hash(PASSWORD), "todos", role="users"
+    )
+    response = await client.post(
+        "/auth/signin", json={"email": user.email, "password": PASSWORD}
+    )
+    yield {"Authorization": f"Bearer {response.json()['token']}"}
+    Auths.delete_auth_by_id(user.id)
+
+
+async def test_signup_then_signin(client, signup_enabled):
+    form = {"name": "new", "email": "New@localhost", "password": PASSWORD}
+    response = await client.post("/auth/signup", json=form)
+    assert response.status_code == 200, response.text
+    assert response.json()["email"] == "new@localhost"
+
+    # the first user to sign up turns signup off
+    app.state.config.ENABLE_SIGNUP = True
+    assert (await client.post("/auth/signup", json=form)).status_code == 400
+    response = await client.post(
+        "/auth/signin", json={"email": "new@localhost", "password": PASSWORD}
+    )
+    assert response.status_code == 200
+    assert response.json()["token"]
+
+    response = await client.post(
+        "/auth/signin", json={"email": "new@localhost", "password": "wrong"}
+    )
+    assert response.status_code == 400
+
+
+def test_duplicates_are_rejected():
+    user = Auths.insert_new_auth("twice@localhost", "x", "twice", role="users")
+    with pytest.raises(ValueError):
+        Auths.insert_new_auth("twice@localhost", "x", "twice", role="users")
+    with pytest.raises(ValueError):
+        Users.insert_new_user(user.id, "twice", "other@localhost")
+
+    other = Auths.insert_new_auth("other@localhost", "x", "other", role="users")
+    assert Auths.update_email_by_id(other.id, "twice@localhost") is False
+    assert Auths.get_active_auth_by_email("twice@localhost").id == user.id
+
+
+def test_delete_unknown_auth():
+    user = Auths.insert_new_auth("deleted@localhost", "x", "deleted", role="users")
+    assert Auths.delete_auth_by_id(user.id) is True
+    assert Auths.delete_auth_by_id(user.id) is False
+    assert Auths.delete_auth_by_id("no-such-id") is False
+
+
+async def test_todo_crud(client, session):
+    response = await client.post("/todo/", json={"item": "write"}, headers=session)
+    assert response.status_code == 200
+    todo = response.json()
+
+    response = await client.get(f"/todo/{todo['id']}", headers=session)
+    assert response.json() == todo
+
+    response = await client.patch(
+        f"/todo/{todo['id']}", json={"item": "rewrite"}, headers=session
+    )
+    assert response.json() == {"id": todo["id"], "item": "rewrite"}
+    response = await client.get(f"/todo/{todo['id']}", headers=session)
+    assert response.json()["item"] == "rewrite"
+
+    response = await client.delete(f"/todo/{todo['id']}", headers=session)
+    assert response.json() is True
+    assert Todos.get_todo_by_id(todo["id"]) is None
+
+
+async def test_todo_pages_follow_the_cursor(client, session):
+    items = [{"item": f"page {i}"} for i in range(5)]
+    response = await client.post("/todo/batch", json={"items": items}, headers=session)
+    ids = [result["id"] for result in response.json()]
+
+    seen, params = [], {"limit": 2}
+    while True:
+        response = await client.get("/todo/", params=params, headers=session)
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        seen += [todo["id"] for todo in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert seen == sorted(seen)
+    assert set(ids) <= set(seen)
+
+
+async def test_missing_todo_is_not_found(client, session):
+    response = await client.get("/todo/999999", headers=session)
+    assert response.status_code == 404
+    response = await client.patch(
+        "/todo/999999", json={"item": "gone"}, headers=session
+    )
+    assert response.status_code == 404
@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+
+from src.common.misc import if_error_return
+from src.core.metrics import SharedRegistry, instrument, service_errors
+
+
+@instrument
+class FailingTable:
+    @if_error_return(None)
+    def get(self):
+        raise RuntimeError("connection lost")
+
+
+def test_errors_turned_into_a_default_are_counted():
+    def errors() -> float:
+        samples = service_errors.snapshot()["samples"]
+        key = ["FailingTable", "get"]
+        return sum(value for _, _, values, value in samples if values == key)
+
+    before = errors()
+    assert FailingTable().get() is None
+    assert errors() == before + 1
+
+
+def test_shared_registry_sums_the_workers(tmp_path):
+    registry = SharedRegistry(str(tmp_path), 5)
+    requests = registry.counter("requests_total", "Requests.", ("route",))
+    pool = registry.gauge("pool_connections", "Connections.")
+    requests.inc(2, route="/todo/")
+    pool.set(3)
+
+    # a worker that is still running, and one that exited
+    exited = _exited_pid()
+    for pid, count in ((os.getppid(), 5), (exited, 7)):
+        other = SharedRegistry(str(tmp_path), 5)
+        other.counter("requests_total", "Requests.", ("route",)).inc(
+            count, route="/todo/"
+        )
+        other.gauge("pool_connections", "Connections.").set(1)
+        (tmp_path / f"{pid}.json").write_text(json.dumps(other.snapshot()))
+
+    lines = registry.render().splitlines()
+    assert 'requests_total{route="/todo/"} 14.0' in lines
+    assert f'pool_connections{{worker="{os.getpid()}"}} 3.0' in lines
+    assert f'pool_connections{{worker="{os.getppid()}"}} 1.0' in lines
+    assert not any(f'worker="{exited}"' in line for line in lines)
+
+
+def _exited_pid() -> int:
+    process = subprocess.Popen(["true"])
+    process.wait()
+    return process.pid
@@ -0,0 +1,33 @@
+import pytest
+
+from src.common.pagination import encode_cursor
+from src.domain.auth import Auths, get_admin_principal
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize(
+    "values",
+    [["1", "id"], [1, 2], [True, "id"], [None, "id"], [1]],
+)
+async def test_user_cursor_of_wrong_types_is_rejected(client, override, values):
+    override(get_admin_principal, lambda: None)
+    response = await client.get("/user/", params={"cursor": encode_cursor(values)})
+    assert response.status_code == 400
+
+
+async def test_user_pages_follow_the_cursor(client, override):
+    override(get_admin_principal, lambda: None)
+    for i in range(5):
+        Auths.insert_new_auth(f"page-{i}@localhost", "x", f"page-{i}", role="users")
+
+    seen, params = [], {"limit": 2}
+    while True:
+        response = await client.get("/user/", params=params)
+        assert response.status_code == 200
+        seen += [user["id"] for user in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert len(seen) == len(set(seen)) >= 5
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from src.domain.auth.services import auth_service
+from src.domain.user import UserModel, invalidate_principal, principal_cache
+
+pytestmark = pytest.mark.anyio
+
+
+class StalledUsers:
+    """Returns the row read before `release` is set, like a slow query."""
+
+    def __init__(self, user: UserModel):
+        self.user = user
+        self.reading = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def get_user_by_id(self, id: str) -> UserModel:
+        self.reading.set()
+        await self.release.wait()
+        return self.user
+
+
+def make_user(id: str, role: str) -> UserModel:
+    return UserModel(
+        id=id,
+        name=id,
+        email=f"{id}@localhost",
+        role=role,
+        profile_image_url="",
+        last_active_at=0,
+        updated_at=0,
+        created_at=0,
+    )
+
+
+async def test_write_during_fetch_is_not_cached(monkeypatch):
+    users = StalledUsers(make_user("stale-fill", "admin"))
+    monkeypatch.setattr(auth_service, "AsyncUsers", users)
+
+    fetch = asyncio.create_task(auth_service.get_cached_user("stale-fill"))
+    await users.reading.wait()
+    # the user is demoted while the pre-change row is in flight
+    invalidate_principal("stale-fill")
+    users.release.set()
+
+    assert (await fetch).role == "admin"
+    assert principal_cache.get("stale-fill") is None
+
+
+async def test_quiet_fetch_is_cached(monkeypatch):
+    users = StalledUsers(make_user("quiet-fill", "users"))
+    users.release.set()
+    monkeypatch.setattr(auth_service, "AsyncUsers", users)
+
+    await auth_service.get_cached_user("quiet-fill")
+
+    assert principal_cache.get("quiet-fill") == users.user
@@ -35,6 +35,12 @@ type RequestOptions<K extends TodoKeys> = {
 }
 
 
+export interface Page<T> {
+  data: T,
+  nextCursor?: string,
+}
+
+
 export class ApiError extends Error {
   constructor(public status: number, public data: any) {
     const message = Array.isArray(data?.detail)
@@ -76,6 +82,23 @@ export class ApiClient {
     endpointKey: K,
     options?: RequestOptions<K>
   ): Promise<EndpointResponse<K>> {
+    const { data } = await this.send(endpointKey, options)
+    return data
+  }
+
+  // one page of a cursor-paginated listing, and the cursor of the next one
+  async requestPage<K extends TodoKeys>(
+    endpointKey: K,
+    options?: RequestOptions<K>
+  ): Promise<Page<EndpointResponse<K>>> {
+    const { data, headers } = await this.send(endpointKey, options)
+    return { data, nextCursor: headers.get("X-Next-Cursor") ?? undefined }
+  }
+
+  private async send<K extends TodoKeys>(
+    endpointKey: K,
+    options?: RequestOptions<K>
+  ): Promise<{ data: EndpointResponse<K>, headers: Headers }> {
     const endpoint = API_ENDPOINTS[endpointKey]
     const { method, path } = endpoint;
 
@@ -118,7 +141,7 @@ export class ApiClient {
         if (!res.ok) {
           throw new ApiError(res.status, data)
         }
-        return data
+        return { data, headers: res.headers }
       })
       .catch(() => {
         throw new Error("API error")
@@ -143,6 +166,8 @@ export class ApiClient {
 
     const params = new URLSearchParams();
     Object.entries(query).forEach(([key, value]) => {
+      // optional params left out, e.g. no cursor on the first page
+      if (value === undefined) return;
       if (Array.isArray(value)) {
         value.forEach(v => params.append(key, String(v)));
       } else {
@@ -2,6 +2,7 @@ import { useEffect, useState, createContext, useCallback } from 'react'
 import { Container, Stack } from '@chakra-ui/react'
 
 import { apiClient } from '../api/apiClient'
+import { getAllTodos } from '../services/todos'
 import { Todo } from '../types/todo'
 import { UserResponse } from '../types/user'
 
@@ -21,7 +22,7 @@ export default function Todos() {
   const [user, setUser] = useState<UserResponse>()
 
   const fetchTodos = async () => {
-    const todos = await apiClient.request('todoGetAll')
+    const todos = await getAllTodos()
     console.log(todos)
     setTodos(todos)
   }
@@ -1,8 +1,17 @@
 
 import { apiClient } from "api/apiClient";
+import { Todo } from "types/todo";
 
+// the listing is paginated: follow X-Next-Cursor up to the last page
 export const getAllTodos = async () => {
-    return await apiClient.request("todoGetAll")
+    const todos: Todo[] = []
+    let cursor: string | undefined
+    do {
+        const page = await apiClient.requestPage("todoGetAll", { body: { cursor } })
+        todos.push(...page.data)
+        cursor = page.nextCursor
+    } while (cursor)
+    return todos
 }
 
 export const getTodo = async (todo_id: number) => {
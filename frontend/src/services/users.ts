@@ -0,0 +1,5 @@
+import { apiClient } from "api/apiClient";
+
+export const getUsers = async (cursor?: string, limit?: number) => {
+    return await apiClient.requestPage("userGetUsers", { body: { cursor, limit } })
+}
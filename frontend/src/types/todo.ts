@@ -12,7 +12,8 @@ export const TODO_ENDPOINTS = {
     method: "GET",
     path: "/todo/",
     responseType: {} as Todo[],
-    requestType: null
+    // sent as the query string; `cursor` is the X-Next-Cursor of the previous page
+    requestType: {} as { cursor?: string, limit?: number },
   },
   todoCreate: {
     method: "POST",
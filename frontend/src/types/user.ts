@@ -36,7 +36,8 @@ export const USER_ENDPOINTS = {
         method: "GET",
         path: "/user",
         responseType: {} as UserModel[],
-        paramType: {} as { skip: number, limit: number }
+        // sent as the query string; `cursor` is the X-Next-Cursor of the previous page
+        requestType: {} as { cursor?: string, limit?: number }
     },
     userUpdateUserRole: {
         method: "POST",